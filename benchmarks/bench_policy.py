@@ -0,0 +1,101 @@
+"""
+Micro-benchmark of the cleanup policy (see files/policy.py).
+
+Compiles the bundled policy, then the bundled policy plus a few rules using
+every kind of static predicate, and times the evaluation of synthetic EC2
+instances against the rules of ec2-stop. Exits with status 1 when the
+evaluation with the extra rules takes longer than the budget.
+
+Usage:
+    python benchmarks/bench_policy.py --resources 100000 --budget-ms 500
+"""
+
+import argparse
+import os
+import random
+import sys
+import time
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(BENCHMARKS_DIR, '..', 'files'))
+
+import policy  # noqa: E402
+
+
+# Rules added to the bundled policy, none of them calling AWS
+EXTRA_RULES = [
+    {'name': 'named-keepers', 'services': ['ec2-stop'], 'match': {'name_regex': r'^(prod|shared)-.*-\d+$'}},
+    {'name': 'owned', 'services': ['ec2-stop'], 'match': {'tags': {'Owner': '*', 'Environment': 'production'}}},
+    {'name': 'managed', 'services': ['ec2-stop'], 'match': {'tag_key_prefix': ['aws:autoscaling:', 'karpenter.sh/']}},
+    {'name': 'recent', 'services': ['ec2-stop'], 'match': {'newer_than_days': 1}},
+    {'name': 'ci-runners', 'services': ['ec2-stop'], 'match': {'name_prefix': ['ci-', 'runner-'], 'older_than_days': 7},
+     'action': 'notify'},
+]
+
+
+def synthetic_instances(count, seed=0):
+    """
+    :return: List of PolicyResource shaped like the EC2 instances of the snapshot.
+    """
+    rng = random.Random(seed)
+    now = time.time()
+    prefixes = ['web', 'ci', 'prod-api', 'shared-db', 'batch', 'runner']
+    resources = []
+    for index in range(count):
+        name = f'{rng.choice(prefixes)}-{rng.choice(["a", "b"])}-{index}'
+        tags = {'Name': name}
+        if rng.random() < 0.3:
+            tags['Owner'] = 'team'
+        if rng.random() < 0.2:
+            tags['Environment'] = rng.choice(['production', 'staging'])
+        if rng.random() < 0.1:
+            tags['aws:autoscaling:groupName'] = 'asg'
+        resources.append(policy.PolicyResource(
+            f'i-{index:017x}', name, tags,
+            {'state': 'running', 'lifecycle': 'spot' if rng.random() < 0.1 else 'on-demand', 'monitoring': 'disabled'},
+            now - rng.uniform(0, 30 * 24 * 3600)))
+    return resources
+
+
+def time_policy(rules, resources, repeat):
+    """
+    :return: Tuple of (compiled policy, best evaluation time in ms, decision counts).
+    """
+    compiled = policy.CompiledPolicy(rules, policy.CLEANUP_SERVICES)
+    best = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        decisions = compiled.evaluate('ec2-stop', 'us-east-1', resources)
+        elapsed = (time.perf_counter() - started) * 1000
+        best = elapsed if best is None else min(best, elapsed)
+    counts = {}
+    for _, rule in decisions:
+        name = rule.name if rule else 'selected'
+        counts[name] = counts.get(name, 0) + 1
+    return compiled, best, counts
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--resources', type=int, default=100000, help='Number of resources to evaluate')
+    parser.add_argument('--budget-ms', type=float, default=500, help='Maximum evaluation time with the extra rules')
+    parser.add_argument('--repeat', type=int, default=5, help='Evaluations timed, the best one is reported')
+    args = parser.parse_args()
+
+    resources = synthetic_instances(args.resources)
+    best = None
+    for label, rules in [('bundled policy', policy.load_policy_rules()),
+                         ('bundled policy and extra rules', policy.load_policy_rules() + EXTRA_RULES)]:
+        compiled, best, counts = time_policy(rules, resources, args.repeat)
+        print(f'{label}: {len(compiled.rules["ec2-stop"])} ec2-stop rules, {args.resources} resources evaluated '
+              f'in {best:.1f}ms ({best * 1000 / args.resources:.2f}us per resource)')
+        for name, count in sorted(counts.items()):
+            print(f'  {name}: {count}')
+    if best > args.budget_ms:
+        print(f'[ERROR]: Over the budget of {args.budget_ms:.0f}ms')
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,680 @@
+"""
+In-process stand-in for the AWS APIs used by the cleaners.
+
+The fake is attached to every client through a client hook (see clients.py),
+at the botocore 'before-send' stage: requests never leave the process, but
+everything above the HTTP layer (parameter validation, paginators, retries and
+the throttling controller) runs as in production. Each response is a parsed
+dict injected at 'before-parse', so there is no XML/JSON to serialize.
+
+The fake can add a fixed latency to every request and enforce a per-operation
+request rate, answering with throttling errors above it; a throttled request
+changes nothing. Calls on unknown resources are answered with the error codes
+AWS uses (e.g. InvalidVolume.NotFound). aiobotocore clients
+(see async_scan.py) are answered too, waiting out the latency without
+blocking their event loop.
+"""
+
+import asyncio
+import contextvars
+import inspect
+import itertools
+import random
+import threading
+import time
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+
+from botocore.awsrequest import AWSResponse
+from botocore.session import get_session as get_botocore_session
+
+
+FAKE_ACCOUNT = '123456789012'
+
+# Error codes answered when the rate limit is exceeded
+THROTTLE_ERRORS = {
+    'ec2': 'RequestLimitExceeded',
+    'elb': 'Throttling',
+    'elbv2': 'Throttling',
+    'rds': 'Throttling',
+}
+DEFAULT_THROTTLE_ERROR = 'ThrottlingException'
+
+INSTANCE_STATES = ['running', 'running', 'running', 'stopped', 'pending']
+
+
+class FakeError(Exception):
+    """Error answered to an API call, as AWS would."""
+
+    def __init__(self, code, message):
+        super().__init__(message)
+        self.code = code
+        self.message = message
+
+
+class RawBody:
+    """Minimal urllib3-like body for AWSResponse."""
+
+    def __init__(self, body):
+        self.body = body
+
+    def stream(self, **kwargs):
+        yield self.body
+
+    async def read(self):
+        # aiobotocore reads the whole body at once
+        return self.body
+
+
+class RateLimiter:
+    """Server-side token bucket of one operation."""
+
+    def __init__(self, rate):
+        self.rate = rate
+        self.tokens = rate
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def allow(self):
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.rate, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return True
+            return False
+
+
+class FakeRegion:
+    """Resources of one region of one account."""
+
+    def __init__(self, account, region):
+        self.account = account
+        self.region = region
+        self.lock = threading.Lock()
+        self.instances = {}
+        self.volumes = {}
+        self.addresses = {}
+        self.load_balancers = {}
+        self.v2_load_balancers = {}
+        self.target_groups = {}
+        self.listeners = {}
+        self.rules = {}
+        self.db_clusters = {}
+        self.db_instances = {}
+        self.eks_clusters = {}
+        self.streams = {}
+        self.msk_clusters = {}
+        self.domains = {}
+        self.tags = {}
+        # IDs of the instances AWS Config knows nothing of
+        self.config_unknown = set()
+
+    def arn(self, service, resource):
+        return f'arn:aws:{service}:{self.region}:{self.account}:{resource}'
+
+
+class FakeAWS:
+    """
+    Synthetic accounts answering the API calls of the cleaners.
+
+    :param regions: List of region names.
+    :param accounts: List of account IDs.
+    :param latency: Seconds added to every request.
+    :param rate_limit: Maximum requests per second of an operation (per account and region), None for no limit.
+    :param seed: Seed of the random generator, so runs are reproducible.
+    """
+
+    def __init__(self, regions, accounts=(FAKE_ACCOUNT,), latency=0.0, rate_limit=None, seed=0):
+        self.regions = list(regions)
+        self.accounts = list(accounts)
+        self.latency = latency
+        self.rate_limit = rate_limit
+        self.random = random.Random(seed)
+        self.ids = itertools.count(1)
+        self.data = {(account, region): FakeRegion(account, region)
+                     for account in self.accounts for region in self.regions}
+        self.paginators = {}
+        self.cursors = {}
+        self.limiters = {}
+        self.lock = threading.Lock()
+        # Operation and parameters of the call being answered, and its result, per thread and per asyncio task
+        self.current_call = contextvars.ContextVar('current_call')
+        self.current_result = contextvars.ContextVar('current_result')
+        self.calls = Counter()
+        self.throttled = Counter()
+        self.unhandled = Counter()
+
+    # Synthetic data
+
+    def new_id(self, prefix):
+        return f'{prefix}-{next(self.ids):017x}'
+
+    def spread(self, total):
+        """
+        :param total: Number of resources in an account.
+        :return: Number of resources of each region, the first regions holding more.
+        """
+        weights = [1 / (index + 1) for index in range(len(self.regions))]
+        counts = [int(total * weight / sum(weights)) for weight in weights]
+        counts[0] += total - sum(counts)
+        return dict(zip(self.regions, counts))
+
+    def populate(self, instances=0, volumes=0, addresses=0, load_balancers=0, db_instances=0, db_clusters=0,
+                 eks_clusters=0, streams=0, msk_clusters=0, domains=0, v2_load_balancers=0, keep_ratio=0.05):
+        """
+        Create the same number of resources in every account, spread unevenly across regions.
+
+        :param keep_ratio: Share of the resources carrying the keep tag.
+        :return: None
+        """
+        counts = {name: self.spread(total) for name, total in [
+            ('instances', instances), ('volumes', volumes), ('addresses', addresses),
+            ('load_balancers', load_balancers), ('db_instances', db_instances), ('db_clusters', db_clusters),
+            ('eks_clusters', eks_clusters), ('streams', streams), ('msk_clusters', msk_clusters),
+            ('domains', domains), ('v2_load_balancers', v2_load_balancers)]}
+        created = datetime(2024, 1, 1, tzinfo=timezone.utc)
+
+        for (account, region), data in self.data.items():
+            def keep(arn):
+                if self.random.random() < keep_ratio:
+                    data.tags[arn] = {'auto-deletion': 'skip-resource'}
+
+            for _ in range(counts['instances'][region]):
+                instance_id = self.new_id('i')
+                data.instances[instance_id] = {
+                    'InstanceId': instance_id,
+                    'State': {'Name': self.random.choice(INSTANCE_STATES)},
+                    'Monitoring': {'State': self.random.choice(['enabled', 'disabled'])},
+                    'LaunchTime': created,
+                    'Tags': [{'Key': 'Name', 'Value': f'bench-{instance_id}'}],
+                }
+                if self.random.random() < 0.1:
+                    data.instances[instance_id]['InstanceLifecycle'] = 'spot'
+                keep(data.arn('ec2', f'instance/{instance_id}'))
+            for _ in range(counts['volumes'][region]):
+                volume_id = self.new_id('vol')
+                data.volumes[volume_id] = {'VolumeId': volume_id, 'Size': 8,
+                                           'State': self.random.choice(['available', 'in-use', 'in-use']),
+                                           'Tags': []}
+                keep(data.arn('ec2', f'volume/{volume_id}'))
+            for _ in range(counts['addresses'][region]):
+                allocation_id = self.new_id('eipalloc')
+                address = {'AllocationId': allocation_id, 'PublicIp': f'198.51.{len(data.addresses) % 256}.1',
+                           'Domain': 'vpc'}
+                if self.random.random() < 0.5:
+                    address['AssociationId'] = self.new_id('eipassoc')
+                data.addresses[allocation_id] = address
+                keep(data.arn('ec2', f'elastic-ip/{allocation_id}'))
+            for index in range(counts['load_balancers'][region]):
+                name = f'bench-lb-{index}'
+                instances = [] if self.random.random() < 0.5 else [{'InstanceId': self.new_id('i')}]
+                data.load_balancers[name] = {'LoadBalancerName': name, 'Instances': instances}
+                keep(data.arn('elasticloadbalancing', f'loadbalancer/{name}'))
+            for index in range(counts['v2_load_balancers'][region]):
+                name = f'bench-alb-{index}'
+                arn = data.arn('elasticloadbalancing', f'loadbalancer/app/{name}/{self.new_id("lb")[3:]}')
+                data.v2_load_balancers[arn] = {'LoadBalancerArn': arn, 'LoadBalancerName': name, 'Type': 'application'}
+                keep(arn)
+                # One to three target groups each, some of them shared with the previous load balancer
+                shared = [tg for tg in list(data.target_groups.values())[-3:] if self.random.random() < 0.2]
+                for tg in shared:
+                    tg['LoadBalancerArns'].append(arn)
+                for _ in range(self.random.randint(1, 3) - len(shared)):
+                    tg_arn = data.arn('elasticloadbalancing', f'targetgroup/{name}/{self.new_id("tg")[3:]}')
+                    targets = self.random.choice([[], [], 'healthy', 'healthy', 'unhealthy'])
+                    data.target_groups[tg_arn] = {
+                        'TargetGroupArn': tg_arn, 'LoadBalancerArns': [arn],
+                        'Targets': [] if not targets else [{'Target': {'Id': self.new_id('i'), 'Port': 80},
+                                                           'TargetHealth': {'State': targets}}]}
+                # A forwarding listener, an HTTP to HTTPS redirect next to it on some, none on a few, and on every
+                # fourth a listener answering 404 by default and forwarding a path to the target groups
+                forward_actions = [{'Type': 'forward', 'TargetGroupArn': tg['TargetGroupArn']}
+                                   for tg in data.target_groups.values() if arn in tg['LoadBalancerArns']]
+                forward = {'ListenerArn': data.arn('elasticloadbalancing', f'listener/app/{name}/{self.new_id("l")[2:]}'),
+                           'LoadBalancerArn': arn, 'Protocol': 'HTTPS', 'Port': 443,
+                           'DefaultActions': forward_actions[:1]}
+                redirect = {'ListenerArn': data.arn('elasticloadbalancing', f'listener/app/{name}/{self.new_id("l")[2:]}'),
+                            'LoadBalancerArn': arn, 'Protocol': 'HTTP', 'Port': 80, 'DefaultActions': [
+                                {'Type': 'redirect', 'RedirectConfig': {'Protocol': 'HTTPS', 'Port': '443'}}]}
+                routed = {'ListenerArn': data.arn('elasticloadbalancing', f'listener/app/{name}/{self.new_id("l")[2:]}'),
+                          'LoadBalancerArn': arn, 'Protocol': 'HTTPS', 'Port': 443, 'DefaultActions': [
+                              {'Type': 'fixed-response', 'FixedResponseConfig': {'StatusCode': '404'}}]}
+                data.listeners[arn] = self.random.choice([[], [forward], [forward], [forward], [forward, redirect]])
+                if index % 4 == 3:
+                    data.listeners[arn] = [routed]
+                for listener in data.listeners[arn]:
+                    data.rules[listener['ListenerArn']] = [{
+                        'RuleArn': listener['ListenerArn'].replace(':listener/', ':listener-rule/') + '/default',
+                        'Priority': 'default', 'IsDefault': True, 'Actions': listener['DefaultActions']}]
+                    if listener is routed:
+                        data.rules[listener['ListenerArn']].append({
+                            'RuleArn': listener['ListenerArn'].replace(':listener/', ':listener-rule/') + '/1',
+                            'Priority': '1', 'IsDefault': False,
+                            'Conditions': [{'Field': 'path-pattern', 'Values': ['/api/*']}],
+                            'Actions': [{'Type': 'forward', 'ForwardConfig': {'TargetGroups': [
+                                {'TargetGroupArn': action['TargetGroupArn'], 'Weight': 1}
+                                for action in forward_actions]}}]})
+            for index in range(counts['db_clusters'][region]):
+                name = f'bench-cluster-{index}'
+                data.db_clusters[name] = {'DBClusterIdentifier': name, 'Status': 'available',
+                                          'DBClusterArn': data.arn('rds', f'cluster:{name}')}
+                keep(data.db_clusters[name]['DBClusterArn'])
+            for index in range(counts['db_instances'][region]):
+                name = f'bench-db-{index}'
+                data.db_instances[name] = {'DBInstanceIdentifier': name, 'DBInstanceStatus': 'available',
+                                           'DBInstanceArn': data.arn('rds', f'db:{name}')}
+                keep(data.db_instances[name]['DBInstanceArn'])
+            for index in range(counts['eks_clusters'][region]):
+                name = f'bench-eks-{index}'
+                data.eks_clusters[name] = {f'ng-{n}': {'minSize': 1, 'maxSize': 3, 'desiredSize': 2}
+                                           for n in range(3)}
+                keep(data.arn('eks', f'cluster/{name}'))
+            for index in range(counts['streams'][region]):
+                name = f'bench-stream-{index}'
+                data.streams[name] = 'ACTIVE'
+                keep(data.arn('kinesis', f'stream/{name}'))
+            for index in range(counts['msk_clusters'][region]):
+                name = f'bench-msk-{index}'
+                arn = data.arn('kafka', f'cluster/{name}/{self.new_id("uuid")}')
+                data.msk_clusters[arn] = {'ClusterName': name, 'ClusterArn': arn, 'State': 'ACTIVE'}
+                keep(arn)
+            for index in range(counts['domains'][region]):
+                name = f'bench-domain-{index}'
+                data.domains[name] = True
+                keep(data.arn('es', f'domain/{name}'))
+
+    def resource_count(self):
+        """
+        :return: Total number of resources across accounts and regions.
+        """
+        return sum(len(getattr(data, kind)) for data in self.data.values()
+                   for kind in ['instances', 'volumes', 'addresses', 'load_balancers', 'v2_load_balancers', 'db_clusters',
+                                'db_instances', 'eks_clusters', 'streams', 'msk_clusters', 'domains'])
+
+    # Client hook
+
+    def install(self, client, region, account=None):
+        """
+        Client hook answering every request of the client from the fake.
+
+        :param client: boto3 or aiobotocore client.
+        :param region: AWS region name of the client.
+        :param account: Account of the client, None for the default (first) account.
+        :return: None
+        """
+        account = account or self.accounts[0]
+        service = client.meta.service_model.service_name
+        protocol = client.meta.service_model.protocol
+        events = client.meta.events
+
+        def before_parameter_build(params, model, **kwargs):
+            self.current_call.set((model.name, dict(params)))
+
+        def respond(request, response_class):
+            # The call is answered here, so that a throttled or failed call never reaches the handler
+            # or its result, and the parsed result is injected at 'before-parse'
+            operation, params = self.current_call.get()
+            key = (account, region, service, operation)
+            if self.rate_limit and not self.limiter(key).allow():
+                with self.lock:
+                    self.throttled[(service, operation)] += 1
+                return self.error_response(request, protocol, THROTTLE_ERRORS.get(service, DEFAULT_THROTTLE_ERROR),
+                                           'Rate exceeded', response_class)
+            try:
+                self.current_result.set(self.handle(account, region, service, operation, params))
+            except FakeError as e:
+                return self.error_response(request, protocol, e.code, e.message, response_class)
+            return response_class(request.url, 200, {}, RawBody(self.empty_body(protocol, operation)))
+
+        def count_call():
+            with self.lock:
+                self.calls[(service, self.current_call.get()[0])] += 1
+
+        def before_send(request, **kwargs):
+            count_call()
+            if self.latency:
+                time.sleep(self.latency)
+            return respond(request, AWSResponse)
+
+        async def before_async_send(request, **kwargs):
+            from aiobotocore.awsrequest import AioAWSResponse
+
+            count_call()
+            if self.latency:
+                await asyncio.sleep(self.latency)
+            return respond(request, AioAWSResponse)
+
+        def before_parse(response_dict, customized_response_dict, **kwargs):
+            if response_dict['status_code'] < 300:
+                customized_response_dict.update(self.current_result.get())
+
+        events.register('before-parameter-build', before_parameter_build)
+        events.register('before-send',
+                        before_async_send if inspect.iscoroutinefunction(client._make_api_call) else before_send)
+        events.register('before-parse', before_parse)
+
+    def limiter(self, key):
+        with self.lock:
+            return self.limiters.setdefault(key, RateLimiter(self.rate_limit))
+
+    @staticmethod
+    def empty_body(protocol, operation):
+        if protocol in ('json', 'rest-json'):
+            return b'{}'
+        if protocol == 'ec2':
+            return b'<Response/>'
+        return f'<{operation}Response><{operation}Result/></{operation}Response>'.encode()
+
+    @staticmethod
+    def error_response(request, protocol, code, message, response_class=AWSResponse):
+        if protocol in ('json', 'rest-json'):
+            body = f'{{"__type": "{code}", "message": "{message}"}}'
+            headers = {'x-amzn-ErrorType': code}
+        elif protocol == 'ec2':
+            body = f'<Response><Errors><Error><Code>{code}</Code><Message>{message}</Message></Error></Errors></Response>'
+            headers = {}
+        else:
+            body = f'<ErrorResponse><Error><Code>{code}</Code><Message>{message}</Message></Error></ErrorResponse>'
+            headers = {}
+        return response_class(request.url, 400, headers, RawBody(body.encode()))
+
+    @staticmethod
+    def get(resources, resource_id, code, kind):
+        """
+        :return: Resource of a dict of resources, raising the FakeError AWS answers if it doesn't exist.
+        """
+        if resource_id not in resources:
+            raise FakeError(code, f"The {kind} '{resource_id}' does not exist")
+        return resources[resource_id]
+
+    # Dispatch and pagination
+
+    def handle(self, account, region, service, operation, params):
+        """
+        Answer an API call.
+
+        :return: Parsed response.
+        """
+        handler = getattr(self, f'{service}_{operation}'.replace('-', '_').lower(), None)
+        if handler is None:
+            with self.lock:
+                self.unhandled[(service, operation)] += 1
+            return {}
+        data = self.data.get((account, region)) or FakeRegion(account, region)
+        config = self.paginator(service, operation)
+        if config is None:
+            with data.lock:
+                return handler(data, params)
+        return self.paginate(config, handler, data, params)
+
+    def paginator(self, service, operation):
+        key = (service, operation)
+        if key not in self.paginators:
+            try:
+                self.paginators[key] = get_botocore_session().get_paginator_model(service).get_paginator(operation)
+            except Exception:
+                self.paginators[key] = None
+        return self.paginators[key]
+
+    def paginate(self, config, handler, data, params):
+        """
+        Serve one page of a paginated operation. The full result is computed on
+        the first page and kept until the last page is served.
+        """
+        result_key = config['result_key']
+        result_key = result_key[0] if isinstance(result_key, list) else result_key
+        token = params.get(config['input_token'])
+        limit = params.get(config.get('limit_key')) or 100
+
+        if token:
+            cursor, offset = token.rsplit(':', 1)
+            offset = int(offset)
+            with self.lock:
+                response = self.cursors[cursor]
+        else:
+            cursor, offset = self.new_id('cursor'), 0
+            with data.lock:
+                response = handler(data, params)
+            with self.lock:
+                self.cursors[cursor] = response
+
+        page = dict(response)
+        page[result_key] = response[result_key][offset:offset + limit]
+        if offset + limit < len(response[result_key]):
+            page[config['output_token']] = f'{cursor}:{offset + limit}'
+            if 'more_results' in config:
+                page[config['more_results']] = True
+        else:
+            if 'more_results' in config:
+                page[config['more_results']] = False
+            with self.lock:
+                self.cursors.pop(cursor, None)
+        return page
+
+    @staticmethod
+    def filter_values(params, name):
+        for item in params.get('Filters', []):
+            if item['Name'] == name:
+                return set(item['Values'])
+        return None
+
+    # EC2
+
+    def ec2_describeregions(self, data, params):
+        return {'Regions': [{'RegionName': region, 'OptInStatus': 'opt-in-not-required'}
+                            for region in self.regions]}
+
+    def ec2_describeinstances(self, data, params):
+        states = self.filter_values(params, 'instance-state-name')
+        return {'Reservations': [{'ReservationId': f'r-{instance_id[2:]}', 'Instances': [instance]}
+                                 for instance_id, instance in data.instances.items()
+                                 if states is None or instance['State']['Name'] in states]}
+
+    def ec2_stopinstances(self, data, params):
+        # Like AWS, a call with one unknown ID fails as a whole
+        for instance_id in params['InstanceIds']:
+            self.get(data.instances, instance_id, 'InvalidInstanceID.NotFound', 'instance ID')
+        stopping = []
+        for instance_id in params['InstanceIds']:
+            instance = data.instances[instance_id]
+            stopping.append({'InstanceId': instance_id, 'PreviousState': dict(instance['State']),
+                             'CurrentState': {'Name': 'stopping'}})
+            instance['State'] = {'Name': 'stopped'}
+        return {'StoppingInstances': stopping}
+
+    def ec2_unmonitorinstances(self, data, params):
+        for instance_id in params['InstanceIds']:
+            self.get(data.instances, instance_id, 'InvalidInstanceID.NotFound', 'instance ID')
+        for instance_id in params['InstanceIds']:
+            data.instances[instance_id]['Monitoring'] = {'State': 'disabled'}
+        return {'InstanceMonitorings': [{'InstanceId': instance_id, 'Monitoring': {'State': 'disabling'}}
+                                        for instance_id in params['InstanceIds']]}
+
+    def ec2_createtags(self, data, params):
+        for resource_id in params['Resources']:
+            instance = data.instances.get(resource_id)
+            if instance is not None:
+                instance['Tags'] = instance['Tags'] + params['Tags']
+        return {}
+
+    def ec2_describevolumes(self, data, params):
+        status = self.filter_values(params, 'status')
+        return {'Volumes': [volume for volume in data.volumes.values()
+                            if status is None or volume['State'] in status]}
+
+    def ec2_deletevolume(self, data, params):
+        self.get(data.volumes, params['VolumeId'], 'InvalidVolume.NotFound', 'volume')
+        data.volumes.pop(params['VolumeId'])
+        return {}
+
+    def ec2_describeaddresses(self, data, params):
+        return {'Addresses': list(data.addresses.values())}
+
+    def ec2_releaseaddress(self, data, params):
+        self.get(data.addresses, params['AllocationId'], 'InvalidAllocationID.NotFound', 'allocation ID')
+        data.addresses.pop(params['AllocationId'])
+        return {}
+
+    # ELB
+
+    def elb_describeloadbalancers(self, data, params):
+        return {'LoadBalancerDescriptions': list(data.load_balancers.values())}
+
+    def elb_deleteloadbalancer(self, data, params):
+        # Deleting a missing classic load balancer succeeds
+        data.load_balancers.pop(params['LoadBalancerName'], None)
+        return {}
+
+    # ELBv2
+
+    def elbv2_describeloadbalancers(self, data, params):
+        return {'LoadBalancers': list(data.v2_load_balancers.values())}
+
+    def elbv2_describetargetgroups(self, data, params):
+        return {'TargetGroups': [{key: value for key, value in tg.items() if key != 'Targets'}
+                                 for tg in data.target_groups.values()]}
+
+    def elbv2_describetargethealth(self, data, params):
+        return {'TargetHealthDescriptions': list(data.target_groups[params['TargetGroupArn']]['Targets'])}
+
+    def elbv2_describelisteners(self, data, params):
+        return {'Listeners': list(data.listeners[params['LoadBalancerArn']])}
+
+    def elbv2_describerules(self, data, params):
+        return {'Rules': list(self.get(data.rules, params['ListenerArn'], 'ListenerNotFound', 'listener'))}
+
+    def elbv2_deleteloadbalancer(self, data, params):
+        arn = params['LoadBalancerArn']
+        self.get(data.v2_load_balancers, arn, 'LoadBalancerNotFound', 'load balancer')
+        data.v2_load_balancers.pop(arn)
+        for listener in data.listeners.pop(arn):
+            data.rules.pop(listener['ListenerArn'], None)
+        for tg in data.target_groups.values():
+            if arn in tg['LoadBalancerArns']:
+                tg['LoadBalancerArns'].remove(arn)
+        return {}
+
+    # RDS
+
+    @staticmethod
+    def progress(databases, status_key, identifier_key, identifiers):
+        """
+        Describe databases, then move the stopping ones to stopped, as if they stopped between two calls.
+        """
+        described = [dict(database) for database in databases.values()
+                     if identifiers is None or database[identifier_key] in identifiers]
+        for database in described:
+            if database[status_key] == 'stopping':
+                databases[database[identifier_key]][status_key] = 'stopped'
+        return described
+
+    def rds_describedbclusters(self, data, params):
+        return {'DBClusters': self.progress(data.db_clusters, 'Status', 'DBClusterIdentifier',
+                                            self.filter_values(params, 'db-cluster-id'))}
+
+    def rds_describedbinstances(self, data, params):
+        return {'DBInstances': self.progress(data.db_instances, 'DBInstanceStatus', 'DBInstanceIdentifier',
+                                             self.filter_values(params, 'db-instance-id'))}
+
+    def rds_stopdbcluster(self, data, params):
+        cluster = self.get(data.db_clusters, params['DBClusterIdentifier'], 'DBClusterNotFoundFault', 'DB cluster')
+        cluster['Status'] = 'stopping'
+        return {'DBCluster': dict(cluster)}
+
+    def rds_stopdbinstance(self, data, params):
+        instance = self.get(data.db_instances, params['DBInstanceIdentifier'], 'DBInstanceNotFound', 'DB instance')
+        instance['DBInstanceStatus'] = 'stopping'
+        return {'DBInstance': dict(instance)}
+
+    # EKS
+
+    def eks_listclusters(self, data, params):
+        return {'clusters': list(data.eks_clusters)}
+
+    def eks_listnodegroups(self, data, params):
+        return {'nodegroups': list(data.eks_clusters[params['clusterName']])}
+
+    def eks_describenodegroup(self, data, params):
+        cluster, nodegroup = params['clusterName'], params['nodegroupName']
+        return {'nodegroup': {
+            'nodegroupName': nodegroup,
+            'clusterName': cluster,
+            'nodegroupArn': data.arn('eks', f'nodegroup/{cluster}/{nodegroup}/{nodegroup}-id'),
+            'scalingConfig': dict(data.eks_clusters[cluster][nodegroup]),
+            'status': 'ACTIVE',
+        }}
+
+    def eks_updatenodegroupconfig(self, data, params):
+        data.eks_clusters[params['clusterName']][params['nodegroupName']] = dict(params['scalingConfig'])
+        return {'update': {'id': self.new_id('update'), 'status': 'InProgress', 'type': 'ConfigUpdate'}}
+
+    # Kinesis
+
+    def kinesis_liststreams(self, data, params):
+        return {'StreamNames': list(data.streams)}
+
+    def kinesis_deletestream(self, data, params):
+        self.get(data.streams, params['StreamName'], 'ResourceNotFoundException', 'stream')
+        data.streams.pop(params['StreamName'])
+        return {}
+
+    # MSK
+
+    def kafka_listclustersv2(self, data, params):
+        return {'ClusterInfoList': list(data.msk_clusters.values())}
+
+    def kafka_deletecluster(self, data, params):
+        self.get(data.msk_clusters, params['ClusterArn'], 'NotFoundException', 'cluster')
+        cluster = data.msk_clusters.pop(params['ClusterArn'])
+        return {'ClusterArn': cluster['ClusterArn'], 'State': 'DELETING'}
+
+    # OpenSearch
+
+    def opensearch_listdomainnames(self, data, params):
+        return {'DomainNames': [{'DomainName': name, 'EngineType': 'OpenSearch'} for name in data.domains]}
+
+    def opensearch_describedomains(self, data, params):
+        return {'DomainStatusList': [{'DomainName': name, 'ARN': data.arn('es', f'domain/{name}'), 'Deleted': False}
+                                     for name in params['DomainNames'] if name in data.domains]}
+
+    def opensearch_deletedomain(self, data, params):
+        name = params['DomainName']
+        self.get(data.domains, name, 'ResourceNotFoundException', 'domain')
+        data.domains.pop(name)
+        return {'DomainStatus': {'DomainName': name, 'ARN': data.arn('es', f'domain/{name}'), 'Deleted': True}}
+
+    # Config, tagging and STS
+
+    def config_batchgetresourceconfig(self, data, params):
+        items = []
+        for key in params['resourceKeys']:
+            instance = data.instances.get(key['resourceId'])
+            if instance is not None and key['resourceId'] not in data.config_unknown:
+                items.append({'resourceType': key['resourceType'], 'resourceId': key['resourceId'],
+                              'resourceCreationTime': instance['LaunchTime']})
+        return {'baseConfigurationItems': items, 'unprocessedResourceKeys': []}
+
+    def resourcegroupstaggingapi_getresources(self, data, params):
+        tag_filters = params.get('TagFilters', [])
+        resource_types = params.get('ResourceTypeFilters')
+
+        def matches(arn, tags):
+            if resource_types and not any(arn.split(':')[2] == t.split(':')[0] for t in resource_types):
+                return False
+            return all(f['Key'] in tags and (not f.get('Values') or tags[f['Key']] in f['Values'])
+                       for f in tag_filters)
+
+        return {'ResourceTagMappingList': [
+            {'ResourceARN': arn, 'Tags': [{'Key': key, 'Value': value} for key, value in tags.items()]}
+            for arn, tags in data.tags.items() if matches(arn, tags)]}
+
+    def sts_assumerole(self, data, params):
+        account = params['RoleArn'].split(':')[4]
+        return {'Credentials': {
+            'AccessKeyId': f'ASIA{account}',
+            'SecretAccessKey': 'fake',
+            'SessionToken': 'fake',
+            'Expiration': datetime.now(timezone.utc) + timedelta(hours=1),
+        }}
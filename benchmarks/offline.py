@@ -0,0 +1,112 @@
+"""
+Offline runs of the handler against synthetic accounts, shared by the check scripts (scripts/check_*.py).
+
+Importing this module sets the environment of an offline run: fake credentials,
+every region checked, no dry run, and long-running changes reported pending
+right away, so that two runs of the same synthetic accounts report the same
+records. reset starts each run over with a fresh FakeAWS (see fake_aws.py)
+answering every client, and an empty local store in a new temporary directory.
+The benchmarks/ and files/ directories must be on sys.path.
+"""
+
+import os
+import tempfile
+import time
+
+os.environ.update({
+    'AWS_ACCESS_KEY_ID': 'fake',
+    'AWS_SECRET_ACCESS_KEY': 'fake',
+    'AWS_REGION': 'us-east-1',
+    'AWS_DEFAULT_REGION': 'us-east-1',
+    'CHECK_ALL_REGIONS': 'true',
+    'DRY_RUN': 'false',
+    'EMAIL_IDENTITY': 'check@example.com',
+    'TO_ADDRESS': 'check@example.com',
+    'COMPLETION_WAIT_SECONDS': '0',
+    'DEADLINE_RESERVE_SECONDS': '15',
+})
+
+import clients  # noqa: E402
+import index  # noqa: E402
+import regions  # noqa: E402
+import store  # noqa: E402
+import throttle  # noqa: E402
+from fake_aws import FakeAWS  # noqa: E402
+
+
+REGIONS = ['us-east-1', 'eu-west-1', 'eu-central-1']
+ACCOUNTS = ['100000000000', '100000000001']
+# Event of a run cleaning the member accounts
+EVENT = {'account_role_arns': [f'arn:aws:iam::{account}:role/cleaner' for account in ACCOUNTS]}
+# Resources of each kind per account
+POPULATION = dict(instances=60, volumes=60, addresses=10, load_balancers=6, db_instances=6, db_clusters=3,
+                  eks_clusters=2, streams=6, msk_clusters=2, domains=3, v2_load_balancers=6)
+
+_backend = None
+
+
+def fake_hook(client, region, account=None):
+    """Client hook routing every new client to the fake of the current run."""
+    _backend.install(client, region, account)
+
+
+def reset(name, regions_=REGIONS, accounts=ACCOUNTS, population=None):
+    """
+    Start over with fresh synthetic accounts, new clients and an empty local store.
+
+    :param name: Name of the check, in the name of the store directory.
+    :param regions_: Regions of the synthetic accounts.
+    :param accounts: Synthetic account IDs.
+    :param population: Dict of FakeAWS.populate arguments, defaults to POPULATION.
+    :return: Tuple of (FakeAWS, directory of the store).
+    """
+    global _backend
+    _backend = FakeAWS(regions_, accounts)
+    _backend.populate(**(population or POPULATION))
+    clients.register_client_hook(fake_hook)
+    clients.clear_clients()
+    regions.clear_regions()
+    throttle.clear_buckets()
+    directory = tempfile.mkdtemp(prefix=f'aws-cleaner-{name}-')
+    store.set_store(store.LocalFileStore(directory))
+    return _backend, directory
+
+
+def capture_reports():
+    """
+    Keep the collectors the handler reports instead of sending them by email.
+
+    :return: List the reported collectors are appended to.
+    """
+    reports = []
+    index.send_email = lambda from_address, to_address, collector: reports.append(collector)
+    return reports
+
+
+def outcomes(collectors):
+    """
+    :param collectors: Iterable of results.ResultCollector.
+    :return: Sorted list of (account, service, region, resource, action, outcome) of their records.
+    """
+    return sorted(tuple('' if value is None else value for value in record[:6])
+                  for collector in collectors for record in collector.records())
+
+
+class DeadlineContext:
+    """
+    Lambda context of an invocation, with a few milliseconds before the deadline reserve.
+
+    The time counts from the first time the handler asks for it, when it starts its tasks, so that
+    the time an invocation spends creating its clients doesn't eat it.
+    """
+
+    invoked_function_arn = 'arn:aws:lambda:us-east-1:100000000000:function:check'
+
+    def __init__(self, deadline_ms):
+        self.deadline_ms = deadline_ms
+        self.deadline = None
+
+    def get_remaining_time_in_millis(self):
+        if self.deadline is None:
+            self.deadline = time.monotonic() + int(os.environ['DEADLINE_RESERVE_SECONDS']) + self.deadline_ms / 1000
+        return max(0, (self.deadline - time.monotonic()) * 1000)
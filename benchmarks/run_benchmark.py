@@ -0,0 +1,225 @@
+"""
+Offline benchmark of the cleanup against synthetic accounts.
+
+Runs lambda_handler, then each cleaner on its own, against the in-process fake
+of fake_aws.py, and reports for every run its wall time, API calls per
+operation, peak memory (tracemalloc) and throttling. Results are saved as JSON;
+when given a baseline, the run fails if it is slower, uses more memory or makes
+more API calls than the baseline allows. Runs can be repeated with the
+asyncio scan backend (see files/async_scan.py, needs aiobotocore), named with
+an '-async' suffix, to compare it with the threaded scan.
+
+Usage:
+    python benchmarks/run_benchmark.py --scale 0.1 --output benchmarks/results/latest.json
+    python benchmarks/run_benchmark.py --baseline benchmarks/results/baseline.json
+    python benchmarks/run_benchmark.py --only handler handler-async --scan-backends threads async
+"""
+
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+from collections import Counter
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(BENCHMARKS_DIR, '..', 'files'))
+
+# The handler reads its configuration from the environment, set it before the first import
+os.environ.update({
+    'AWS_ACCESS_KEY_ID': 'fake',
+    'AWS_SECRET_ACCESS_KEY': 'fake',
+    'AWS_REGION': 'us-east-1',
+    'AWS_DEFAULT_REGION': 'us-east-1',
+    'CHECK_ALL_REGIONS': 'true',
+    'EMAIL_IDENTITY': 'benchmark@example.com',
+    'TO_ADDRESS': 'benchmark@example.com',
+    'KEEP_TAGS': json.dumps({'auto-deletion': 'skip-resource'}),
+})
+
+import cleaners  # noqa: E402
+import clients  # noqa: E402
+import index  # noqa: E402
+import regions  # noqa: E402
+import results  # noqa: E402
+import store  # noqa: E402
+import throttle  # noqa: E402
+from fake_aws import FakeAWS  # noqa: E402
+
+
+REGIONS = [
+    'us-east-1', 'us-east-2', 'us-west-1', 'us-west-2', 'ca-central-1',
+    'eu-west-1', 'eu-west-2', 'eu-west-3', 'eu-central-1', 'eu-north-1',
+    'ap-south-1', 'ap-northeast-1', 'ap-northeast-2', 'ap-northeast-3', 'ap-southeast-1',
+    'ap-southeast-2', 'sa-east-1', 'me-south-1', 'af-south-1', 'eu-south-1',
+]
+
+# Resources of one account at scale 1
+ACCOUNT_SIZE = {
+    'instances': 10000,
+    'volumes': 50000,
+    'addresses': 500,
+    'load_balancers': 300,
+    'v2_load_balancers': 300,
+    'db_instances': 200,
+    'db_clusters': 50,
+    'eks_clusters': 20,
+    'streams': 300,
+    'msk_clusters': 20,
+    'domains': 20,
+}
+
+DEFAULT_MAX_REGRESSION = 0.25
+
+_backend = None
+
+
+def fake_hook(client, region, account=None):
+    """Client hook routing every new client to the fake of the current run."""
+    _backend.install(client, region, account)
+
+
+def new_backend(args):
+    accounts = [f'{100000000000 + index:012d}' for index in range(args.accounts)]
+    backend = FakeAWS(REGIONS[:args.regions], accounts, latency=args.latency_ms / 1000,
+                      rate_limit=args.rate_limit, seed=args.seed)
+    backend.populate(**{name: int(count * args.scale) for name, count in ACCOUNT_SIZE.items()})
+    return backend
+
+
+def run(name, args, enabled_services=None, scan_backend='threads'):
+    """
+    Run the handler against a fresh fake.
+
+    :param name: Name of the run.
+    :param args: Command line arguments.
+    :param enabled_services: Services to run, None for all of them.
+    :param scan_backend: 'threads' or 'async'.
+    :return: Dict of measurements.
+    """
+    global _backend
+    _backend = new_backend(args)
+    clients.clear_clients()
+    regions.clear_regions()
+    throttle.clear_buckets()
+    store.set_store(store.LocalFileStore(tempfile.mkdtemp(prefix='aws-cleaner-benchmark-')))
+    os.environ['ENABLED_SERVICES'] = ','.join(enabled_services or [])
+    os.environ['SCAN_BACKEND'] = scan_backend
+
+    event = {}
+    if args.accounts > 1:
+        event['account_role_arns'] = [f'arn:aws:iam::{account}:role/cleaner' for account in _backend.accounts]
+
+    if not args.no_tracemalloc:
+        tracemalloc.start()
+    start = time.perf_counter()
+    index.lambda_handler(event, None)
+    wall_time = time.perf_counter() - start
+    peak_memory = None
+    if not args.no_tracemalloc:
+        peak_memory = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+
+    client_throttling = Counter()
+    for counters in throttle.throttling_report().values():
+        client_throttling.update(counters)
+    outcomes = Counter()
+    for (service, outcome), count in results.get_collector().summary().items():
+        outcomes[f'{service}.{outcome}'] += count
+
+    measurements = {
+        'wall_time': round(wall_time, 3),
+        'peak_memory_mb': round(peak_memory / 2 ** 20, 2) if peak_memory is not None else None,
+        'api_calls': sum(_backend.calls.values()),
+        'calls': {f'{service}.{operation}': count for (service, operation), count in sorted(_backend.calls.items())},
+        'throttles_injected': sum(_backend.throttled.values()),
+        'client_throttling': dict(client_throttling),
+        'outcomes': dict(sorted(outcomes.items())),
+        'unhandled_calls': {f'{service}.{operation}': count
+                            for (service, operation), count in sorted(_backend.unhandled.items())},
+    }
+    memory = f'{measurements["peak_memory_mb"]}MB' if peak_memory is not None else 'n/a'
+    print(f'{name:<20} {wall_time:>8.2f}s {measurements["api_calls"]:>8} calls {memory:>10} peak '
+          f'{measurements["throttles_injected"]:>6} throttles', file=sys.stderr)
+    return measurements
+
+
+def compare(current, baseline, max_regression):
+    """
+    Compare a benchmark with a baseline.
+
+    Wall time and memory may grow by `max_regression`; API calls are
+    deterministic and may not grow at all.
+
+    :return: List of regression descriptions.
+    """
+    regressions = []
+    for name, measurements in current['runs'].items():
+        reference = baseline['runs'].get(name)
+        if reference is None:
+            continue
+        for metric in ['wall_time', 'peak_memory_mb']:
+            if measurements[metric] is not None and reference[metric]:
+                if measurements[metric] > reference[metric] * (1 + max_regression):
+                    regressions.append(f'{name}: {metric} {reference[metric]} -> {measurements[metric]}')
+        if measurements['api_calls'] > reference['api_calls']:
+            regressions.append(f'{name}: api_calls {reference["api_calls"]} -> {measurements["api_calls"]}')
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--scale', type=float, default=1.0, help='Multiplier of the resource counts of an account')
+    parser.add_argument('--regions', type=int, default=len(REGIONS), help='Number of regions (max 20)')
+    parser.add_argument('--accounts', type=int, default=1, help='Number of accounts')
+    parser.add_argument('--latency-ms', type=float, default=2.0, help='Latency added to every request')
+    parser.add_argument('--rate-limit', type=float, default=None,
+                        help='Requests per second of an operation above which the fake throttles')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--dry-run', action='store_true', help='Run the cleaners in dry-run mode')
+    parser.add_argument('--only', nargs='*', help='Runs to do: handler and/or service names (default: all)')
+    parser.add_argument('--scan-backends', nargs='+', choices=['threads', 'async'], default=['threads'],
+                        help="Scan backends to run with, the async runs are named with an '-async' suffix")
+    parser.add_argument('--no-tracemalloc', action='store_true', help="Don't measure memory (faster)")
+    parser.add_argument('--output', default=os.path.join(BENCHMARKS_DIR, 'results', 'latest.json'))
+    parser.add_argument('--baseline', help='Results to compare with')
+    parser.add_argument('--max-regression', type=float, default=DEFAULT_MAX_REGRESSION,
+                        help='Allowed growth of wall time and memory over the baseline')
+    args = parser.parse_args()
+
+    os.environ['DRY_RUN'] = 'true' if args.dry_run else 'false'
+    clients.register_client_hook(fake_hook)
+    # No email is sent from a benchmark
+    index.send_email = lambda *args, **kwargs: None
+
+    runs = {}
+    for scan_backend in args.scan_backends:
+        for service in ['handler'] + list(cleaners.CLEANUP_SERVICES):
+            name = service if scan_backend == 'threads' else f'{service}-async'
+            if args.only and name not in args.only:
+                continue
+            runs[name] = run(name, args, None if service == 'handler' else [service], scan_backend)
+
+    benchmark = {
+        'config': {key: value for key, value in vars(args).items() if key not in ('output', 'baseline', 'only')},
+        'resources_per_account': {name: int(count * args.scale) for name, count in ACCOUNT_SIZE.items()},
+        'runs': runs,
+    }
+    os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+    with open(args.output, 'w') as f:
+        json.dump(benchmark, f, indent=2)
+    print(f'Results saved to {args.output}', file=sys.stderr)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(benchmark, json.load(f), args.max_regression)
+        for regression in regressions:
+            print(f'[ERROR]: Regression: {regression}', file=sys.stderr)
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
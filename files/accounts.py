@@ -0,0 +1,77 @@
+"""
+Multi-account support.
+
+The account a task works on is carried in a context variable, so the cleaners
+keep their (region) signature: clients, caches and result records pick the
+account up from the context. Member accounts are reached by assuming a role,
+with credentials cached and refreshed by botocore before they expire.
+"""
+
+import contextvars
+from contextlib import contextmanager
+
+import boto3
+from botocore.credentials import RefreshableCredentials
+from botocore.session import get_session as get_botocore_session
+
+
+ROLE_SESSION_NAME = 'aws-cleaner'
+ROLE_SESSION_DURATION = 3600
+
+_current_account = contextvars.ContextVar('account', default=None)
+
+
+def current_account():
+    """
+    :return: Account the current task works on, None for the Lambda's own account.
+    """
+    return _current_account.get()
+
+
+@contextmanager
+def account_context(account):
+    """
+    Run the enclosed code on behalf of an account.
+
+    :param account: Account identifier, None for the Lambda's own account.
+    """
+    token = _current_account.set(account)
+    try:
+        yield
+    finally:
+        _current_account.reset(token)
+
+
+def account_id_from_arn(role_arn):
+    """
+    :param role_arn: IAM role ARN (arn:aws:iam::<account id>:role/<name>).
+    :return: Account ID.
+    """
+    return role_arn.split(':')[4]
+
+
+def assume_role_session(role_arn, sts):
+    """
+    Create a boto3 session with the credentials of an assumed role.
+
+    The credentials are refreshed automatically (and thread-safely) by botocore
+    shortly before they expire, so the session can be kept across invocations.
+
+    :param role_arn: ARN of the role to assume.
+    :param sts: STS client with the credentials allowed to assume the role.
+    :return: boto3 Session.
+    """
+    def refresh():
+        credentials = sts.assume_role(RoleArn=role_arn, RoleSessionName=ROLE_SESSION_NAME,
+                                      DurationSeconds=ROLE_SESSION_DURATION)['Credentials']
+        return {
+            'access_key': credentials['AccessKeyId'],
+            'secret_key': credentials['SecretAccessKey'],
+            'token': credentials['SessionToken'],
+            'expiry_time': credentials['Expiration'].isoformat(),
+        }
+
+    botocore_session = get_botocore_session()
+    botocore_session._credentials = RefreshableCredentials.create_from_metadata(
+        metadata=refresh(), refresh_using=refresh, method='sts-assume-role')
+    return boto3.session.Session(botocore_session=botocore_session)
@@ -0,0 +1,158 @@
+"""
+Optional asyncio scan backend, enabled with SCAN_BACKEND=async.
+
+Before the cleaners run, the read-only listings they are going to make, for
+every account and region of the run, are fetched on a single event loop with
+aiobotocore: up to SCAN_CONCURRENCY requests are in flight at the same time,
+instead of a few per thread pool. The pages are handed over to inventory.py,
+which serves them to the cleaners in place of the matching calls, so the
+cleaners run unchanged on exactly the same records as with the threaded scan.
+
+aiobotocore is not part of the Lambda runtime: when it can't be imported, the
+run falls back to the threaded scan.
+"""
+
+import asyncio
+import json
+import os
+from contextlib import AsyncExitStack
+
+from clients import get_credentials, run_client_hooks
+from ec2_snapshot import SNAPSHOT_STATES
+from inventory import (EBS_PAGE_SIZE, EC2_PAGE_SIZE, EKS_PAGE_SIZE, ELB_PAGE_SIZE, ELBV2_PAGE_SIZE, KINESIS_PAGE_SIZE,
+                       MSK_PAGE_SIZE, RDS_PAGE_SIZE, listing_key, set_prefetched)
+from keep_index import TAGGING_PAGE_SIZE, get_keep_tags, tag_filter
+
+
+DEFAULT_SCAN_CONCURRENCY = 200
+
+# Cleanup service -> listings it makes: (AWS service, operation, page size or None when not paginated,
+# parameters), which must be the exact calls of inventory.py for the pages to be used
+SERVICE_LISTINGS = {
+    'ec2-tag': [('ec2', 'describe_instances', EC2_PAGE_SIZE,
+                 {'Filters': [{'Name': 'instance-state-name', 'Values': SNAPSHOT_STATES}]})],
+    'eip': [('ec2', 'describe_addresses', None, {})],
+    'ebs': [('ec2', 'describe_volumes', EBS_PAGE_SIZE, {'Filters': [{'Name': 'status', 'Values': ['available']}]}),
+            ('eks', 'list_clusters', EKS_PAGE_SIZE, {})],
+    'elb': [('elb', 'describe_load_balancers', ELB_PAGE_SIZE, {})],
+    'elbv2': [('elbv2', 'describe_load_balancers', ELBV2_PAGE_SIZE, {}),
+              ('elbv2', 'describe_target_groups', ELBV2_PAGE_SIZE, {})],
+    'rds': [('rds', 'describe_db_clusters', RDS_PAGE_SIZE, {}),
+            ('rds', 'describe_db_instances', RDS_PAGE_SIZE, {})],
+    'eks': [('eks', 'list_clusters', EKS_PAGE_SIZE, {})],
+    'kinesis': [('kinesis', 'list_streams', KINESIS_PAGE_SIZE, {})],
+    'msk': [('kafka', 'list_clusters_v2', MSK_PAGE_SIZE, {})],
+    'opensearch': [('opensearch', 'list_domain_names', None, {'EngineType': 'OpenSearch'})],
+}
+# The EC2 snapshot is shared by the EC2 cleaners
+SERVICE_LISTINGS['ec2-unmonitor'] = SERVICE_LISTINGS['ec2-stop'] = SERVICE_LISTINGS['ec2-tag']
+
+
+def get_listings(tasks):
+    """
+    List the read-only calls the cleanup tasks are going to make.
+
+    :param tasks: List of cleanup tasks (see scheduler.py).
+    :return: Set of (account, AWS service, region, operation, page size, parameters as JSON).
+    """
+    keep_tags = get_keep_tags()
+    listings = set()
+    for task in tasks:
+        calls = list(SERVICE_LISTINGS.get(task.service, []))
+        # Every cleaner checks the keep index of its region
+        calls += [('resourcegroupstaggingapi', 'get_resources', TAGGING_PAGE_SIZE, {'TagFilters': [tag_filter(key, value)]})
+                  for key, value in keep_tags.items()]
+        for service, operation, page_size, params in calls:
+            listings.add((task.account, service, task.region, operation, page_size, json.dumps(params, sort_keys=True)))
+    return listings
+
+
+def follow_ups(service, operation, pages):
+    """
+    :return: List of (operation, page size, parameters) of the listings depending on the pages of another.
+    """
+    if (service, operation) == ('eks', 'list_clusters'):
+        return [('list_nodegroups', EKS_PAGE_SIZE, {'clusterName': cluster})
+                for page in pages for cluster in page['clusters']]
+    return []
+
+
+def prefetch_inventory(tasks):
+    """
+    Fetch the listings of the cleanup tasks ahead of time, on one event loop.
+
+    :param tasks: List of cleanup tasks (see scheduler.py).
+    :return: Number of listings prefetched, 0 when aiobotocore is missing.
+    """
+    try:
+        from aiobotocore.session import get_session
+    except ImportError:
+        print('[ERROR]: SCAN_BACKEND is async but aiobotocore is not installed, using the threaded scan')
+        return 0
+
+    concurrency = int(os.environ.get('SCAN_CONCURRENCY', DEFAULT_SCAN_CONCURRENCY))
+    listings = get_listings(tasks)
+    credentials = {account: get_credentials(account) for account in {listing[0] for listing in listings}}
+    pages = asyncio.run(scan(get_session(), listings, credentials, concurrency))
+    set_prefetched(pages)
+    print(f'[INFO]: Prefetched {len(pages)} listings ({sum(len(p) for p in pages.values())} pages) '
+          f'with up to {concurrency} requests in flight')
+    return len(pages)
+
+
+async def scan(session, listings, credentials, concurrency):
+    """
+    Fetch listings concurrently.
+
+    :param session: aiobotocore session.
+    :param listings: Set of listings, as returned by get_listings.
+    :param credentials: Dict of account to botocore ReadOnlyCredentials.
+    :param concurrency: Maximum number of requests in flight.
+    :return: Dict of listing key (see inventory.listing_key) to list of response pages.
+    """
+    from aiobotocore.config import AioConfig
+
+    config = AioConfig(max_pool_connections=concurrency, retries={'mode': 'standard', 'max_attempts': 5})
+    semaphore = asyncio.Semaphore(concurrency)
+    results = {}
+
+    async with AsyncExitStack() as stack:
+        async def fetch(client, account, service, region, operation, page_size, params):
+            pages = []
+            try:
+                if page_size is None:
+                    async with semaphore:
+                        pages.append(await getattr(client, operation)(**params))
+                else:
+                    iterator = client.get_paginator(operation).paginate(
+                        PaginationConfig={'PageSize': page_size}, **params).__aiter__()
+                    while True:
+                        # One request per page, the semaphore bounds the requests in flight
+                        async with semaphore:
+                            try:
+                                pages.append(await iterator.__anext__())
+                            except StopAsyncIteration:
+                                break
+            except Exception as e:
+                # Left to the threaded path, which reports the error in the task that needs the listing
+                print(f'[ERROR]: Failed to prefetch {service}.{operation} in {region}. Error: {e}')
+                return
+            results[listing_key(account, region, service, operation, params)] = pages
+            await asyncio.gather(*[fetch(client, account, service, region, *follow_up)
+                                   for follow_up in follow_ups(service, operation, pages)])
+
+        async def scan_client(account, service, region, client_listings):
+            # Creating a client is CPU bound: the requests of the clients created before it go on meanwhile
+            creds = credentials[account]
+            client = await stack.enter_async_context(session.create_client(
+                service, region_name=region, config=config, aws_access_key_id=creds.access_key,
+                aws_secret_access_key=creds.secret_key, aws_session_token=creds.token))
+            run_client_hooks(client, region, account)
+            await asyncio.gather(*[fetch(client, account, service, region, operation, page_size, json.loads(params))
+                                   for operation, page_size, params in client_listings])
+
+        by_client = {}
+        for account, service, region, operation, page_size, params in listings:
+            by_client.setdefault((account, service, region), []).append((operation, page_size, params))
+        await asyncio.gather(*[scan_client(*key, client_listings) for key, client_listings in by_client.items()])
+    return results
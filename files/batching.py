@@ -0,0 +1,97 @@
+"""
+Batched mutating API calls.
+
+IDs are split into API-sized chunks that run concurrently. When a chunk fails
+because of one of its resources (e.g. an instance not found or in the wrong
+state), it is split in halves until the IDs responsible for the failure are
+isolated, so one bad ID doesn't fail the whole batch. Any other error (access
+denied, throttling once the retries are exhausted, network errors) would fail
+every half the same way, so it fails the whole chunk at once.
+"""
+
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from clients import TASK_CALL_WORKERS
+
+
+BATCH_WORKERS = 4
+
+# Maximum number of resource IDs per call
+CREATE_TAGS_CHUNK_SIZE = 1000
+STOP_INSTANCES_CHUNK_SIZE = 100
+UNMONITOR_INSTANCES_CHUNK_SIZE = 100
+# Maximum number of resources per status call
+DESCRIBE_DOMAINS_CHUNK_SIZE = 5
+RDS_FILTER_CHUNK_SIZE = 100
+
+# Error codes (or prefixes of error codes, ending with a dot) blaming a resource of the call, not the call itself
+RESOURCE_ERROR_CODES = ('InvalidInstanceID.', 'InvalidVolume.', 'InvalidVolumeID.', 'InvalidAllocationID.',
+                        'InvalidAddressID.', 'InvalidID', 'IncorrectInstanceState', 'IncorrectState',
+                        'UnsupportedOperation', 'OperationNotPermitted')
+
+
+def chunked(items, chunk_size):
+    """
+    Split a list into chunks.
+
+    :param items: List of items.
+    :param chunk_size: Maximum number of items per chunk.
+    :return: List of chunks.
+    """
+    return [items[i:i + chunk_size] for i in range(0, len(items), chunk_size)]
+
+
+def is_resource_error(error):
+    """
+    :param error: Exception raised by an API call.
+    :return: True if the error code blames one of the resources of the call.
+    """
+    code = getattr(error, 'response', {}).get('Error', {}).get('Code', '')
+    return any(code.startswith(prefix) if prefix.endswith('.') else code == prefix
+               for prefix in RESOURCE_ERROR_CODES)
+
+
+def run_batched(call, ids, chunk_size, max_workers=BATCH_WORKERS, latencies=None):
+    """
+    Run an API call over a list of IDs in concurrent chunks.
+
+    :param call: Function performing one API call for a list of IDs.
+    :param ids: List of resource IDs.
+    :param chunk_size: Maximum number of IDs per call (1 for single-resource APIs).
+    :param max_workers: Maximum number of chunks running at the same time.
+    :param latencies: Dict filled with resource ID to the duration in seconds of the call that settled it, if given.
+    :return: Dict of resource ID to None on success or to the exception that made it fail.
+    """
+    results = {}
+    latencies = {} if latencies is None else latencies
+
+    def run_chunk(chunk):
+        started = time.perf_counter()
+        try:
+            call(chunk)
+        except Exception as e:
+            if len(chunk) == 1 or not is_resource_error(e):
+                latency = time.perf_counter() - started
+                for resource_id in chunk:
+                    results[resource_id] = e
+                    latencies[resource_id] = latency
+                return
+            middle = len(chunk) // 2
+            run_chunk(chunk[:middle])
+            run_chunk(chunk[middle:])
+        else:
+            latency = time.perf_counter() - started
+            for resource_id in chunk:
+                results[resource_id] = None
+                latencies[resource_id] = latency
+
+    chunks = chunked(list(ids), chunk_size)
+    if len(chunks) <= 1:
+        for chunk in chunks:
+            run_chunk(chunk)
+    else:
+        # Above TASK_CALL_WORKERS, the calls would outnumber the connections of the client (see clients.py)
+        with ThreadPoolExecutor(max_workers=min(max_workers, TASK_CALL_WORKERS, len(chunks))) as executor:
+            list(executor.map(run_chunk, chunks))
+    return results
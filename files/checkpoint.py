@@ -0,0 +1,62 @@
+"""
+Checkpoint of a cleanup run that didn't finish within one invocation.
+
+The checkpoint lists the (account, service, region) tasks already completed and the
+ones still pending, and the plan being applied if any; the next invocation
+(scheduled or self-invoked) runs only the pending tasks. It is kept in the store configured in store.py, so tests can
+point it to a local directory.
+"""
+
+import time
+
+from store import get_store
+
+
+CHECKPOINT_KEY = 'checkpoint.json'
+
+# An older checkpoint belongs to a previous nightly run and is ignored
+CHECKPOINT_MAX_AGE = 12 * 60 * 60
+
+
+def load_checkpoint(store=None):
+    """
+    Load the checkpoint of an unfinished run.
+
+    :param store: Store to read from, defaults to the configured store.
+    :return: Dict with 'started', 'completed' and 'pending' lists of [account, service, region] and the 'apply' plan key (None
+        when scanning), None if there is no recent checkpoint.
+    """
+    checkpoint = (store or get_store()).get_json(CHECKPOINT_KEY)
+    if checkpoint is None or time.time() - checkpoint['started'] > CHECKPOINT_MAX_AGE:
+        return None
+    checkpoint.setdefault('apply', None)
+    return checkpoint
+
+
+def save_checkpoint(started, completed, pending, store=None, apply=None):
+    """
+    Save the progress of an unfinished run.
+
+    :param started: Start time of the run (epoch seconds).
+    :param completed: List of (account, service, region) of the completed tasks.
+    :param pending: List of (account, service, region) of the tasks still to run.
+    :param store: Store to write to, defaults to the configured store.
+    :param apply: Store key of the plan being applied, None for a run that scans.
+    :return: None
+    """
+    (store or get_store()).put_json(CHECKPOINT_KEY, {
+        'started': started,
+        'completed': [list(task) for task in completed],
+        'pending': [list(task) for task in pending],
+        'apply': apply,
+    })
+
+
+def clear_checkpoint(store=None):
+    """
+    Remove the checkpoint once the run is complete.
+
+    :param store: Store to delete from, defaults to the configured store.
+    :return: None
+    """
+    (store or get_store()).delete(CHECKPOINT_KEY)
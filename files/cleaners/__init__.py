@@ -0,0 +1,71 @@
+"""
+Cleanup tasks, run for every region.
+
+Each service has its own module, imported only when the service is enabled so
+that a cold start doesn't load the cleaners that won't run.
+"""
+
+import importlib
+import os
+
+
+# Service -> (module, per-region function, applier of its planned actions, services that must run first)
+CLEANUP_SERVICES = {
+    'ec2-tag': ('cleaners.ec2', 'add_created_on_tag_in_region', 'tag_instances', []),
+    'ec2-unmonitor': ('cleaners.ec2', 'unmonitor_all_instances_in_region', 'unmonitor_instances', []),
+    'ec2-stop': ('cleaners.ec2', 'stop_all_instances_in_region', 'stop_instances', ['ec2-tag', 'ec2-unmonitor']),
+    'eip': ('cleaners.eip', 'release_unassociated_eip_in_region', 'release_addresses', []),
+    'ebs': ('cleaners.ebs', 'delete_available_ebs_volumes_in_region', 'delete_volumes', []),
+    'elb': ('cleaners.elb', 'delete_empty_load_balancers_in_region', 'delete_load_balancers', []),
+    'elbv2': ('cleaners.elbv2', 'delete_empty_v2_load_balancers_in_region', 'delete_v2_load_balancers', []),
+    'rds': ('cleaners.rds', 'stop_rds_in_region', 'stop_databases', []),
+    'eks': ('cleaners.eks', 'scale_in_eks_nodegroups_in_region', 'scale_in_nodegroups', []),
+    'kinesis': ('cleaners.kinesis', 'delete_kinesis_stream_in_region', 'delete_streams', []),
+    'msk': ('cleaners.msk', 'delete_msk_clusters_in_region', 'delete_clusters', []),
+    'opensearch': ('cleaners.opensearch', 'delete_domain_in_region', 'delete_domains', []),
+}
+
+
+def get_enabled_services():
+    """
+    Read the services to clean from the ENABLED_SERVICES environment variable.
+
+    :return: List of service names, all of them when ENABLED_SERVICES is not set.
+    """
+    enabled = [service.strip() for service in os.environ.get('ENABLED_SERVICES', '').split(',') if service.strip()]
+    if not enabled:
+        return list(CLEANUP_SERVICES)
+    for service in enabled:
+        if service not in CLEANUP_SERVICES:
+            print(f'[ERROR]: Unknown service in ENABLED_SERVICES: {service}')
+    return [service for service in CLEANUP_SERVICES if service in enabled]
+
+
+def load_cleaners(services):
+    """
+    Import the cleaners of some services.
+
+    :param services: List of service names.
+    :return: Ordered dict of service name to (per-region function, list of services it depends on).
+    """
+    cleaners = {}
+    for service in services:
+        module, function, _, depends_on = CLEANUP_SERVICES[service]
+        cleaners[service] = (getattr(importlib.import_module(module), function), depends_on)
+    return cleaners
+
+
+def load_appliers(services):
+    """
+    Import the appliers of the actions planned by some services, to apply a plan without scanning.
+
+    :param services: List of service names.
+    :return: Ordered dict of service name to (applier, list of services it depends on).
+    """
+    appliers = {}
+    for service in services:
+        if service not in CLEANUP_SERVICES:
+            raise ValueError(f'Unknown service in plan: {service}')
+        module, _, applier, depends_on = CLEANUP_SERVICES[service]
+        appliers[service] = (getattr(importlib.import_module(module), applier), depends_on)
+    return appliers
@@ -0,0 +1,162 @@
+"""
+Helpers shared by the cleaners: planning and applying actions, keep tags, cleanup policy and result tracking.
+
+Every cleaner is split in two: a per-region function that scans and decides
+what to do, as a list of actions, and an applier that only makes the mutating
+calls for such a list. carry_out connects the two, or puts the actions in the
+plan of a dry run; an apply run calls the appliers on a saved plan directly.
+"""
+
+from batching import run_batched
+from completion import track
+from keep_index import is_kept
+from plan import add_actions, is_dry_run, new_action
+from policy import NOTIFY, get_policy
+import results
+
+
+def carry_out(service, region, actions, apply):
+    """
+    Apply the actions planned by a cleaner, or add them to the plan of the run in dry-run mode.
+
+    :param service: Name of the AWS service to report the actions under (e.g. 'ec2').
+    :param region: AWS region name.
+    :param actions: List of Action (see plan.py).
+    :param apply: Applier of the actions, called with the region and the actions.
+    :return: None
+    """
+    if not actions:
+        return
+    if not is_dry_run():
+        apply(region, actions)
+        return
+    add_actions(actions)
+    for action in actions:
+        results.record(service, region, action.name or action.resource_id, action.action, results.SKIPPED)
+    print(f'[INFO]: Dry run: planned {len(actions)} {actions[0].service} actions in {region}')
+
+
+def apply_each(call, service, region, actions, check=None):
+    """
+    Apply actions whose API takes a single resource, concurrently, and keep track of their outcome.
+
+    :param call: Function making the API call of one Action.
+    :param service: Name of the AWS service to report the actions under.
+    :param region: AWS region name.
+    :param actions: List of Action, all with the same action.
+    :param check: Status check of long-running actions (see completion.track): the accepted actions
+                  are only reported once it confirms them. None to report them done right away.
+    :return: Dict of resource ID to None or exception, as returned by run_batched.
+    """
+    by_id = {action.resource_id: action for action in actions}
+    latencies = {}
+    batch_results = run_batched(lambda chunk: call(by_id[chunk[0]]), list(by_id), 1, latencies=latencies)
+    names = {action.resource_id: action.name for action in actions if action.name}
+    if check is None:
+        process_batch_results(batch_results, service, region, actions[0].action, names, latencies)
+        return batch_results
+    failed = {resource_id: error for resource_id, error in batch_results.items() if error is not None}
+    process_batch_results(failed, service, region, actions[0].action, names, latencies)
+    track(service, region, [by_id[resource_id] for resource_id in batch_results if resource_id not in failed], check,
+          latencies)
+    return batch_results
+
+
+def process_batch_results(batch_results, service, region, action, names=None, latencies=None):
+    """
+    Keep track of the resources handled by a batched API call.
+
+    :param batch_results: Dict of resource ID to None or exception, as returned by run_batched.
+    :param service: Name of the AWS service that was called.
+    :param region: AWS region name.
+    :param action: Action that was taken on the resources (e.g. 'stop').
+    :param names: Dict of resource ID to the name to report, defaults to the ID itself.
+    :param latencies: Dict of resource ID to the duration of its API call in seconds, as filled by run_batched.
+    :return: None
+    """
+    names = names or {}
+    latencies = latencies or {}
+    for resource_id, error in batch_results.items():
+        name = names.get(resource_id, resource_id)
+        if error is None:
+            results.record(service, region, name, action, results.DONE, latencies.get(resource_id))
+        else:
+            print(f'[ERROR]: Failed to {action} {service} resource: {name}. Error: {error}')
+            results.record(service, region, name, action, results.FAILED, latencies.get(resource_id))
+
+
+def notify(service, region, name, action):
+    """
+    Report a resource left alone for someone to check, keeping it in the plan of a dry run so that
+    applying the plan reports it too.
+
+    :param service: Name of the AWS service to report the resource under.
+    :param region: AWS region name.
+    :param name: Name or ID of the resource to report.
+    :param action: Action the cleaner would have taken (e.g. 'delete').
+    :return: None
+    """
+    results.record(service, region, name, action, results.NOTIFY)
+    if is_dry_run():
+        add_actions([new_action(service, region, action, name, outcome=results.NOTIFY)])
+
+
+def tags_to_dict(tags):
+    """
+    :param tags: Tags as returned by the AWS APIs: list of {'Key', 'Value'}, dict, or None.
+    :return: Dict of tag key to value.
+    """
+    if not tags:
+        return {}
+    if isinstance(tags, dict):
+        return tags
+    return {tag['Key']: tag['Value'] for tag in tags}
+
+
+def to_epoch(value):
+    """
+    :param value: datetime returned by the AWS APIs, or None.
+    :return: Epoch seconds, None if unknown.
+    """
+    return value.timestamp() if value is not None else None
+
+
+def select_resources(service, region, resources, report_as, action):
+    """
+    Filter resources through the cleanup policy (see policy.py), reporting the ones a 'notify' rule matches.
+
+    :param service: Cleanup service (e.g. 'ec2-stop').
+    :param region: AWS region name.
+    :param resources: Iterable of PolicyResource.
+    :param report_as: Name of the AWS service to report notified resources under.
+    :param action: Action the cleaner would take (e.g. 'delete').
+    :return: List of the PolicyResource no rule matched.
+    """
+    selected = []
+    skipped = 0
+    for resource, rule in get_policy().evaluate(service, region, resources):
+        if rule is None:
+            selected.append(resource)
+        elif rule.action == NOTIFY:
+            print(f'[INFO]: Skipped {service} resource {resource.name or resource.id} (policy rule {rule.name})')
+            notify(report_as, region, resource.name or resource.id, action)
+        else:
+            skipped += 1
+    if skipped:
+        print(f'[INFO]: Skipped {skipped} {service} resources in {region} (policy)')
+    return selected
+
+
+def is_protected(region, service, resource_id):
+    """
+    Check whether a resource carries a keep tag (see keep_index.py), logging it if so.
+
+    :param region: AWS region name.
+    :param service: Service name used in the resource ARNs (e.g. 'ec2').
+    :param resource_id: ARN, ID or name of the resource.
+    :return: True if the resource must be kept.
+    """
+    if is_kept(region, service, resource_id):
+        print(f'[INFO]: Keeping {service} resource {resource_id} (keep tag)')
+        return True
+    return False
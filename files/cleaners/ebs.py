@@ -0,0 +1,59 @@
+"""
+EBS cleaner: delete the available (unattached) volumes, unless the policy keeps them
+(by default, the volumes of a live EKS cluster).
+"""
+
+from clients import get_client
+from inventory import iter_volumes
+from plan import new_action
+from policy import PolicyResource
+from cleaners.common import apply_each, carry_out, is_protected, select_resources, tags_to_dict, to_epoch
+
+
+def delete_available_ebs_volumes(regions):
+    """
+    Delete all available EBS (unassociated) volumes in all the regions in the input.
+    :param regions: List of AWS region names.
+    """
+    for region in regions:
+        delete_available_ebs_volumes_in_region(region)
+
+def delete_available_ebs_volumes_in_region(region):
+    """
+    Delete all available EBS (unassociated) volumes in a specific region.
+    :param region: AWS region name.
+    """
+    print(f'[INFO]: Getting all available (unused) EBS volumes in region: {region}')
+    ec2 = get_client('ec2', region)
+
+    volumes = []
+    for volume in iter_volumes(ec2, status='available'):
+        if is_protected(region, 'ec2', volume['VolumeId']):
+            continue
+        tags = tags_to_dict(volume.get('Tags'))
+        volumes.append(PolicyResource(volume['VolumeId'], tags.get('Name'), tags,
+                                      {'state': volume['State'], 'volume_type': volume.get('VolumeType')},
+                                      to_epoch(volume.get('CreateTime'))))
+
+    volumes_to_delete = [new_action('ebs', region, 'delete', volume.id)
+                         for volume in select_resources('ebs', region, volumes, 'ebs', 'delete')]
+    carry_out('ebs', region, volumes_to_delete, delete_volumes)
+
+def delete_volumes(region, actions):
+    """
+    Delete EBS volumes in a specific region.
+    :param region: AWS region name.
+    :param actions: List of planned 'delete' actions.
+    """
+    ec2 = get_client('ec2', region)
+    for action in actions:
+        print(f'[INFO]: Deleting EBS volume with ID: {action.resource_id}')
+    # DeleteVolume takes a single volume ID
+    batch_results = apply_each(lambda action: ec2.delete_volume(VolumeId=action.resource_id), 'ebs', region, actions)
+
+    # Prints out the results.
+    failed = sum(1 for error in batch_results.values() if error is not None)
+    deleted = len(batch_results) - failed
+    print(f"[INFO]: Resources removed in {region}: {deleted} (total: {deleted + failed})")
+    if failed:
+        print(f"[ERROR]: Some resources could not be deleted (total: {failed}).")
@@ -0,0 +1,218 @@
+"""
+EC2 instance cleaners: tag with the creation date, stop detailed monitoring, stop.
+
+All of them work on the EC2 snapshot of the region (see ec2_snapshot.py), and
+record what they did in the inventory kept for the next run (see inventory_snapshot.py).
+"""
+
+import time
+
+from batching import (CREATE_TAGS_CHUNK_SIZE, STOP_INSTANCES_CHUNK_SIZE, UNMONITOR_INSTANCES_CHUNK_SIZE,
+                      run_batched)
+from clients import get_client
+from creation_times import resolve_creation_times
+from ec2_snapshot import get_ec2_snapshot
+from inventory_snapshot import UNCHANGED, get_inventory_snapshot
+from plan import new_action
+from policy import PolicyResource
+from cleaners.common import carry_out, is_protected, process_batch_results, select_resources
+
+
+# Instances unknown to AWS Config are only asked about again after this delay, unless they change
+UNRESOLVED_RETRY_SECONDS = 7 * 24 * 60 * 60
+
+
+def record_actions(region, batch_results, action):
+    """
+    Record the successful actions of a batch in the inventory.
+
+    :param region: AWS region name.
+    :param batch_results: Dict of instance ID to None or exception, as returned by run_batched.
+    :param action: Action taken (e.g. 'stop').
+    :return: None
+    """
+    inventory = get_inventory_snapshot(region, 'ec2')
+    for instance_id, error in batch_results.items():
+        if error is None:
+            inventory.set_action(instance_id, action)
+
+
+def policy_view(instance):
+    """
+    :param instance: InstanceRecord of the EC2 snapshot.
+    :return: What the cleanup policy sees of the instance.
+    """
+    return PolicyResource(instance.instance_id, instance.tags.get('Name', ''), instance.tags,
+                          {'state': instance.state, 'lifecycle': instance.lifecycle, 'monitoring': instance.monitoring},
+                          instance.launch_time)
+
+
+def stop_all_instances(regions):
+    """
+    Stop all EC2 instances
+
+    :param regions: List of AWS region names
+    """
+    print("====== EC2 ======")
+    # Stop instances in each region
+    for region in regions:
+        stop_all_instances_in_region(region)
+
+def stop_all_instances_in_region(region):
+    """
+    Stop all EC2 instances in a specific region
+
+    :param region: AWS region name
+    """
+    instances_to_stop = get_instances_in_region(region)
+    carry_out("ec2", region, [new_action('ec2-stop', region, 'stop', instance_id) for instance_id in instances_to_stop],
+              stop_instances)
+
+def get_instances_in_region(region):
+    """
+    Get the running instances to stop in a specific region, spot instances and the like being left out by the policy
+
+    :param region: AWS region name
+    :return: List of instance ids
+    """
+    running = [policy_view(instance) for instance in get_ec2_snapshot(region)
+               if instance.state == 'running' and not is_protected(region, 'ec2', instance.instance_id)]
+    instances_to_stop = []
+    for instance in select_resources('ec2-stop', region, running, 'ec2', 'stop'):
+        print(f'[INFO]: Instance with ID "{instance.id}" and name "{instance.name}" will be stopped.')
+        instances_to_stop.append(instance.id)
+    return instances_to_stop
+
+def stop_instances(region, actions):
+    """
+    Stop instances in a specific region
+
+    :param region: AWS region name
+    :param actions: List of planned 'stop' actions
+    """
+    ec2 = get_client('ec2', region)
+    latencies = {}
+    batch_results = run_batched(lambda chunk: ec2.stop_instances(InstanceIds=chunk),
+                                [action.resource_id for action in actions], STOP_INSTANCES_CHUNK_SIZE,
+                                latencies=latencies)
+    process_batch_results(batch_results, "ec2", region, "stop", latencies=latencies)
+    record_actions(region, batch_results, "stop")
+    print(f'[INFO]: Stopped instances: {[instance_id for instance_id, error in batch_results.items() if error is None]}')
+
+
+def unmonitor_all_instances(regions):
+    """Stop detailed monitoring on all EC2 instances
+
+    This will stop CloudWatch detailed monitoring on all instances
+    in all the regions in the input
+
+    :param regions: List of AWS region names
+    """
+
+    print("====== EC2 - Unmonitor ======")
+
+    for region in regions:
+        unmonitor_all_instances_in_region(region)
+
+def unmonitor_all_instances_in_region(region):
+    """Stop detailed monitoring on all EC2 instances in a specific region
+
+    :param region: AWS region name
+    """
+
+    instances_to_unmonitor = []
+    print(f'[INFO]: Getting instances in region: {region}')
+
+    monitored = [policy_view(instance) for instance in get_ec2_snapshot(region)
+                 if instance.state == 'running' and instance.monitoring == 'enabled'
+                 and not is_protected(region, 'ec2', instance.instance_id)]
+    for instance in select_resources('ec2-unmonitor', region, monitored, 'ec2', 'unmonitor'):
+        print(f'[INFO]: Instance with ID "{instance.id}" will be unmonitored.')
+        instances_to_unmonitor.append(instance.id)
+
+    carry_out("ec2", region, [new_action('ec2-unmonitor', region, 'unmonitor', instance_id)
+                              for instance_id in instances_to_unmonitor], unmonitor_instances)
+
+def unmonitor_instances(region, actions):
+    """Stop detailed monitoring on instances in a specific region
+
+    :param region: AWS region name
+    :param actions: List of planned 'unmonitor' actions
+    """
+    ec2 = get_client('ec2', region)
+    latencies = {}
+    batch_results = run_batched(lambda chunk: ec2.unmonitor_instances(InstanceIds=chunk),
+                                [action.resource_id for action in actions], UNMONITOR_INSTANCES_CHUNK_SIZE,
+                                latencies=latencies)
+    process_batch_results(batch_results, "ec2", region, "unmonitor", latencies=latencies)
+    record_actions(region, batch_results, "unmonitor")
+    print(f'[INFO]: Unmonitored instances: {[instance_id for instance_id, error in batch_results.items() if error is None]}')
+
+
+def add_created_on_tag(regions):
+    """Add "CreatedOn" tag on resources
+
+    This will check the resource creation date against AWS Config
+    and add it as a tag to the resource
+
+    :param regions: List of AWS region names
+    """
+    for region in regions:
+        add_created_on_tag_in_region(region)
+
+def add_created_on_tag_in_region(region):
+    """Add "CreatedOn" tag on the instances of a specific region
+
+    :param region: AWS region name
+    """
+    print(f'[INFO]: Getting instances in region: {region}')
+
+    # Skip instances where the tag is already present, and the ones the policy leaves out (e.g. spot instances)
+    untagged = [policy_view(instance) for instance in get_ec2_snapshot(region) if "CreatedOn" not in instance.tags]
+    instances_to_tag = [instance.id for instance in select_resources('ec2-tag', region, untagged, 'ec2', 'tag')]
+
+    # AWS Config won't know more about an unchanged instance it didn't know of during the previous runs
+    inventory = get_inventory_snapshot(region, 'ec2')
+    now = time.time()
+
+    def is_unresolved(instance_id):
+        action, taken_at = inventory.last_action(instance_id)
+        return (action == 'unresolved' and inventory.status(instance_id) == UNCHANGED
+                and now - taken_at < UNRESOLVED_RETRY_SECONDS)
+
+    unresolved = {instance_id for instance_id in instances_to_tag if is_unresolved(instance_id)}
+    if unresolved:
+        print(f'[INFO]: Skipping {len(unresolved)} unchanged instances unknown to AWS Config in {region}')
+        instances_to_tag = [instance_id for instance_id in instances_to_tag if instance_id not in unresolved]
+    if not instances_to_tag:
+        return
+
+    actions = []
+    creation_times, unknown = resolve_creation_times(region, instances_to_tag)
+    for instance_id, created_on in creation_times.items():
+        created_on = created_on.strftime("%d/%m/%Y")
+        print(f'[INFO] Instance {instance_id} created on {created_on}')
+        actions.append(new_action('ec2-tag', region, 'tag', instance_id, args={'CreatedOn': created_on}))
+    for instance_id in unknown:
+        inventory.set_action(instance_id, 'unresolved')
+    carry_out("ec2", region, actions, tag_instances)
+
+def tag_instances(region, actions):
+    """Add the "CreatedOn" tag on instances of a specific region
+
+    :param region: AWS region name
+    :param actions: List of planned 'tag' actions, with the creation date in their CreatedOn argument
+    """
+    ec2 = get_client('ec2', region)
+    instances_by_date = {}
+    for action in actions:
+        instances_by_date.setdefault(action.args['CreatedOn'], []).append(action.resource_id)
+
+    # One batch per creation date since all resources of a call get the same tags
+    for created_on, instance_ids in instances_by_date.items():
+        tags = [{'Key': 'CreatedOn', 'Value': created_on}]
+        latencies = {}
+        batch_results = run_batched(lambda chunk: ec2.create_tags(Resources=chunk, Tags=tags),
+                                    instance_ids, CREATE_TAGS_CHUNK_SIZE, latencies=latencies)
+        process_batch_results(batch_results, "ec2", region, "tag", latencies=latencies)
+        record_actions(region, batch_results, "tag")
@@ -0,0 +1,51 @@
+"""
+Elastic IP cleaner: release the unassociated addresses.
+"""
+
+from clients import get_client
+from inventory import iter_addresses
+from plan import new_action
+from policy import PolicyResource
+from cleaners.common import apply_each, carry_out, is_protected, select_resources, tags_to_dict
+
+
+def release_unassociated_eip(regions):
+    """Release unassociated Elastic IPs
+
+    This will release all Elastic IPs that are not associated with
+    an instance or a network interface in all the regions in the input
+
+    :param regions: List of AWS region names
+    """
+
+    print("====== EC2 - Elastic IPs ======")
+
+    for region in regions:
+        release_unassociated_eip_in_region(region)
+
+def release_unassociated_eip_in_region(region):
+    """Release unassociated Elastic IPs in a specific region
+
+    :param region: AWS region name
+    """
+    print(f'[INFO]: Getting all Elastic IPs in the region: {region}')
+    ec2 = get_client('ec2', region)
+
+    addresses = [PolicyResource(address['AllocationId'], address['PublicIp'], tags_to_dict(address.get('Tags')),
+                                {'domain': address.get('Domain')})
+                 for address in iter_addresses(ec2)
+                 if 'AssociationId' not in address and not is_protected(region, 'ec2', address['AllocationId'])]
+    addresses_to_release = [new_action('eip', region, 'release', address.id, name=address.name)
+                            for address in select_resources('eip', region, addresses, 'eip', 'release')]
+    carry_out("eip", region, addresses_to_release, release_addresses)
+
+def release_addresses(region, actions):
+    """Release Elastic IPs in a specific region
+
+    :param region: AWS region name
+    :param actions: List of planned 'release' actions, on allocation IDs
+    """
+    ec2 = get_client('ec2', region)
+    for action in actions:
+        print(f'[INFO]: Releasing Elastic IP: {action.name}')
+    apply_each(lambda action: ec2.release_address(AllocationId=action.resource_id), "eip", region, actions)
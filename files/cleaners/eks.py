@@ -0,0 +1,96 @@
+"""
+EKS cleaner: scale the node groups of the live clusters in to 0.
+"""
+
+from clients import get_client
+from eks_clusters import get_live_eks_clusters
+from inventory import iter_nodegroups
+from plan import new_action
+from policy import PolicyResource
+import results
+from cleaners.common import apply_each, carry_out, is_protected, select_resources, to_epoch
+
+
+def scale_in_eks_nodegroups(regions):
+    """Scales-in EKS nodegroups to 0
+
+    This will ensure all EKS node groups have 0 replicas in all the regions in the input
+
+    :param regions: List of AWS region names
+    """
+    for region in regions:
+        scale_in_eks_nodegroups_in_region(region)
+
+def scale_in_eks_nodegroups_in_region(region):
+    """Scales-in EKS nodegroups to 0 in a specific region
+
+    :param region: AWS region name
+    """
+    print(f'[INFO]: Getting EKS clusters in region: {region}')
+    eks_specific_region = get_client('eks', region)
+    nodegroups = []
+    scaling_configs = {}
+    for cluster in get_live_eks_clusters(region):
+        if is_protected(region, 'eks', cluster):
+            continue
+        for ng in iter_nodegroups(eks_specific_region, cluster):
+            node_group_info = eks_specific_region.describe_nodegroup(
+                clusterName=cluster, nodegroupName=ng)['nodegroup']
+            if is_protected(region, 'eks', node_group_info['nodegroupArn']):
+                continue
+            scaling_configs[f'{cluster}/{ng}'] = node_group_info['scalingConfig']
+            nodegroups.append(PolicyResource(f'{cluster}/{ng}', ng, node_group_info.get('tags') or {},
+                                             {'cluster': cluster, 'capacity_type': node_group_info.get('capacityType')},
+                                             to_epoch(node_group_info.get('createdAt'))))
+
+    nodegroups_to_scale_in = []
+    for nodegroup in select_resources('eks', region, nodegroups, 'eks', 'scale-in'):
+        cluster = nodegroup.attributes['cluster']
+        scaling_config = scaling_configs[nodegroup.id]
+
+        # Update scaling
+        scaling_config['minSize'] = 0
+        scaling_config['desiredSize'] = 0
+
+        print(f'[INFO]: Updating scaling config for node group {nodegroup.name} in cluster {cluster}')
+        nodegroups_to_scale_in.append(new_action(
+            'eks', region, 'scale-in', nodegroup.id,
+            args={'clusterName': cluster, 'nodegroupName': nodegroup.name, 'scalingConfig': scaling_config}))
+    carry_out("eks", region, nodegroups_to_scale_in, scale_in_nodegroups)
+
+def scale_in_nodegroups(region, actions):
+    """Scales-in EKS nodegroups in a specific region
+
+    :param region: AWS region name
+    :param actions: List of planned 'scale-in' actions, with the UpdateNodegroupConfig parameters as arguments
+    """
+    eks_specific_region = get_client('eks', region)
+    apply_each(lambda action: eks_specific_region.update_nodegroup_config(**action.args), "eks", region, actions,
+               check=check_nodegroups)
+
+def check_nodegroups(region, actions):
+    """Check the scale-in of EKS nodegroups
+
+    EKS has no batched status call, each nodegroup is described on its own.
+
+    :param region: AWS region name
+    :param actions: List of accepted 'scale-in' actions, with the UpdateNodegroupConfig parameters as arguments
+    :return: Dict of cluster/nodegroup to DONE once scaled in (or gone), FAILED if the update didn't hold,
+             None while updating
+    """
+    eks_specific_region = get_client('eks', region)
+    outcomes = {}
+    for action in actions:
+        try:
+            nodegroup = eks_specific_region.describe_nodegroup(
+                clusterName=action.args['clusterName'], nodegroupName=action.args['nodegroupName'])['nodegroup']
+        except eks_specific_region.exceptions.ResourceNotFoundException:
+            outcomes[action.resource_id] = results.DONE
+            continue
+        if nodegroup.get('status') == 'UPDATING':
+            outcomes[action.resource_id] = None
+        elif nodegroup['scalingConfig']['desiredSize'] == 0:
+            outcomes[action.resource_id] = results.DONE
+        else:
+            outcomes[action.resource_id] = results.FAILED
+    return outcomes
@@ -0,0 +1,48 @@
+"""
+Classic load balancer cleaner: delete the load balancers without instances.
+"""
+
+from clients import get_client
+from inventory import iter_classic_load_balancers
+from plan import new_action
+from policy import PolicyResource
+from cleaners.common import apply_each, carry_out, is_protected, select_resources, to_epoch
+
+
+def delete_empty_load_balancers(regions):
+    """
+    Delete all empty (classic) load balancers. This will delete all empty
+    (with no instances) classic load balancers in all the regions in the input
+
+    :param regions: List of AWS region names
+    """
+    for region in regions:
+        delete_empty_load_balancers_in_region(region)
+
+def delete_empty_load_balancers_in_region(region):
+    """
+    Delete all empty (classic) load balancers in a specific region
+
+    :param region: AWS region name
+    """
+    elb = get_client('elb', region)
+    empty = [PolicyResource(lb['LoadBalancerName'], lb['LoadBalancerName'], created=to_epoch(lb.get('CreatedTime')))
+             for lb in iter_classic_load_balancers(elb)
+             if len(lb['Instances']) == 0 and not is_protected(region, 'elasticloadbalancing', lb['LoadBalancerName'])]
+    load_balancers_to_delete = [new_action('elb', region, 'delete', lb.id)
+                                for lb in select_resources('elb', region, empty, 'elb', 'delete')]
+    carry_out('elb', region, load_balancers_to_delete, delete_load_balancers)
+
+def delete_load_balancers(region, actions):
+    """
+    Delete classic load balancers in a specific region
+
+    :param region: AWS region name
+    :param actions: List of planned 'delete' actions, on load balancer names
+    """
+    elb = get_client('elb', region)
+    batch_results = apply_each(lambda action: elb.delete_load_balancer(LoadBalancerName=action.resource_id),
+                               'elb', region, actions)
+    for lb_name, error in batch_results.items():
+        if error is None:
+            print(f'[INFO]: Deleted classic load balancer: {lb_name}')
@@ -0,0 +1,180 @@
+"""
+Application, Network and Gateway load balancer cleaner: delete the load balancers without targets.
+
+Load balancers reach their targets through target groups, which listeners (of
+one or several load balancers) share. The target groups of the region are
+listed once, each holding the ARNs of the load balancers it is attached to.
+The listeners of each load balancer are described too, with the rules of the
+Application load balancer listeners: a rule may forward to other target groups
+than the default action of its listener, and a listener or rule redirecting
+(e.g. HTTP to HTTPS) or returning a fixed response serves traffic without any
+target group. The health of each target group in use is then described once,
+concurrently: the number of calls grows with the number of load balancers,
+listeners and target groups, not with their product.
+
+A load balancer is deleted when it has no listener, or when all the actions of
+its listeners and rules forward to target groups and none of these target groups
+has a target. The other load balancers without a healthy target are reported.
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+
+from clients import TASK_CALL_WORKERS, get_client
+from inventory import iter_listener_rules, iter_listeners, iter_target_groups, iter_v2_load_balancers
+from plan import new_action
+from policy import PolicyResource
+from cleaners.common import apply_each, carry_out, is_protected, notify, select_resources, to_epoch
+
+
+DESCRIBE_WORKERS = TASK_CALL_WORKERS
+# Listener actions that only pass requests on to target groups, authenticating them first or not
+FORWARD_ACTIONS = {'forward', 'authenticate-oidc', 'authenticate-cognito'}
+# Protocols of the listeners having rules besides their default actions (Application load balancers)
+RULE_PROTOCOLS = {'HTTP', 'HTTPS'}
+
+
+def delete_empty_v2_load_balancers(regions):
+    """
+    Delete all Application, Network and Gateway load balancers without registered targets
+    in all the regions in the input
+
+    :param regions: List of AWS region names
+    """
+    for region in regions:
+        delete_empty_v2_load_balancers_in_region(region)
+
+def delete_empty_v2_load_balancers_in_region(region):
+    """
+    Delete the load balancers without registered targets in a specific region,
+    and notify about the ones whose targets are all unhealthy
+
+    :param region: AWS region name
+    """
+    elbv2 = get_client('elbv2', region)
+    candidates = [PolicyResource(lb['LoadBalancerArn'], lb['LoadBalancerName'], attributes={'type': lb.get('Type')},
+                                 created=to_epoch(lb.get('CreatedTime')))
+                  for lb in iter_v2_load_balancers(elbv2)
+                  if not is_protected(region, 'elasticloadbalancing', lb['LoadBalancerArn'])]
+    load_balancers = {lb.id: lb.name for lb in select_resources('elbv2', region, candidates, 'elbv2', 'delete')}
+    if not load_balancers:
+        return
+
+    target_groups = {}
+    for target_group in iter_target_groups(elbv2):
+        for lb_arn in target_group.get('LoadBalancerArns', []):
+            if lb_arn in load_balancers:
+                target_groups.setdefault(lb_arn, set()).add(target_group['TargetGroupArn'])
+    listener_actions = get_listener_actions(elbv2, set(load_balancers))
+    # The target groups the listeners and their rules forward to, whether listed above or not
+    for lb_arn, described in listener_actions.items():
+        if described is not None:
+            target_groups.setdefault(lb_arn, set()).update(described[1])
+    health = get_target_health(elbv2, {arn for arns in target_groups.values() for arn in arns})
+
+    load_balancers_to_delete = []
+    for lb_arn, lb_name in load_balancers.items():
+        states = [health[arn] for arn in target_groups.get(lb_arn, [])]
+        if None in states or listener_actions[lb_arn] is None:
+            # The health of one of its target groups or its listeners are unknown, keep it
+            continue
+        actions = listener_actions[lb_arn][0]
+        states = [state for target_group_states in states for state in target_group_states]
+        if 'healthy' in states:
+            continue
+        if not actions or (not states and actions <= FORWARD_ACTIONS):
+            load_balancers_to_delete.append(new_action('elbv2', region, 'delete', lb_arn, name=lb_name))
+        elif not actions <= FORWARD_ACTIONS:
+            print(f'[INFO]: Load balancer {lb_name} has no healthy target, but listeners with '
+                  f'{", ".join(sorted(actions - FORWARD_ACTIONS))} actions')
+            notify('elbv2', region, lb_name, 'delete')
+        else:
+            print(f'[INFO]: Load balancer {lb_name} has no healthy target')
+            notify('elbv2', region, lb_name, 'delete')
+    carry_out('elbv2', region, load_balancers_to_delete, delete_v2_load_balancers)
+
+def get_target_health(elbv2, target_group_arns):
+    """
+    Describe the health of target groups, each once, with bounded concurrency
+
+    :param elbv2: ELBv2 client
+    :param target_group_arns: Set of target group ARNs
+    :return: Dict of target group ARN to the list of its target states, None if it couldn't be described
+    """
+    def describe(arn):
+        try:
+            response = elbv2.describe_target_health(TargetGroupArn=arn)
+        except Exception as e:
+            print(f'[ERROR]: Failed to describe the health of target group {arn}. Error: {e}')
+            return None
+        return [target['TargetHealth']['State'] for target in response['TargetHealthDescriptions']]
+
+    return describe_each(describe, target_group_arns)
+
+def get_listener_actions(elbv2, lb_arns):
+    """
+    Describe the listeners of load balancers and their rules, each load balancer once, with bounded concurrency
+
+    :param elbv2: ELBv2 client
+    :param lb_arns: Set of load balancer ARNs
+    :return: Dict of load balancer ARN to a tuple of (set of the types of the actions of its listeners and rules,
+             set of the ARNs of the target groups they forward to), None if they couldn't be described
+    """
+    def describe(arn):
+        types = set()
+        target_groups = set()
+        try:
+            for listener in iter_listeners(elbv2, arn):
+                actions = list(listener.get('DefaultActions', []))
+                if listener.get('Protocol') in RULE_PROTOCOLS:
+                    # The default rule repeats the default actions, the others route requests elsewhere
+                    for rule in iter_listener_rules(elbv2, listener['ListenerArn']):
+                        if not rule.get('IsDefault'):
+                            actions += rule.get('Actions', [])
+                for action in actions:
+                    types.add(action['Type'])
+                    target_groups.update(forward_target_groups(action))
+        except Exception as e:
+            print(f'[ERROR]: Failed to describe the listeners of load balancer {arn}. Error: {e}')
+            return None
+        return types, target_groups
+
+    return describe_each(describe, lb_arns)
+
+def forward_target_groups(action):
+    """
+    :param action: Action of a listener or rule
+    :return: Set of the ARNs of the target groups it forwards to
+    """
+    arns = {group['TargetGroupArn'] for group in action.get('ForwardConfig', {}).get('TargetGroups', [])}
+    if action.get('TargetGroupArn'):
+        arns.add(action['TargetGroupArn'])
+    return arns
+
+def describe_each(describe, arns):
+    """
+    Call a describe function on every ARN of a set, with bounded concurrency
+
+    :param describe: Function of an ARN to its description
+    :param arns: Set of ARNs
+    :return: Dict of ARN to its description
+    """
+    arns = sorted(arns)
+    if not arns:
+        return {}
+    with ThreadPoolExecutor(max_workers=min(DESCRIBE_WORKERS, len(arns))) as executor:
+        return dict(zip(arns, executor.map(describe, arns)))
+
+def delete_v2_load_balancers(region, actions):
+    """
+    Delete Application, Network and Gateway load balancers in a specific region
+
+    :param region: AWS region name
+    :param actions: List of planned 'delete' actions, on load balancer ARNs
+    """
+    elbv2 = get_client('elbv2', region)
+    batch_results = apply_each(lambda action: elbv2.delete_load_balancer(LoadBalancerArn=action.resource_id),
+                               'elbv2', region, actions)
+    names = {action.resource_id: action.name for action in actions}
+    for lb_arn, error in batch_results.items():
+        if error is None:
+            print(f'[INFO]: Deleted load balancer: {names[lb_arn]}')
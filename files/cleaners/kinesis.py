@@ -0,0 +1,56 @@
+"""
+Kinesis cleaner: delete the data streams.
+"""
+
+from clients import get_client
+from inventory import iter_kinesis_streams
+from plan import new_action
+from policy import PolicyResource
+import results
+from cleaners.common import apply_each, carry_out, is_protected, select_resources
+
+
+def delete_kinesis_stream(regions):
+    """Delete Kinesis stream
+
+    :param regions: List of AWS region names
+    """
+
+    print("====== Kinesis Streams ======")
+    for region in regions:
+        delete_kinesis_stream_in_region(region)
+
+def delete_kinesis_stream_in_region(region):
+    """Delete Kinesis streams in a specific region
+
+    :param region: AWS region name
+    """
+    print(f'[INFO]: Getting all Kinesis streams in the region: {region}')
+    kinesis_client = get_client('kinesis', region)
+    streams = [PolicyResource(streamName, streamName) for streamName in iter_kinesis_streams(kinesis_client)
+               if not is_protected(region, 'kinesis', streamName)]
+    streams_to_delete = [new_action('kinesis', region, 'delete', stream.id)
+                         for stream in select_resources('kinesis', region, streams, 'kinesis', 'delete')]
+    carry_out("kinesis", region, streams_to_delete, delete_streams)
+
+def delete_streams(region, actions):
+    """Delete Kinesis streams in a specific region
+
+    :param region: AWS region name
+    :param actions: List of planned 'delete' actions, on stream names
+    """
+    kinesis_client = get_client('kinesis', region)
+    for action in actions:
+        print(f'[INFO]: Deleting Stream: {action.resource_id}')
+    apply_each(lambda action: kinesis_client.delete_stream(StreamName=action.resource_id, EnforceConsumerDeletion=True),
+               "kinesis", region, actions, check=check_streams)
+
+def check_streams(region, actions):
+    """Check the deletion of Kinesis streams, from one listing of the region
+
+    :param region: AWS region name
+    :param actions: List of accepted 'delete' actions, on stream names
+    :return: Dict of stream name to DONE once gone, None while being deleted
+    """
+    remaining = set(iter_kinesis_streams(get_client('kinesis', region)))
+    return {action.resource_id: None if action.resource_id in remaining else results.DONE for action in actions}
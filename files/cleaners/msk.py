@@ -0,0 +1,62 @@
+"""
+MSK cleaner: delete the active clusters.
+"""
+
+from clients import get_client
+from inventory import iter_msk_clusters
+from plan import new_action
+from policy import PolicyResource
+import results
+from cleaners.common import apply_each, carry_out, is_protected, select_resources, to_epoch
+
+
+def delete_msk_clusters(regions):
+    """Delete MSK clusters
+
+    :param regions: List of AWS region names
+    """
+
+    print("====== MSK Clusters ======")
+    for region in regions:
+        delete_msk_clusters_in_region(region)
+
+def delete_msk_clusters_in_region(region):
+    """Delete active MSK clusters in a specific region
+
+    :param region: AWS region name
+    """
+    print(f'[INFO]: Getting all MSK clusters in the region: {region}')
+    kafka_client = get_client('kafka', region)
+    clusters = [PolicyResource(cluster['ClusterArn'], cluster['ClusterName'], cluster.get('Tags') or {},
+                               {'type': cluster.get('ClusterType')}, to_epoch(cluster.get('CreationTime')))
+                for cluster in iter_msk_clusters(kafka_client)
+                if cluster['State'] == 'ACTIVE' and not is_protected(region, 'kafka', cluster['ClusterArn'])]
+    clusters_to_delete = [new_action('msk', region, 'delete', cluster.id, name=cluster.name)
+                          for cluster in select_resources('msk', region, clusters, 'msk', 'delete')]
+    carry_out("msk", region, clusters_to_delete, delete_clusters)
+
+def delete_clusters(region, actions):
+    """Delete MSK clusters in a specific region
+
+    :param region: AWS region name
+    :param actions: List of planned 'delete' actions, on cluster ARNs
+    """
+    kafka_client = get_client('kafka', region)
+    for action in actions:
+        print(f'[INFO]: Deleting MSK cluster: {action.name}')
+    apply_each(lambda action: kafka_client.delete_cluster(ClusterArn=action.resource_id), "msk", region, actions,
+               check=check_clusters)
+
+def check_clusters(region, actions):
+    """Check the deletion of MSK clusters, from one listing of the region
+
+    :param region: AWS region name
+    :param actions: List of accepted 'delete' actions, on cluster ARNs
+    :return: Dict of cluster ARN to DONE once gone, FAILED if the deletion failed, None while being deleted
+    """
+    states = {cluster['ClusterArn']: cluster['State'] for cluster in iter_msk_clusters(get_client('kafka', region))}
+    outcomes = {}
+    for action in actions:
+        state = states.get(action.resource_id)
+        outcomes[action.resource_id] = results.DONE if state is None else results.FAILED if state == 'FAILED' else None
+    return outcomes
@@ -0,0 +1,65 @@
+"""
+OpenSearch cleaner: delete the domains.
+"""
+
+from batching import DESCRIBE_DOMAINS_CHUNK_SIZE, chunked
+from clients import get_client
+from inventory import iter_opensearch_domains
+from plan import new_action
+from policy import PolicyResource
+import results
+from cleaners.common import apply_each, carry_out, is_protected, select_resources
+
+
+def delete_domain(regions):
+    """Delete OpenSearch domains
+
+    :param regions: List of AWS region names
+    """
+
+    print("====== OpenSearch domains ======")
+
+    for region in regions:
+        delete_domain_in_region(region)
+
+def delete_domain_in_region(region):
+    """Delete OpenSearch domains in a specific region
+
+    :param region: AWS region name
+    """
+    print(f'[INFO]: Getting all OpenSearch domains in the region: {region}')
+    domain_client = get_client('opensearch', region)
+    domains = [PolicyResource(domain_name, domain_name) for domain_name in iter_opensearch_domains(domain_client)
+               if not is_protected(region, 'es', domain_name)]
+    domains_to_delete = [new_action('opensearch', region, 'delete', domain.id)
+                         for domain in select_resources('opensearch', region, domains, 'opensearch', 'delete')]
+    carry_out("opensearch", region, domains_to_delete, delete_domains)
+
+def delete_domains(region, actions):
+    """Delete OpenSearch domains in a specific region
+
+    :param region: AWS region name
+    :param actions: List of planned 'delete' actions, on domain names
+    """
+    domain_client = get_client('opensearch', region)
+    for action in actions:
+        print(f'[INFO]: Deleting OpenSearch domains: {action.resource_id}')
+    apply_each(lambda action: domain_client.delete_domain(DomainName=action.resource_id), "opensearch", region, actions,
+               check=check_domains)
+
+def check_domains(region, actions):
+    """Check the deletion of OpenSearch domains, a few domains per call
+
+    :param region: AWS region name
+    :param actions: List of accepted 'delete' actions, on domain names
+    :return: Dict of domain name to DONE once gone, None while being deleted
+    """
+    domain_client = get_client('opensearch', region)
+    outcomes = {}
+    for names in chunked([action.resource_id for action in actions], DESCRIBE_DOMAINS_CHUNK_SIZE):
+        response = domain_client.describe_domains(DomainNames=names)
+        # Deleted domains are left out of the response
+        remaining = {domain['DomainName'] for domain in response['DomainStatusList']}
+        for name in names:
+            outcomes[name] = None if name in remaining else results.DONE
+    return outcomes
@@ -0,0 +1,102 @@
+"""
+RDS cleaner: stop the available DB clusters and instances.
+"""
+
+from batching import RDS_FILTER_CHUNK_SIZE, chunked
+from clients import get_client
+from inventory import RDS_PAGE_SIZE, iter_db_clusters, iter_db_instances, paginate
+from plan import new_action
+from policy import PolicyResource
+import results
+from cleaners.common import apply_each, carry_out, is_protected, select_resources, tags_to_dict, to_epoch
+
+
+def stop_rds(regions):
+    """Stops RDS clusters and instances
+
+    This will stop all RDS clusters and instances in all the regions in the input
+
+    :param regions: List of AWS region names
+    """
+
+    print("====== RDS Clusters/Instances ======")
+
+    for region in regions:
+        stop_rds_in_region(region)
+
+def stop_rds_in_region(region):
+    """Stops RDS clusters and instances in a specific region
+
+    :param region: AWS region name
+    """
+    print(f'[INFO]: Getting RDS clusters and instances in region: {region}')
+    rds_specific_region = get_client('rds', region)
+    databases = []
+    for cluster in iter_db_clusters(rds_specific_region):
+        if cluster['Status'] == 'available' and not is_protected(region, 'rds', cluster['DBClusterArn']):
+            databases.append(PolicyResource(cluster['DBClusterIdentifier'], cluster['DBClusterIdentifier'],
+                                            tags_to_dict(cluster.get('TagList')),
+                                            {'kind': 'cluster', 'engine': cluster.get('Engine')},
+                                            to_epoch(cluster.get('ClusterCreateTime'))))
+
+    for instance in iter_db_instances(rds_specific_region):
+        if instance['DBInstanceStatus'] == 'available' and not is_protected(region, 'rds', instance['DBInstanceArn']):
+            databases.append(PolicyResource(instance['DBInstanceIdentifier'], instance['DBInstanceIdentifier'],
+                                            tags_to_dict(instance.get('TagList')),
+                                            {'kind': 'instance', 'engine': instance.get('Engine')},
+                                            to_epoch(instance.get('InstanceCreateTime'))))
+
+    databases_to_stop = []
+    for database in select_resources('rds', region, databases, 'rds', 'stop'):
+        cluster = database.attributes['kind'] == 'cluster'
+        print(f'[INFO]: Stopping DB {database.attributes["kind"]}: {database.id}')
+        databases_to_stop.append(new_action('rds', region, 'stop', database.id, args={'cluster': True} if cluster else None))
+    carry_out("rds", region, databases_to_stop, stop_databases)
+
+def stop_databases(region, actions):
+    """Stops RDS clusters and instances in a specific region
+
+    :param region: AWS region name
+    :param actions: List of planned 'stop' actions, on clusters when their cluster argument is set
+    """
+    rds_specific_region = get_client('rds', region)
+
+    def stop(action):
+        if (action.args or {}).get('cluster'):
+            rds_specific_region.stop_db_cluster(DBClusterIdentifier=action.resource_id)
+        else:
+            rds_specific_region.stop_db_instance(DBInstanceIdentifier=action.resource_id)
+
+    apply_each(stop, "rds", region, actions, check=check_databases)
+
+def check_databases(region, actions):
+    """Check the stop of RDS clusters and instances, filtering the descriptions on their identifiers
+
+    :param region: AWS region name
+    :param actions: List of accepted 'stop' actions, on clusters when their cluster argument is set
+    :return: Dict of identifier to DONE once stopped (or gone), FAILED if the database failed, None while stopping
+    """
+    rds_specific_region = get_client('rds', region)
+    clusters = [action.resource_id for action in actions if (action.args or {}).get('cluster')]
+    instances = [action.resource_id for action in actions if not (action.args or {}).get('cluster')]
+    statuses = {}
+    for identifiers in chunked(clusters, RDS_FILTER_CHUNK_SIZE):
+        for page in paginate(rds_specific_region, 'describe_db_clusters', RDS_PAGE_SIZE,
+                             Filters=[{'Name': 'db-cluster-id', 'Values': identifiers}]):
+            statuses.update((cluster['DBClusterIdentifier'], cluster['Status']) for cluster in page['DBClusters'])
+    for identifiers in chunked(instances, RDS_FILTER_CHUNK_SIZE):
+        for page in paginate(rds_specific_region, 'describe_db_instances', RDS_PAGE_SIZE,
+                             Filters=[{'Name': 'db-instance-id', 'Values': identifiers}]):
+            statuses.update((instance['DBInstanceIdentifier'], instance['DBInstanceStatus'])
+                            for instance in page['DBInstances'])
+
+    outcomes = {}
+    for action in actions:
+        status = statuses.get(action.resource_id)
+        if status in (None, 'stopped'):
+            outcomes[action.resource_id] = results.DONE
+        elif status in ('failed', 'inaccessible-encryption-credentials', 'incompatible-parameters'):
+            outcomes[action.resource_id] = results.FAILED
+        else:
+            outcomes[action.resource_id] = None
+    return outcomes
@@ -0,0 +1,181 @@
+"""
+Thread-safe registry of boto3 clients keyed by (account, service, region).
+
+Clients live at module level, so a warm Lambda container reuses them across
+invocations and every run pays for client setup only once. The same goes for
+the sessions of member accounts, whose assumed-role credentials are refreshed
+before they expire.
+"""
+
+import inspect
+import os
+import threading
+
+import boto3
+from botocore.config import Config
+
+from accounts import assume_role_session, current_account
+
+
+# Default account of get_client: the account of the current task
+CURRENT_ACCOUNT = object()
+
+# Maximum number of threads a task makes its API calls from (see batching.py and cleaners/elbv2.py)
+TASK_CALL_WORKERS = 8
+
+_lock = threading.Lock()
+_sessions = {}
+_clients = {}
+_client_hooks = []
+_account_roles = {}
+
+
+def client_config():
+    """
+    Build the botocore configuration shared by all clients.
+
+    A client is shared by every task of its account, service and region (the
+    ec2 client of a region serves the ec2-tag, ec2-stop, ebs and eip tasks),
+    so up to MAX_WORKERS tasks use it at once, each calling from up to
+    TASK_CALL_WORKERS threads; the completion poller runs fewer calls, one per
+    worker. The connection pool holds that many connections, so none is
+    discarded; urllib3 only opens them when needed.
+
+    :return: botocore Config.
+    """
+    return Config(
+        max_pool_connections=int(os.environ.get('MAX_WORKERS', '10')) * TASK_CALL_WORKERS,
+        tcp_keepalive=True,
+        retries={'mode': 'standard', 'max_attempts': 5},
+    )
+
+
+def register_client_hook(hook):
+    """
+    Register a function called with (client, region, account) on every new
+    client, e.g. to attach botocore event handlers.
+
+    :param hook: Function to call.
+    :return: None
+    """
+    if hook not in _client_hooks:
+        _client_hooks.append(hook)
+
+
+def register_account(account, role_arn):
+    """
+    Declare the role to assume to reach a member account.
+
+    :param account: Account identifier.
+    :param role_arn: ARN of the role to assume in the account.
+    :return: None
+    """
+    with _lock:
+        if _account_roles.get(account) != role_arn:
+            _account_roles[account] = role_arn
+            _sessions.pop(account, None)
+            for key in [key for key in _clients if key[0] == account]:
+                del _clients[key]
+
+
+def get_session(account=None):
+    """
+    Get the boto3 session of an account.
+
+    boto3 sessions are not thread-safe, so the caller must hold the registry lock.
+
+    :param account: Account identifier, None for the Lambda's own credentials.
+    :return: boto3 Session.
+    """
+    session = _sessions.get(account)
+    if session is None:
+        if account is None:
+            session = boto3.session.Session()
+        else:
+            sts = create_client(get_session(None), 'sts', os.environ.get('AWS_REGION'), None)
+            session = assume_role_session(_account_roles[account], sts)
+        _sessions[account] = session
+    return session
+
+
+def create_client(session, service, region, account):
+    """
+    Create a client and run the client hooks on it.
+
+    :param session: boto3 Session of the account.
+    :param service: AWS service name.
+    :param region: AWS region name.
+    :param account: Account identifier, passed to the hooks.
+    :return: boto3 client.
+    """
+    client = session.client(service, region_name=region, config=client_config())
+    run_client_hooks(client, region, account)
+    return client
+
+
+def run_client_hooks(client, region, account):
+    """
+    Run the client hooks on a client, including the ones created outside this registry (see async_scan.py).
+
+    :param client: boto3 or aiobotocore client.
+    :param region: AWS region name.
+    :param account: Account identifier, passed to the hooks.
+    :return: None
+    """
+    for hook in _client_hooks:
+        hook(client, region, account)
+
+
+def is_async_client(client):
+    """
+    :param client: boto3 or aiobotocore client.
+    :return: True for an aiobotocore client, whose event handlers may be coroutines and must not block.
+    """
+    return inspect.iscoroutinefunction(client._make_api_call)
+
+
+def get_credentials(account=None):
+    """
+    Get the current credentials of an account, for clients created outside this registry.
+
+    :param account: Account identifier, None for the Lambda's own credentials.
+    :return: botocore ReadOnlyCredentials.
+    """
+    with _lock:
+        session = get_session(account)
+    return session.get_credentials().get_frozen_credentials()
+
+
+def get_client(service, region, account=CURRENT_ACCOUNT):
+    """
+    Get a cached client, creating it on first use.
+
+    :param service: AWS service name (e.g. 'ec2').
+    :param region: AWS region name.
+    :param account: Account identifier, None for the Lambda's own credentials.
+                    Defaults to the account of the current task (see accounts.py).
+    :return: boto3 client.
+    """
+    if account is CURRENT_ACCOUNT:
+        account = current_account()
+    key = (account, service, region)
+    client = _clients.get(key)
+    if client is None:
+        with _lock:
+            client = _clients.get(key)
+            if client is None:
+                client = create_client(get_session(account), service, region, account)
+                _clients[key] = client
+    return client
+
+
+def clear_clients():
+    """
+    Drop every cached session and client.
+
+    :return: None
+    """
+    with _lock:
+        _clients.clear()
+        _sessions.clear()
+        _account_roles.clear()
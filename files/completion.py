@@ -0,0 +1,136 @@
+"""
+Completion tracker of the long-running changes.
+
+Deleting an OpenSearch domain, an MSK cluster or a Kinesis stream, stopping a
+database or scaling a node group in are accepted by AWS right away but carried
+out over minutes, and may still fail. The appliers hand the accepted actions
+over to the tracker instead of reporting them done; at the end of the cleanup,
+the tracked resources are polled with the batched status call of each service,
+every service on the same backoff schedule, until they complete or the time
+budget of the invocation runs out. Each resource is then reported with its
+confirmed outcome: DONE, FAILED, or PENDING when it didn't complete in time.
+"""
+
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from accounts import account_context
+import results
+
+
+POLL_INITIAL_DELAY = 2
+POLL_MAX_DELAY = 30
+DEFAULT_COMPLETION_WAIT_SECONDS = 300
+POLL_WORKERS = 10
+
+_lock = threading.Lock()
+# (account, service, region, check) -> {resource ID: (Action, latency of the call that started it)}
+_tracked = {}
+
+
+def track(service, region, actions, check, latencies=None):
+    """
+    Wait for the completion of accepted actions before reporting them.
+
+    :param service: Name of the AWS service to report the actions under.
+    :param region: AWS region name.
+    :param actions: List of Action (see plan.py) accepted by AWS.
+    :param check: Function taking the region and a list of tracked Action, returning a dict of
+                  resource ID to DONE or FAILED, or to None while the action is in progress.
+    :param latencies: Dict of resource ID to the duration of the call that started its action, reported with it.
+    :return: None
+    """
+    latencies = latencies or {}
+    with _lock:
+        for action in actions:
+            _tracked.setdefault((action.account, service, region, check), {})[action.resource_id] = (
+                action, latencies.get(action.resource_id))
+
+
+def clear_tracked():
+    """
+    Drop the actions tracked by a previous invocation.
+
+    :return: None
+    """
+    with _lock:
+        _tracked.clear()
+
+
+def poll(group):
+    """
+    Check the tracked actions of one (account, service, region) and record the completed ones.
+
+    :param group: Key of the group in the tracked actions.
+    :return: None
+    """
+    account, service, region, check = group
+    with _lock:
+        tracked = list(_tracked[group].values())
+    actions = [action for action, _ in tracked]
+    with account_context(account):
+        try:
+            outcomes = check(region, actions)
+        except Exception as e:
+            # Polled again in the next round
+            print(f'[ERROR]: Failed to check {service} resources in {region}. Error: {e}')
+            return
+        for action, latency in tracked:
+            outcome = outcomes.get(action.resource_id)
+            if outcome is None:
+                continue
+            name = action.name or action.resource_id
+            if outcome == results.FAILED:
+                print(f'[ERROR]: Failed to {action.action} {service} resource: {name}')
+            results.record(service, region, name, action.action, outcome, latency)
+            with _lock:
+                del _tracked[group][action.resource_id]
+    with _lock:
+        if not _tracked[group]:
+            del _tracked[group]
+
+
+def wait_for_completion(time_left=None, reserve=0, max_workers=POLL_WORKERS):
+    """
+    Poll the tracked actions until they all complete, or the time budget runs out.
+
+    Polls start after POLL_INITIAL_DELAY seconds and back off up to POLL_MAX_DELAY
+    seconds, all the services being polled together in each round. The wait is bounded
+    by COMPLETION_WAIT_SECONDS and by the time left in the invocation, minus the reserve.
+
+    :param time_left: Function returning the seconds left in the invocation, None when unbounded.
+    :param reserve: Seconds to keep for the end of the invocation.
+    :param max_workers: Maximum number of groups polled at the same time.
+    :return: Number of actions still in progress, reported as PENDING.
+    """
+    max_wait = float(os.environ.get('COMPLETION_WAIT_SECONDS', DEFAULT_COMPLETION_WAIT_SECONDS))
+    deadline = time.monotonic() + max_wait
+    delay = POLL_INITIAL_DELAY
+    polls = 0
+    while _tracked:
+        budget = deadline - time.monotonic()
+        if time_left is not None:
+            budget = min(budget, time_left() - reserve)
+        if budget < delay:
+            break
+        time.sleep(delay)
+        with _lock:
+            groups = list(_tracked)
+        with ThreadPoolExecutor(max_workers=min(max_workers, len(groups))) as executor:
+            list(executor.map(poll, groups))
+        polls += 1
+        delay = min(delay * 2, POLL_MAX_DELAY)
+
+    with _lock:
+        left = list(_tracked.items())
+        _tracked.clear()
+    for (account, service, region, _), actions in left:
+        with account_context(account):
+            for action, latency in actions.values():
+                results.record(service, region, action.name or action.resource_id, action.action, results.PENDING,
+                               latency)
+    pending = sum(len(actions) for _, actions in left)
+    print(f'[INFO]: Checked the long-running actions in {polls} polls, {pending} still in progress')
+    return pending
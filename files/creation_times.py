@@ -0,0 +1,84 @@
+"""
+Bulk resolution of resource creation times from AWS Config.
+
+Creation times never change, so every resolved time is kept in a persistent
+cache (see store.py) and AWS Config is only asked about resources it hasn't
+answered for yet, up to 100 resources per batch_get_resource_config call.
+"""
+
+from datetime import datetime
+
+from accounts import current_account
+from batching import chunked
+from clients import get_client
+from store import get_store
+
+
+# Maximum number of resource keys per batch_get_resource_config call
+CONFIG_BATCH_SIZE = 100
+CONFIG_MAX_ATTEMPTS = 3
+
+
+def cache_key(region):
+    return f'creation-times/{current_account() or "default"}/{region}.json'
+
+
+def fetch_creation_times(config, resource_ids, resource_type, creation_times=None):
+    """
+    Fetch creation times from AWS Config in batches.
+
+    :param config: Config client.
+    :param resource_ids: List of resource IDs.
+    :param resource_type: AWS Config resource type (e.g. 'AWS::EC2::Instance').
+    :param creation_times: Dict updated after each batch, so it keeps the times already fetched if a batch fails.
+    :return: Dict of resource ID to creation time as an ISO 8601 string.
+    """
+    creation_times = {} if creation_times is None else creation_times
+    for chunk in chunked(resource_ids, CONFIG_BATCH_SIZE):
+        resource_keys = [{'resourceType': resource_type, 'resourceId': resource_id} for resource_id in chunk]
+        for _ in range(CONFIG_MAX_ATTEMPTS):
+            response = config.batch_get_resource_config(resourceKeys=resource_keys)
+            for item in response['baseConfigurationItems']:
+                if 'resourceCreationTime' in item:
+                    creation_times[item['resourceId']] = item['resourceCreationTime'].isoformat()
+            resource_keys = response.get('unprocessedResourceKeys')
+            if not resource_keys:
+                break
+    return creation_times
+
+
+def resolve_creation_times(region, resource_ids, resource_type='AWS::EC2::Instance'):
+    """
+    Get the creation time of resources, from the cache or from AWS Config.
+
+    Resources unknown to AWS Config are left out of the result.
+
+    :param region: AWS region name.
+    :param resource_ids: List of resource IDs.
+    :param resource_type: AWS Config resource type.
+    :return: Tuple of (dict of resource ID to creation time (datetime),
+             set of the IDs AWS Config was asked about and doesn't know).
+    """
+    store = get_store()
+    key = cache_key(region)
+    cache = store.get_json(key, default={})
+
+    missing = [resource_id for resource_id in resource_ids if resource_id not in cache]
+    unknown = set()
+    if missing:
+        print(f'[INFO]: Resolving creation time of {len(missing)} resources in {region} '
+              f'({len(resource_ids) - len(missing)} cached)')
+        try:
+            fetch_creation_times(get_client('config', region), missing, resource_type, cache)
+            unknown = {resource_id for resource_id in missing if resource_id not in cache}
+        except Exception as e:
+            # The times fetched before the error are in the cache, and saved below
+            print(f'[ERROR]: Failed to get creation times from AWS Config in {region}. Error: {e}')
+
+    # Only keep the resources that still need a creation time, the others have been tagged
+    cache = {resource_id: cache[resource_id] for resource_id in resource_ids if resource_id in cache}
+    if missing:
+        store.put_json(key, cache)
+
+    creation_times = {resource_id: datetime.fromisoformat(created_on) for resource_id, created_on in cache.items()}
+    return creation_times, unknown
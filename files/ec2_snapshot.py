@@ -0,0 +1,79 @@
+"""
+Single-pass EC2 snapshot shared by every EC2 action.
+
+The instances of a region (of an account) are described once per run; stopping, unmonitoring
+and tagging all build their target lists from the same snapshot. Every instance is also
+compared with the previous run's inventory (see inventory_snapshot.py).
+"""
+
+import threading
+from collections import namedtuple
+
+from accounts import current_account
+from clients import get_client
+from inventory import iter_instances
+from inventory_snapshot import get_inventory_snapshot
+
+
+InstanceRecord = namedtuple('InstanceRecord', ['instance_id', 'state', 'lifecycle', 'tags', 'monitoring', 'launch_time'])
+
+# Terminated instances can't be acted upon, no need to keep them in memory
+SNAPSHOT_STATES = ['pending', 'running', 'stopping', 'stopped']
+
+_lock = threading.Lock()
+_region_locks = {}
+_snapshots = {}
+
+
+def to_record(instance):
+    """
+    Convert an instance description to a compact snapshot record.
+
+    :param instance: Instance description returned by describe_instances.
+    :return: InstanceRecord.
+    """
+    return InstanceRecord(
+        instance_id=instance['InstanceId'],
+        state=instance['State']['Name'],
+        lifecycle=instance.get('InstanceLifecycle', 'on-demand'),
+        tags={tag['Key']: tag['Value'] for tag in instance.get('Tags', [])},
+        monitoring=instance.get('Monitoring', {}).get('State', 'disabled'),
+        launch_time=instance['LaunchTime'].timestamp() if instance.get('LaunchTime') else None,
+    )
+
+
+def get_ec2_snapshot(region):
+    """
+    Get the EC2 snapshot of a region, describing the instances on first use.
+
+    Concurrent callers for the same region wait for the first scan instead of
+    starting their own.
+
+    :param region: AWS region name.
+    :return: List of InstanceRecord.
+    """
+    key = (current_account(), region)
+    with _lock:
+        region_lock = _region_locks.setdefault(key, threading.Lock())
+    with region_lock:
+        snapshot = _snapshots.get(key)
+        if snapshot is None:
+            ec2 = get_client('ec2', region)
+            snapshot = [to_record(instance) for instance in iter_instances(ec2, states=SNAPSHOT_STATES)]
+            _snapshots[key] = snapshot
+            inventory = get_inventory_snapshot(region, 'ec2')
+            for record in snapshot:
+                inventory.observe(record.instance_id, record.state, record.tags)
+            print(f'[INFO]: EC2 snapshot of {region}: {len(snapshot)} instances')
+    return snapshot
+
+
+def clear_ec2_snapshots():
+    """
+    Drop every snapshot, so the next run describes the instances again.
+
+    :return: None
+    """
+    with _lock:
+        _snapshots.clear()
+        _region_locks.clear()
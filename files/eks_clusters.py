@@ -0,0 +1,57 @@
+"""
+Per-run cache of the live EKS clusters of each region (of each account).
+
+The clusters of a region are listed once per run, after which checking whether
+a cluster exists is an in-memory set lookup.
+"""
+
+import threading
+
+from accounts import current_account
+from clients import get_client
+from inventory import iter_eks_clusters
+
+
+_lock = threading.Lock()
+_region_locks = {}
+_clusters = {}
+
+
+def get_live_eks_clusters(region):
+    """
+    Get the names of the EKS clusters of a region, listing them on first use.
+
+    :param region: AWS region name.
+    :return: frozenset of cluster names.
+    """
+    key = (current_account(), region)
+    with _lock:
+        region_lock = _region_locks.setdefault(key, threading.Lock())
+    with region_lock:
+        clusters = _clusters.get(key)
+        if clusters is None:
+            clusters = frozenset(iter_eks_clusters(get_client('eks', region)))
+            _clusters[key] = clusters
+    return clusters
+
+
+def is_eks_cluster_live(region, cluster_name):
+    """
+    Check whether an EKS cluster exists.
+
+    :param region: AWS region name.
+    :param cluster_name: Name of the EKS cluster.
+    :return: True if the cluster exists.
+    """
+    return cluster_name in get_live_eks_clusters(region)
+
+
+def clear_eks_clusters():
+    """
+    Drop every cached cluster list, so the next run lists the clusters again.
+
+    :return: None
+    """
+    with _lock:
+        _clusters.clear()
+        _region_locks.clear()
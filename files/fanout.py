@@ -0,0 +1,277 @@
+"""
+Sharded fan-out of a cleanup run over several invocations.
+
+With SHARD_BY set to region, service or account, the scheduled invocation is a
+dispatcher: it lists the (account, service, region) tasks of the run as usual,
+splits them into shards and invokes the function again, asynchronously, once
+per shard (see invoker.py), then returns. Each worker invocation runs the tasks
+of its shard and writes its records to the store (see store.py) under
+fanout/<run>/; a worker running out of time writes what it did and invokes a
+continuation for the rest of its shard. The worker finishing the last shard
+claims the aggregation with a conditional write, merges the records of every
+shard and sends the single report, then deletes the state of the run.
+
+Services depending on each other (e.g. ec2-tag before ec2-stop) are always in
+the same shard. Workers share their results through the store, so on Lambda
+fan-out needs the S3 store (STATE_BUCKET).
+"""
+
+import os
+import time
+
+from cleaners import CLEANUP_SERVICES
+from invoker import LambdaInvoker, get_invoker
+from plan import plan_key
+import results
+from scheduler import TaskResult
+from store import LocalFileStore, get_store
+
+
+SHARD_KINDS = ('region', 'service', 'account')
+FANOUT_PREFIX = 'fanout'
+
+
+def get_shard_by():
+    """
+    Read how to split the run from the SHARD_BY environment variable.
+
+    :return: One of SHARD_KINDS, None to run everything in one invocation.
+    """
+    shard_by = os.environ.get('SHARD_BY', '').strip().lower()
+    if not shard_by:
+        return None
+    if shard_by not in SHARD_KINDS:
+        print(f'[ERROR]: Invalid SHARD_BY value "{shard_by}", running without fan-out')
+        return None
+    return shard_by
+
+
+def can_fan_out():
+    """
+    :return: True if workers would share the store: it's S3, or they run in this process.
+    """
+    if isinstance(get_invoker(), LambdaInvoker) and isinstance(get_store(), LocalFileStore):
+        print('[ERROR]: Fan-out needs a state bucket shared by the workers, running without fan-out')
+        return False
+    return True
+
+
+def service_groups():
+    """
+    :return: Dict of service name to the first service (in cleanup order) of the services it depends on or that
+             depend on it, directly or not.
+    """
+    group = {service: service for service in CLEANUP_SERVICES}
+
+    def find(service):
+        while group[service] != service:
+            service = group[service]
+        return service
+
+    order = list(CLEANUP_SERVICES)
+    for service, (_, _, _, depends_on) in CLEANUP_SERVICES.items():
+        for dependency in depends_on:
+            first, second = sorted([find(service), find(dependency)], key=order.index)
+            group[second] = first
+    return {service: find(service) for service in CLEANUP_SERVICES}
+
+
+def shard_tasks(keys, shard_by):
+    """
+    Split the tasks of a run into shards.
+
+    :param keys: List of (account, service, region) of the tasks.
+    :param shard_by: One of SHARD_KINDS.
+    :return: List of shards, each a list of (account, service, region), in the order of the tasks.
+    """
+    groups = service_groups()
+    shards = {}
+    for key in keys:
+        account, service, region = key
+        shard = {'region': region, 'service': groups[service], 'account': account}[shard_by]
+        shards.setdefault(shard, []).append(key)
+    return list(shards.values())
+
+
+def run_id(started):
+    """
+    :param started: Start time of the run (epoch seconds).
+    :return: Identifier of the run in the store keys.
+    """
+    return time.strftime('%Y-%m-%dT%H-%M-%SZ', time.gmtime(started))
+
+
+def manifest_key(run):
+    return f'{FANOUT_PREFIX}/{run}/manifest.json'
+
+
+def result_key(run, index, part):
+    return f'{FANOUT_PREFIX}/{run}/results/{index}.{part}.json'
+
+
+def done_key(run, index):
+    return f'{FANOUT_PREFIX}/{run}/done/{index}'
+
+
+def aggregated_key(run):
+    return f'{FANOUT_PREFIX}/{run}/aggregated'
+
+
+def dispatch(keys, shard_by, started, context=None, payload=None):
+    """
+    Invoke one worker per shard of the run.
+
+    :param keys: List of (account, service, region) of the tasks of the run.
+    :param shard_by: One of SHARD_KINDS.
+    :param started: Start time of the run (epoch seconds).
+    :param context: Lambda context of the dispatcher invocation.
+    :param payload: Dict of extra event fields passed on to the workers (e.g. 'account_role_arns').
+    :return: Identifier of the run.
+    """
+    store = get_store()
+    invoker = get_invoker()
+    shards = shard_tasks(keys, shard_by)
+    run = run_id(started)
+    store.put_json(manifest_key(run), {'started': started, 'shard_by': shard_by, 'shards': len(shards)})
+    for index, shard in enumerate(shards):
+        invoker.invoke(dict(payload or {}, shard={
+            'run': run, 'started': started, 'index': index, 'part': 0, 'tasks': [list(key) for key in shard]}), context)
+    print(f'[INFO]: Dispatched {len(keys)} tasks in {len(shards)} shards by {shard_by}, run {run}')
+    return run
+
+
+def finish_shard(shard, collector, not_started, made_progress, context=None, payload=None):
+    """
+    Save the results of a worker invocation, then continue the shard, or aggregate the run if it was the last shard.
+
+    :param shard: Shard payload of the invocation.
+    :param collector: results.ResultCollector of the invocation.
+    :param not_started: List of (account, service, region) of the tasks the invocation didn't start.
+    :param made_progress: True if the invocation ran at least one task; without progress, the shard isn't continued.
+    :param context: Lambda context of the invocation.
+    :param payload: Dict of extra event fields passed on to a continuation.
+    :return: ResultCollector of the whole run if this invocation aggregated it, None otherwise.
+    """
+    store = get_store()
+    run = shard['run']
+    continued = bool(not_started) and made_progress
+    store.put_json(result_key(run, shard['index'], shard['part']), {
+        'records': [list(record) for record in collector.records()],
+        'plan': collector.extras.get('plan'),
+        # Errors are kept as their message
+        'tasks': [[task.service, task.region, task.duration, task.error and str(task.error), task.account]
+                  for task in collector.extras.get('tasks', [])],
+        'throttling': collector.extras.get('throttling', {}),
+        'not_run': [] if continued else [list(key) for key in not_started],
+        'continued': continued,
+    })
+    if continued:
+        print(f"[INFO]: Invoking a continuation of shard {shard['index']} for {len(not_started)} tasks")
+        get_invoker().invoke(dict(payload or {}, shard=dict(
+            shard, part=shard['part'] + 1, tasks=[list(key) for key in not_started])), context)
+        return None
+
+    # Small markers, so that checking the other shards doesn't read their records
+    store.put(done_key(run, shard['index']), b'')
+    manifest = store.get_json(manifest_key(run))
+    if manifest is None:
+        print(f'[INFO]: Run {run} is already reported')
+        return None
+    if any(store.get(done_key(run, index)) is None for index in range(manifest['shards'])):
+        return None
+    return claim_aggregation(run)
+
+
+def load_shard(store, run, index):
+    """
+    :return: Tuple of (list of the result documents of the invocations of a shard, True if the shard is complete).
+    """
+    documents = []
+    part = 0
+    while True:
+        document = store.get_json(result_key(run, index, part))
+        if document is None:
+            return documents, False
+        documents.append(document)
+        if not document['continued']:
+            return documents, True
+        part += 1
+
+
+def claim_aggregation(run):
+    """
+    Aggregate a run, unless another invocation already did.
+
+    :param run: Identifier of the run.
+    :return: ResultCollector of the whole run, None if it was already aggregated.
+    """
+    # The manifest is deleted once the run is reported (see clean_up)
+    if get_store().get(manifest_key(run)) is None or not get_store().put_if_absent(aggregated_key(run), b''):
+        print(f'[INFO]: Run {run} is already aggregated')
+        return None
+    return aggregate(run)
+
+
+def aggregate(run):
+    """
+    Merge the results of every shard of a run into one collector.
+
+    The collector's extras hold the number of shards that didn't complete and of tasks not run, the
+    tasks and throttled operations of every worker, the plan of the run, to which every worker
+    added its part, for a dry run, and the run and number of invocations of each shard, for clean_up.
+
+    :param run: Identifier of the run.
+    :return: ResultCollector.
+    """
+    store = get_store()
+    manifest = store.get_json(manifest_key(run))
+    collector = results.ResultCollector()
+    missing = 0
+    not_run = 0
+    planned = False
+    tasks = []
+    throttling = {}
+    parts = []
+    for index in range(manifest['shards']):
+        documents, complete = load_shard(store, run, index)
+        missing += not complete
+        parts.append(len(documents))
+        for document in documents:
+            collector.merge(results.Record(*record) for record in document['records'])
+            not_run += len(document['not_run'])
+            tasks += [TaskResult(*task) for task in document['tasks']]
+            for operation, counters in document['throttling'].items():
+                total = throttling.setdefault(operation, {})
+                for name, value in counters.items():
+                    total[name] = round(total.get(name, 0) + value, 3)
+            planned = planned or bool(document['plan'])
+
+    if planned:
+        collector.extras['plan'] = plan_key(manifest['started'])
+    collector.extras['tasks'] = tasks
+    collector.extras['throttling'] = throttling
+    collector.extras['missing_shards'] = missing
+    collector.extras['not_run_tasks'] = not_run
+    collector.extras['run'] = run
+    collector.extras['shard_parts'] = parts
+    print(f"[INFO]: Aggregated {manifest['shards']} shards of run {run}, {missing} incomplete, {not_run} tasks not run")
+    return collector
+
+
+def clean_up(collector):
+    """
+    Delete the state of a run from the store once it is reported: manifest, results of the workers and markers.
+    The plan of a dry run is kept, outside of the fanout/ prefix.
+
+    :param collector: ResultCollector returned by aggregate.
+    :return: None
+    """
+    store = get_store()
+    run = collector.extras['run']
+    for index, parts in enumerate(collector.extras['shard_parts']):
+        for part in range(parts):
+            store.delete(result_key(run, index, part))
+        store.delete(done_key(run, index))
+    store.delete(manifest_key(run))
+    store.delete(aggregated_key(run))
+    print(f'[INFO]: Deleted the state of run {run}')
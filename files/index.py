@@ -1,614 +1,293 @@
-import boto3
-import json
-import os
-
-from send_mail import send_email
-
-
-keep_instances = ['IGNORE']
-keep_tag_key = os.environ['KEEP_TAG_KEY']
-dry_run = os.environ['DRY_RUN']
-from_address = os.environ['EMAIL_IDENTITY']
-to_address = os.environ['TO_ADDRESS']
+"""
+Lambda entry point.
 
+Only the modules the handler itself needs are imported here: the cleaners are
+imported on the first invocation, and only for the enabled services (see
+cleaners/__init__.py), to keep the cold start short.
+"""
 
-USED_REGIONS = [
-    'us-east-1',
-    'us-east-2',
-    'us-west-1',
-    'us-west-2',
-    'eu-central-1',
-    'eu-west-1'
-]
+import time
 
-deleted_resources = []
-skip_delete_resources = []
-notify_resources = []
-check_resources = []
+INIT_STARTED = time.perf_counter()
 
+import json
+import os
+from functools import partial
 
-def process_response(response, service, resource_id):
+from send_mail import send_email
+from accounts import account_context, account_id_from_arn
+from checkpoint import clear_checkpoint, load_checkpoint, save_checkpoint
+from cleaners import CLEANUP_SERVICES, get_enabled_services, load_appliers, load_cleaners
+from clients import register_account, register_client_hook
+from completion import clear_tracked, wait_for_completion
+from ec2_snapshot import clear_ec2_snapshots
+from eks_clusters import clear_eks_clusters
+import fanout
+from inventory import clear_prefetched
+from inventory_snapshot import clear_inventory_snapshots, save_inventory_snapshots
+from invoker import get_invoker
+from keep_index import clear_keep_index
+import metrics
+from plan import clear_plan, group_actions, is_dry_run, load_plan, plan_key, save_plan
+from policy import clear_policy, get_policy
+from regions import USED_REGIONS, get_aws_regions, prune_empty_regions
+import results
+from scheduler import Task, build_tasks, print_task_report, run_tasks, task_key
+import throttle
+
+
+register_client_hook(throttle.install)
+register_client_hook(metrics.install)
+
+INIT_DURATION = time.perf_counter() - INIT_STARTED
+cold_start = True
+
+
+def notify_auto_clean_data(collector=None):
     """
-    Process the response from AWS API calls and keeps track of any deleted or failed resources.
+    Send the email report about the deleted, failed, skipped or notified resources (see send_mail.py).
 
-    :param response: AWS API response.
-    :param service: Name of the AWS service that was called.
-    :param resource_id: ID of the AWS resource that was called.
+    :param collector: results.ResultCollector to report, defaults to the one of the current invocation.
     :return: None
     """
-    if response.get("ResponseMetadata"):
-        status_code = response["ResponseMetadata"]["HTTPStatusCode"]
-        if status_code == 200:
-            deleted_resources.append((service, resource_id))
-        else:
-            check_resources.append((service, resource_id))
+    collector = collector or results.get_collector()
+    for (service, outcome), count in sorted(collector.summary().items()):
+        print(f'[INFO]: {service} {outcome}: {count}')
+    if collector.spilled():
+        print(f'[INFO]: {collector.spilled()} records were spilled to /tmp')
 
-    if response.get("DomainStatus"):
-        deleted = response["DomainStatus"]["Deleted"]
-        if deleted:
-            deleted_resources.append((service, resource_id))
-        else:
-            check_resources.append((service, resource_id))
+    send_email(os.environ['EMAIL_IDENTITY'], os.environ['TO_ADDRESS'], collector)
 
 
-def notify_auto_clean_data():
+def reinvoke(context, payload=None):
     """
-    Send email notifications about the deleted, failed, skipped or notified resources.
+    Invoke this function again, asynchronously, to resume from the checkpoint.
 
+    :param context: Lambda context of the current invocation.
+    :param payload: Dict of extra event fields passed on to the invocation (e.g. 'account_role_arns').
     :return: None
     """
-    print("deleted resources", deleted_resources)
-    print("notify resources", notify_resources)
-    print("check resources", check_resources)
-    print("skip delete resources", skip_delete_resources)
-
-    send_email(from_address, to_address, deleted_resources, skip_delete_resources, notify_resources, check_resources)
-
-
-# Delete EC2 instances
-
-import boto3
-
-def stop_all_instances(regions):
-    """
-    Stop all EC2 instances
-    
-    :param regions: List of AWS region names
-    """
-    print("====== EC2 ======")
-    # Stop instances in each region
-    for region in regions:
-        instances_to_stop = get_instances_in_region(region)
-        if instances_to_stop:
-            if dry_run == 'false':
-                stop_instances(instances_to_stop, region)
-            print(f'[INFO]: Stopped instances: {str(instances_to_stop)}')
-
-def get_instances_in_region(region):
-    """
-    Get all non-spot running instances in a specific region
-    
-    :param region: AWS region name
-    :return: List of instance ids
-    """
-    ec2 = boto3.client('ec2', region_name=region)
-    instances = ec2.describe_instances(
-        Filters=[{'Name': 'instance-state-name', 'Values': ['running']}])
-    instances_to_stop = []
-    for reservation in instances["Reservations"]:
-        for instance in reservation["Instances"]:
-            # Ignore spot instances
-            if 'InstanceLifecycle' in instance and instance['InstanceLifecycle'] == 'spot':
-                continue
-            instance_id = instance["InstanceId"]
-            instance_name = ""
-            if "Tags" in instance:
-                for tag in instance["Tags"]:
-                    if tag.get("auto-deletion") == "skip-resource":
-                        instance_name = tag["Value"]
-            if instance_name not in keep_instances and instance_id not in keep_instances:
-                print(
-                    f'[INFO]: Instance with ID "{instance_id}" and name "{instance_name}" will be stopped.')
-                instances_to_stop.append(instance_id)
-    return instances_to_stop
-    
-def stop_instances(instances_to_stop, region):
-    """
-    Stop a list of instances in a specific region
-    
-    :param instances_to_stop: List of instance ids
-    :param region: AWS region name
-    """
-    ec2 = boto3.client('ec2', region_name=region)
-    ec2.stop_instances(InstanceIds=instances_to_stop)
-
-
-# Unmonitor EC2 instances
-
-import boto3
-
-def unmonitor_all_instances(regions, dry_run=True):
-    """Stop detailed monitoring on all EC2 instances
-
-    This will stop CloudWatch detailed monitoring on all instances 
-    in all the regions in the input
-
-    The dry_run parameter is now optional and it defaults to True.
-
-    :param regions: List of AWS region names
-    :param dry_run: If True, don't actually stop monitoring the instances (default is True)
-    """
-
-    print("====== EC2 - Unmonitor ======")
-
-    # Create an EC2 resource object instead of a client object
-
-    ec2 = boto3.resource('ec2')
-
-    for region in regions:
-        instances_to_unmonitor = []
-        print(f'[INFO]: Getting instances in region: {region}')
-        
-        # Get all instances in the region using the EC2 resource object
-        instances = ec2.instances.filter(Filters=[{'Name': 'instance-state-name', 'Values': ['running']}])
-        
-        for instance in instances:
-            instance_id = instance.instance_id
-            monitor_state = instance.monitoring['State']
-            
-            if monitor_state == 'enabled':
-                print(f'[INFO]: Instance with ID "{instance_id}" will be unmonitored.')
-                instances_to_unmonitor.append(instance_id)
-
-        if instances_to_unmonitor:
-            if not dry_run:
-                # Use the EC2 resource object to unmonitor the instances
-                ec2.instances.filter(InstanceIds=instances_to_unmonitor).monitoring(False)
-            print(f'[INFO]: Unmonitored instances: {str(instances_to_unmonitor)}')
-
-
-# Delete EIP's
-
-import boto3
-
-def unmonitor_all_instances(regions, dry_run=True):
-    """Stop detailed monitoring on all EC2 instances
-
-    This will stop CloudWatch detailed monitoring on all instances 
-    in all the regions in the input
-
-    The dry_run parameter is now optional and it defaults to True.
-
-    :param regions: List of AWS region names
-    :param dry_run: If True, don't actually stop monitoring the instances (default is True)
-    """
-
-    print("====== EC2 - Unmonitor ======")
-
-    # Create an EC2 resource object instead of a client object
-    ec2 = boto3.resource('ec2')
-
-    for region in regions:
-        instances_to_unmonitor = []
-        print(f'[INFO]: Getting instances in region: {region}')
-        
-        # Get all instances in the region using the EC2 resource object
-        instances = ec2.instances.filter(Filters=[{'Name': 'instance-state-name', 'Values': ['running']}])
-        
-        for instance in instances:
-            instance_id = instance.instance_id
-            monitor_state = instance.monitoring['State']
-            
-            if monitor_state == 'enabled':
-                print(f'[INFO]: Instance with ID "{instance_id}" will be unmonitored.')
-                instances_to_unmonitor.append(instance_id)
-
-        if instances_to_unmonitor:
-            if not dry_run:
-                # Use the EC2 resource object to unmonitor the instances
-                ec2.instances.filter(InstanceIds=instances_to_unmonitor).monitoring(False)
-            print(f'[INFO]: Unmonitored instances: {str(instances_to_unmonitor)}')
-
-
-# Delete EBS volumes
-
-def delete_available_ebs_volumes(regions, dry_run=True):
-    """
-    Delete all available EBS (unassociated) volumes in all the regions in the input.
-    :param regions: List of AWS region names.
-    :param dry_run: If False, deletes the EBS volumes. By default, it's True.
-    """
-    deleted_resources = []
-    check_resources = []
-    skip_delete_resources = []
-
-    for region in regions:
-        print(f'[INFO]: Getting all available (unused) EBS volumes in region: {region}')
-        ec2 = boto3.client('ec2', region_name=region)
-        eks = boto3.client('eks', region_name=region)
-
-        response = ec2.describe_volumes()
-
-        for volume in response['Volumes']:
-            if volume['State'] == 'available':
-                volume_id = volume['VolumeId']
-                delete_volume = True
-
-                # Check if the volume is connected to a running EKS cluster.
-                tags = volume.get('Tags', [])
-                for tag in tags:
-                    if tag['Key'].startswith('kubernetes.io/cluster'):
-                        eks_cluster_name = tag['Key'].split('/')[2]
-                        try:
-                            eks_cluster = eks.describe_cluster(name=eks_cluster_name)
-                            delete_volume = False  # Don't delete volume is it's connected to existing EKS cluster.
-                        except eks.exceptions.ResourceNotFoundException:
-                            delete_volume = True
-                        break
-
-                if delete_volume:
-                    print(f'[INFO]: Deleting EBS volume with ID: {volume_id}')
-                    if dry_run:
-                        skip_delete_resources.append(('ec2', volume_id))
-                    else:
-                        try:
-                            ec2.delete_volume(VolumeId=volume_id)
-                            deleted_resources.append(('ec2', volume_id))
-                        except Exception as e:
-                            print(f'[ERROR]: Failed to delete volume with ID: {volume_id}. Error: {e}')
-                            check_resources.append(('ec2', volume_id))
-
-    # Prints out the results.
-    print(f"[INFO]: Resources removed: {len(deleted_resources)} (total: {len(deleted_resources) + len(check_resources) + len(skip_delete_resources)})")
-    if check_resources:
-        print(f"[ERROR]: Some resources could not be deleted (total: {len(check_resources)}).")
-    if skip_delete_resources:
-        print(f"[INFO]: Resource deletion was skipped (total: {len(skip_delete_resources)}).")
-    print("\n".join(f"[{resource_type}]: {resource_id}" for resource_type, resource_id in deleted_resources))
-
-
-
-# Delete empty load balancers
-
-import boto3
-
-def delete_empty_load_balancers(regions, dry_run=False):
-    """
-    Delete all empty (classic) load balancers. This will delete all empty
-    (with no instances) classic load balancers in all the regions in the input
-
-    :param regions: List of AWS region names
-    :param dry_run: If set to true, a dry run is done and no actual deletion occurs. Default is False
-    :return:
-        deleted_resources: List of tuples of deleted resources in the format (resource_type, resource_name)
-        skipped_resources: List of tuples of skipped resources in the format (resource_type, resource_name)
-        failed_resources: List of tuples of failed resources in the format (resource_type, resource_name, error_message)
-    """
-    deleted_resources = []
-    skipped_resources = []
-    failed_resources = []
-
-    for region in regions:
-        elb = boto3.client('elb', region_name=region)
-        lbs = elb.describe_load_balancers()
-
-        for lb in lbs['LoadBalancerDescriptions']:
-            if len(lb['Instances']) == 0:
-                lb_name = lb['LoadBalancerName']
-                try:
-                    if dry_run:
-                        skipped_resources.append(('elb', lb_name))
-                        print(f'[INFO]: Dry run: Skipped deleting classic load balancer: {lb_name}')
-                    else:
-                        elb.delete_load_balancer(LoadBalancerName=lb_name)
-                        deleted_resources.append(('elb', lb_name))
-                        print(f'[INFO]: Deleted classic load balancer: {lb_name}')
-                except Exception as e:
-                    error_message = f'Failed to delete classic load balancer: {lb_name}. Error: {e}'
-                    failed_resources.append(('elb', lb_name, error_message))
-                    print(f'[ERROR]: {error_message}')
-
-    return deleted_resources, skipped_resources, failed_resources
-
-
-# Stop RDS instances
-
-import boto3
-from concurrent.futures import ThreadPoolExecutor
-
-def stop_rds(regions):
-    """Stops RDS clusters and instances
-
-    This will stop all RDS clusters and instances in all the regions in the input
-
-    :param regions: List of AWS region names
-    """
-
-    print("====== RDS Clusters/Instances ======")
-  
-    def stop_rds_in_region(region):
-        print(f'[INFO]: Getting RDS clusters and instances in region: {region}')
-        rds_specific_region = boto3.client('rds', region_name=region)
-        response = rds_specific_region.describe_db_clusters()
-        for cluster in response['DBClusters']:
-            if cluster['Status'] == 'available':
-                cluster_id = cluster['DBClusterIdentifier']
-                try:
-                    print(f'[INFO]: Stopping DB cluster: {cluster_id}')
-                    if dry_run == 'false':
-                        response = rds_specific_region.stop_db_cluster(DBClusterIdentifier=cluster_id)
-                except Exception as e:
-                    print(f'[ERROR]: Failed to stop DB cluster: {cluster_id}. Error: {e}')
-
-        response = rds_specific_region.describe_db_instances()
-        for instance in response['DBInstances']:
-            if instance['DBInstanceStatus'] == 'available':
-                instance_id = instance['DBInstanceIdentifier']
-                try:
-                    print(f'[INFO]: Stopping DB instance: {instance_id}')
-                    if dry_run == 'false':
-                        response = rds_specific_region.stop_db_instance(DBInstanceIdentifier=instance_id)
-                except Exception as e:
-                    print(f'[ERROR]: Failed to stop DB instance: {instance_id}. Error: {e}')
-                
-    with ThreadPoolExecutor(max_workers=5) as executor:
-        for region in regions:
-            executor.submit(stop_rds_in_region, region)
-
-
-
-# Delete EKS nodegroups
-
-import boto3
-import logging
-from concurrent.futures import ThreadPoolExecutor
-
-logging.basicConfig(level=logging.INFO)
-
-def scale_in_eks_nodegroups(regions, dry_run=True):
-    """Scales-in EKS nodegroups to 0
-
-    This will ensure all EKS node groups have 0 replicas in all the regions in the input
-
-    :param regions: List of AWS region names
-    :param dry_run: Boolean flag that indicates whether the operation should be performed as a dry run
-    """
-
-    def scale_in_eks_nodegroups_in_region(region):
-        logger = logging.getLogger(f'{__name__}.{region}')
-
-        logger.info(f'Getting EKS clusters in region {region}')
-        eks_specific_region = boto3.client('eks', region_name=region)
-        response_clusters = eks_specific_region.list_clusters()
-
-        for cluster in response_clusters['clusters']:
-            response_nodegroups = eks_specific_region.list_nodegroups(clusterName=cluster)
-            for ng in response_nodegroups['nodegroups']:
-                node_group_info = eks_specific_region.describe_nodegroup(
-                    clusterName=cluster, nodegroupName=ng)
-                scaling_config = node_group_info['nodegroup']['scalingConfig']
-
-                # Update scaling
-                scaling_config['minSize'] = 0
-                scaling_config['desiredSize'] = 0
-
-                logger.info(f'Updating scaling config for node group {ng} in cluster {cluster}')
-                if not dry_run:
-                    try:
-                        response = eks_specific_region.update_nodegroup_config(
-                            clusterName=cluster, nodegroupName=ng,
-                            scalingConfig=scaling_config)
-                    except Exception as e:
-                        logger.error(f'Failed to update scaling config for node group {ng} in cluster {cluster}. Error: {e}')
-
-    with ThreadPoolExecutor(max_workers=5) as executor:
-        for region in regions:
-            executor.submit(scale_in_eks_nodegroups_in_region, region)
+    print('[INFO]: Invoking the function again to resume the cleanup')
+    get_invoker().invoke(dict(payload or {}, resume=True), context)
 
 
-# Delete Kinesis Streams
-def delete_kinesis_stream(regions):
-    """Delete Kinesis stream
-
-    :param regions: List of AWS region names
+def get_accounts(event):
     """
+    Register the member accounts to clean, from the event or the ACCOUNT_ROLE_ARNS environment variable.
 
-    print("====== Kinesis Streams ======")
-    for region in regions:
-        print(
-            f'[INFO]: Getting all Kinesis streams in the region: {region}')
-        kinesis_client = boto3.client(
-            'kinesis', region_name='{}'.format(region))
-        response = kinesis_client.list_streams()
-
-        for streamName in response['StreamNames']:
-            try:
-                if streamName.startswith("upsolver_"):
-                    print(f'[INFO]: Skipped deleting Stream: {streamName}')
-                    notify_resources.append(("kinesis", streamName))
-                else:
-                    if dry_run == 'false':
-                        print(f'[INFO]: Deleting Stream: {streamName}')
-                        del_response = kinesis_client.delete_stream(  # debug # check if deletion by version is req
-                            StreamName=streamName,
-                            EnforceConsumerDeletion=True
-                        )
-                        print(f"response from stream deletion: {del_response}")
-                        log_deleted_resources(del_response, "kinesis", streamName)
-                    else:
-                        skip_delete_resources.append(("kinesis", streamName))
-            except Exception as e:
-                print(
-                    f'[ERROR]: Failed to delete kinesis stream: {streamName}. Error: {e}')
-                check_resources.append(("kinesis",streamName))
-
-
-# Delete MSK streams
-
-import boto3
-from concurrent.futures import ThreadPoolExecutor
-
-def delete_kinesis_stream(regions):
-    """Delete Kinesis stream
-
-    :param regions: List of AWS region names
+    :param event: Lambda event, may hold an 'account_role_arns' list.
+    :return: List of account identifiers, [None] to only clean the Lambda's own account.
     """
+    role_arns = (event or {}).get('account_role_arns')
+    if role_arns is None:
+        role_arns = [arn.strip() for arn in os.environ.get('ACCOUNT_ROLE_ARNS', '').split(',') if arn.strip()]
+    if not role_arns:
+        return [None]
 
-    print("====== Kinesis Streams ======")
-
-    def delete_kinesis_stream_in_region(region):
-        print(f'[INFO]: Getting all Kinesis streams in the region: {region}')
-        kinesis_client = boto3.client('kinesis', region_name=region)
-        response = kinesis_client.list_streams()
-
-        for streamName in response['StreamNames']:
-            try:
-                if streamName.startswith("upsolver_"):
-                    print(f'[INFO]: Skipped deleting Stream: {streamName}')
-                    notify_resources.append(("kinesis", streamName))
-                else:
-                    if dry_run == 'false':
-                        print(f'[INFO]: Deleting Stream: {streamName}')
-                        del_response = kinesis_client.delete_stream(StreamName=streamName, EnforceConsumerDeletion=True)
-                        print(f"response from stream deletion: {del_response}")
-                        log_deleted_resources(del_response, "kinesis", streamName)
-                    else:
-                        skip_delete_resources.append(("kinesis", streamName))
-            except Exception as e:
-                print(f'[ERROR]: Failed to delete kinesis stream: {streamName}. Error: {e}')
-                check_resources.append(("kinesis",streamName))
-
-    with ThreadPoolExecutor(max_workers=5) as executor:
-        for region in regions:
-            executor.submit(delete_kinesis_stream_in_region, region)
-
-
+    accounts = []
+    for role_arn in role_arns:
+        account = account_id_from_arn(role_arn)
+        register_account(account, role_arn)
+        accounts.append(account)
+    return accounts
 
-# Delete OpenSearch  domains
 
-import boto3
-from concurrent.futures import ThreadPoolExecutor
-
-def delete_domain(regions):
-    """Delete OpenSearch domains
-
-    :param regions: List of AWS region names
+def get_apply_tasks(key, pending=None):
     """
+    Build the tasks applying a saved plan, one per (account, service, region) of its actions.
 
-    print("====== OpenSearch domains ======")
-
-    def delete_domain_in_region(region):
-        print(f'[INFO]: Getting all OpenSearch domains in the region: {region}')
-        domain_client = boto3.client('opensearch', region_name=region)
-        response = domain_client.list_domain_names(EngineType='OpenSearch')
-
-        for domain_name in response['DomainNames']:
-            try:
-                if dry_run == 'false':
-                    print(f'[INFO]: Deleting OpenSearch domains: {domain_name}')
-                    delete_response = domain_client.delete_domain(DomainName=domain_name['DomainName'])
-                    print(f"response from domain deletion: {delete_response}")
-                    log_deleted_resources(delete_response, "opensearch", domain_name['DomainName'])
-                else:
-                    skip_delete_resources.append(("opensearch", domain_name['DomainName']))
-            except Exception as e:
-                print(f'[ERROR]: Failed to delete OpenSearch domains: {domain_name}. Error: {e}')
-                check_resources.append(("opensearch", domain_name['DomainName']))
-
-    with ThreadPoolExecutor(max_workers=5) as executor:
-        for region in regions:
-            executor.submit(delete_domain_in_region, region)
-
-# Delete CreatedOn tag
+    The resources the plan only notifies about are reported by the first invocation applying it.
 
-import boto3
-from concurrent.futures import ThreadPoolExecutor
-
-def add_created_on_tag(regions):
-    """Add "CreatedOn" tag on resources
-
-    This will check the resource creation date against AWS Config
-    and add it as a tag to the resource
-
-    :param regions: List of AWS region names
+    :param key: Store key of the plan.
+    :param pending: List of the (account, service, region) still to apply, None for all of them.
+    :return: List of tasks.
     """
+    def planned(actions):
+        for action in actions:
+            if action.outcome is None:
+                yield action
+            elif pending is None:
+                results.get_collector().merge([results.Record(
+                    action.account, action.service, action.region, action.resource_id, action.action,
+                    results.NOTIFY, None)])
+
+    groups = group_actions(planned(load_plan(key)))
+    if pending is not None:
+        pending = set(pending)
+        groups = {task: actions for task, actions in groups.items() if task in pending}
+    appliers = load_appliers({service for _, service, _ in groups})
+    print(f'[INFO]: Applying {sum(len(actions) for actions in groups.values())} actions of plan {key}')
+    # Tasks of the same service are kept together, in the order of the cleaners
+    return [Task(service, region, partial(appliers[service][0], actions=actions), tuple(appliers[service][1]), account)
+            for (account, service, region), actions in sorted(
+                groups.items(), key=lambda item: list(CLEANUP_SERVICES).index(item[0][1]))]
+
+
+def response():
+    return {
+        'statusCode': 200,
+        'body': json.dumps('Success!')
+    }
 
-    def process_instance(instance, ec2_specific_region, config_specific_region):
-        # Ignore spot instances
-        if 'InstanceLifecycle' in instance and instance['InstanceLifecycle'] == 'spot':
-            return
-
-        # Skip instance if tag already present
-        found_tag = False
-        if "Tags" in instance:
-            for tag in instance["Tags"]:
-                if tag["Key"] == "CreatedOn":
-                    found_tag = True
-                    break
-        if found_tag:
-            return
-
-        instance_id = instance["InstanceId"]
-        response = config_specific_region.get_resource_config_history(
-            resourceType='AWS::EC2::Instance',
-            resourceId=instance_id)
-        created_on = response['configurationItems'][0]['resourceCreationTime']
-        created_on = created_on.strftime("%d/%m/%Y")
-        print(f'[INFO] Instance {instance_id} created on {created_on}')
-
-        # Create tag on instance
-        if dry_run == 'false':
-            ec2_specific_region.create_tags(
-                Resources=[instance_id],
-                Tags=[
-                    {
-                        'Key': 'CreatedOn',
-                        'Value': created_on
-                    },
-                ]
-            )
-
-    with ThreadPoolExecutor(max_workers=5) as executor:
-        for region in regions:
-            print(f'[INFO]: Getting instances in region: {region}')
-            ec2_specific_region = boto3.client('ec2', region_name=region)
-            config_specific_region = boto3.client('config', region_name=region)
-
-            # Check if there are discover resources in AWS Config
-            response = config_specific_region.get_discovered_resource_counts()
-            if response['totalDiscoveredResources'] == 0:
-                continue
-
-            response = ec2_specific_region.describe_instances()
-            if "Reservations" in response:
-                for reservation in response["Reservations"]:
-                    if "Instances" in reservation:
-                        instances = reservation["Instances"]
-                        executor.map(process_instance, instances,
-                                     [ec2_specific_region]*len(instances),
-                                     [config_specific_region]*len(instances))
 
 def lambda_handler(event, context):
-    check_all_regions = os.environ['CHECK_ALL_REGIONS'] == 'true'
-    if check_all_regions:
-        regions = get_aws_regions()
+    global cold_start
+    metrics.reset()
+    if cold_start:
+        print(f'[INFO]: Cold start, init took {INIT_DURATION * 1000:.0f}ms')
+        metrics.record_phase('init', INIT_DURATION)
+        cold_start = False
+
+    collector = results.new_collector()
+    throttle.reset_stats()
+    clear_ec2_snapshots()
+    clear_eks_clusters()
+    clear_keep_index()
+    clear_inventory_snapshots()
+    clear_plan()
+    clear_prefetched()
+    clear_tracked()
+    clear_policy()
+    # Compiled before any task runs, so that an invalid policy fails the run right away
+    get_policy()
+
+    max_workers = int(os.environ.get('MAX_WORKERS', '10'))
+    max_workers_per_service = int(os.environ.get('MAX_WORKERS_PER_SERVICE', '5'))
+    max_workers_per_account = int(os.environ.get('MAX_WORKERS_PER_ACCOUNT', str(max_workers)))
+    deadline_reserve = int(os.environ.get('DEADLINE_RESERVE_SECONDS', '15'))
+    accounts = get_accounts(event)
+    # Passed on to the invocations this one starts (see fanout.py)
+    payload = {'account_role_arns': event['account_role_arns']} if 'account_role_arns' in (event or {}) else {}
+
+    # An 'aggregate' event reports a fanned-out run whose shards didn't all complete, e.g. after a worker crashed
+    if (event or {}).get('aggregate'):
+        with metrics.phase('report'):
+            merged = fanout.claim_aggregation(event['aggregate'])
+            if merged is not None:
+                notify_auto_clean_data(merged)
+                fanout.clean_up(merged)
+                merged.close()
+        metrics.emit()
+        return response()
+
+    # An 'apply' event applies a saved plan instead of scanning, a 'shard' event runs a shard of a fanned-out run,
+    # a 'resume' event (see reinvoke) resumes the run of the checkpoint
+    apply = (event or {}).get('apply')
+    shard = (event or {}).get('shard')
+    resume = (event or {}).get('resume')
+    # Workers of a fanned-out run continue their shard themselves, the checkpoint is for runs in one invocation
+    checkpoint = None if shard else load_checkpoint()
+    if checkpoint and apply and not resume:
+        # The operator's request wins over the unfinished run
+        print(f'[INFO]: Dropping the checkpoint of an unfinished run to apply plan {apply}')
+        clear_checkpoint()
+        checkpoint = None
+    if resume and not checkpoint:
+        print('[INFO]: No checkpoint to resume from, the run is already complete')
+        metrics.emit()
+        return response()
+    if checkpoint:
+        print(f"[INFO]: Resuming from checkpoint, {len(checkpoint['pending'])} tasks left")
+        started = checkpoint['started']
+        completed = [tuple(task) for task in checkpoint['completed']]
+        apply = checkpoint['apply']
+        if apply:
+            tasks = get_apply_tasks(apply, [tuple(task) for task in checkpoint['pending']])
+        else:
+            cleaners = load_cleaners({service for _, service, _ in checkpoint['pending']})
+            tasks = [Task(service, region, cleaners[service][0], tuple(cleaners[service][1]), account)
+                     for account, service, region in checkpoint['pending']]
+    elif shard:
+        print(f"[INFO]: Running shard {shard['index']} (part {shard['part']}) of run {shard['run']}, "
+              f"{len(shard['tasks'])} tasks")
+        started = shard['started']
+        completed = []
+        cleaners = load_cleaners({service for _, service, _ in shard['tasks']})
+        tasks = [Task(service, region, cleaners[service][0], tuple(cleaners[service][1]), account)
+                 for account, service, region in shard['tasks']]
+    elif apply:
+        started = time.time()
+        completed = []
+        tasks = get_apply_tasks(apply)
     else:
-        regions = USED_REGIONS
-
-    stop_instances(regions)
-    tag_instances(regions)
-    unmonitor_instances(regions)
-    release_unassociated_eip(regions)
-    delete_ebs_volumes(regions)
-    delete_empty_load_balancers(regions)
-    stop_rds_instances(regions)
-    scale_in_eks_nodegroups(regions)
-    delete_kinesis_stream(regions)
-    delete_msk_clusters(regions)
-    delete_domain(regions)
-    notify_auto_clean_data()
-
-    return {
-        'statusCode': 200,
-        'body': json.dumps('Success!')
-    }
\ No newline at end of file
+        check_all_regions = os.environ['CHECK_ALL_REGIONS'] == 'true'
+        prune_regions = os.environ.get('PRUNE_EMPTY_REGIONS') == 'true'
+        regions = {}
+        with metrics.phase('regions'):
+            for account in accounts:
+                with account_context(account):
+                    account_regions = get_aws_regions() if check_all_regions else USED_REGIONS
+                    if prune_regions:
+                        account_regions = prune_empty_regions(account_regions)
+                regions[account] = set(account_regions)
+        started = time.time()
+        completed = []
+        all_regions = sorted(set.union(*regions.values()))
+        tasks = [task for task in build_tasks(load_cleaners(get_enabled_services()), all_regions, accounts)
+                 if task.region in regions[task.account]]
+
+        shard_by = fanout.get_shard_by()
+        if shard_by and tasks and fanout.can_fan_out():
+            fanout.dispatch([task_key(task) for task in tasks], shard_by, started, context, payload)
+            metrics.emit()
+            return response()
+
+    if not apply and os.environ.get('SCAN_BACKEND') == 'async':
+        # Only imported when enabled, to keep asyncio and aiobotocore out of the cold start
+        from async_scan import prefetch_inventory
+        with metrics.phase('scan'):
+            prefetch_inventory(tasks)
+
+    time_left = None
+    if context is not None:
+        time_left = lambda: context.get_remaining_time_in_millis() / 1000
+
+    with metrics.phase('cleanup'):
+        task_results, not_started = run_tasks(tasks, max_workers=max_workers, service_limit=max_workers_per_service,
+                                              time_left=time_left, reserve=deadline_reserve,
+                                              account_limit=max_workers_per_account)
+    with metrics.phase('completion'):
+        wait_for_completion(time_left=time_left, reserve=deadline_reserve, max_workers=max_workers)
+    print_task_report(task_results)
+    unused = clear_prefetched()
+    if unused:
+        print(f'[INFO]: {unused} prefetched listings were not used')
+    if not apply:
+        save_inventory_snapshots()
+        if is_dry_run():
+            # Invocations resuming the run and the shards each add a part to the plan of the run
+            collector.extras['plan'] = plan_key(started)
+            count = save_plan(collector.extras['plan'])
+            print(f"[INFO]: Saved {count} planned actions to {collector.extras['plan']}")
+    for result in task_results:
+        metrics.record_phase(f'cleaner:{result.service}', result.duration)
+
+    collector.extras['tasks'] = task_results
+    collector.extras['pending_tasks'] = len(not_started)
+    collector.extras['throttling'] = throttle.throttling_report()
+    for operation, stats in collector.extras['throttling'].items():
+        print(f'[INFO]: Throttled {operation}: {stats}')
+
+    report = collector
+    completed += [task_key(result) for result in task_results]
+    if shard:
+        # Only the worker completing the last shard gets the results of the whole run to report
+        report = fanout.finish_shard(shard, collector, [task_key(task) for task in not_started], bool(task_results),
+                                     context, payload)
+    elif not_started:
+        save_checkpoint(started, completed, [task_key(task) for task in not_started], apply=apply)
+        # Only start over if this invocation made progress, to avoid an endless chain of invocations
+        if task_results and os.environ.get('SELF_REINVOKE') == 'true':
+            reinvoke(context, payload)
+    else:
+        clear_checkpoint()
+
+    if report is not None:
+        with metrics.phase('report'):
+            notify_auto_clean_data(report)
+        if report is not collector:
+            fanout.clean_up(report)
+            # Records of the whole run, spilled by the aggregation
+            report.close()
+    metrics.emit()
+    return response()
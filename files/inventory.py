@@ -0,0 +1,280 @@
+"""
+Paginated, lazily evaluated inventory of the resources handled by the cleaners.
+
+Every function takes an already created client and yields resources one by one,
+fetching the next page only when the previous one has been consumed, so memory
+stays flat regardless of how many resources an account holds.
+
+A scan backend may fetch the listings of a run ahead of time (see async_scan.py):
+the calls it prefetched are then served from memory, once, and every other
+call goes to AWS as usual.
+"""
+
+import json
+import threading
+
+from accounts import current_account
+
+
+# Page sizes are the maximum each API accepts.
+EC2_PAGE_SIZE = 1000
+EBS_PAGE_SIZE = 500
+ELB_PAGE_SIZE = 400
+ELBV2_PAGE_SIZE = 400
+RDS_PAGE_SIZE = 100
+EKS_PAGE_SIZE = 100
+KINESIS_PAGE_SIZE = 1000
+MSK_PAGE_SIZE = 100
+
+_lock = threading.Lock()
+_prefetched = {}
+
+
+def listing_key(account, region, service, operation, params):
+    """
+    :return: Key of the pages of a call in the prefetched listings.
+    """
+    return account, region, service, operation, json.dumps(params, sort_keys=True, default=str)
+
+
+def set_prefetched(listings):
+    """
+    Add listings fetched ahead of time, served instead of the matching calls.
+
+    :param listings: Dict of listing key (see listing_key) to list of response pages.
+    :return: None
+    """
+    with _lock:
+        _prefetched.update(listings)
+
+
+def take_prefetched(client, operation, params):
+    """
+    Take the prefetched pages of a call of the current account, each listing being served once.
+
+    :param client: boto3 client.
+    :param operation: Name of the operation (e.g. 'describe_instances').
+    :param params: Parameters of the call.
+    :return: List of response pages, None if the call wasn't prefetched.
+    """
+    if not _prefetched:
+        return None
+    key = listing_key(current_account(), client.meta.region_name, client.meta.service_model.service_name,
+                      operation, params)
+    with _lock:
+        return _prefetched.pop(key, None)
+
+
+def clear_prefetched():
+    """
+    Drop the listings prefetched for a run.
+
+    :return: Number of listings that were prefetched but never used.
+    """
+    with _lock:
+        unused = len(_prefetched)
+        _prefetched.clear()
+    return unused
+
+
+def paginate(client, operation, page_size=None, **kwargs):
+    """
+    Iterate over the pages of a paginated API call.
+
+    :param client: boto3 client.
+    :param operation: Name of the paginated operation (e.g. 'describe_instances').
+    :param page_size: Number of items to request per page (None = service default).
+    :param kwargs: Parameters passed to the operation.
+    :return: Generator of response pages.
+    """
+    pages = take_prefetched(client, operation, kwargs)
+    if pages is not None:
+        return iter(pages)
+    paginator = client.get_paginator(operation)
+    pagination_config = {'PageSize': page_size} if page_size else {}
+    return paginator.paginate(PaginationConfig=pagination_config, **kwargs)
+
+
+def iter_instances(ec2, states=None):
+    """
+    Yield EC2 instances, optionally filtered server-side by state.
+
+    :param ec2: EC2 client.
+    :param states: List of instance state names to keep (e.g. ['running']).
+    :return: Generator of instance descriptions.
+    """
+    filters = []
+    if states:
+        filters.append({'Name': 'instance-state-name', 'Values': list(states)})
+    for page in paginate(ec2, 'describe_instances', EC2_PAGE_SIZE, Filters=filters):
+        for reservation in page['Reservations']:
+            yield from reservation.get('Instances', [])
+
+
+def iter_volumes(ec2, status=None):
+    """
+    Yield EBS volumes, optionally filtered server-side by status.
+
+    :param ec2: EC2 client.
+    :param status: Volume status to keep (e.g. 'available').
+    :return: Generator of volume descriptions.
+    """
+    filters = []
+    if status:
+        filters.append({'Name': 'status', 'Values': [status]})
+    for page in paginate(ec2, 'describe_volumes', EBS_PAGE_SIZE, Filters=filters):
+        yield from page['Volumes']
+
+
+def iter_addresses(ec2):
+    """
+    Yield Elastic IP addresses.
+
+    DescribeAddresses is not paginated, the whole region is returned in one call.
+
+    :param ec2: EC2 client.
+    :return: Generator of address descriptions.
+    """
+    pages = take_prefetched(ec2, 'describe_addresses', {})
+    response = pages[0] if pages else ec2.describe_addresses()
+    yield from response['Addresses']
+
+
+def iter_classic_load_balancers(elb):
+    """
+    Yield classic load balancers.
+
+    :param elb: ELB client.
+    :return: Generator of load balancer descriptions.
+    """
+    for page in paginate(elb, 'describe_load_balancers', ELB_PAGE_SIZE):
+        yield from page['LoadBalancerDescriptions']
+
+
+def iter_v2_load_balancers(elbv2):
+    """
+    Yield Application, Network and Gateway load balancers.
+
+    :param elbv2: ELBv2 client.
+    :return: Generator of load balancer descriptions.
+    """
+    for page in paginate(elbv2, 'describe_load_balancers', ELBV2_PAGE_SIZE):
+        yield from page['LoadBalancers']
+
+
+def iter_target_groups(elbv2):
+    """
+    Yield the target groups of a region, each with the ARNs of the load balancers it is attached to.
+
+    :param elbv2: ELBv2 client.
+    :return: Generator of target group descriptions.
+    """
+    for page in paginate(elbv2, 'describe_target_groups', ELBV2_PAGE_SIZE):
+        yield from page['TargetGroups']
+
+
+def iter_listeners(elbv2, lb_arn):
+    """
+    Yield the listeners of an Application, Network or Gateway load balancer.
+
+    :param elbv2: ELBv2 client.
+    :param lb_arn: Load balancer ARN.
+    :return: Generator of listener descriptions.
+    """
+    for page in paginate(elbv2, 'describe_listeners', ELBV2_PAGE_SIZE, LoadBalancerArn=lb_arn):
+        yield from page['Listeners']
+
+
+def iter_listener_rules(elbv2, listener_arn):
+    """
+    Yield the rules of an Application load balancer listener, its default rule included.
+
+    :param elbv2: ELBv2 client.
+    :param listener_arn: Listener ARN.
+    :return: Generator of rule descriptions.
+    """
+    for page in paginate(elbv2, 'describe_rules', ELBV2_PAGE_SIZE, ListenerArn=listener_arn):
+        yield from page['Rules']
+
+
+def iter_db_clusters(rds):
+    """
+    Yield RDS DB clusters.
+
+    :param rds: RDS client.
+    :return: Generator of DB cluster descriptions.
+    """
+    for page in paginate(rds, 'describe_db_clusters', RDS_PAGE_SIZE):
+        yield from page['DBClusters']
+
+
+def iter_db_instances(rds):
+    """
+    Yield RDS DB instances.
+
+    :param rds: RDS client.
+    :return: Generator of DB instance descriptions.
+    """
+    for page in paginate(rds, 'describe_db_instances', RDS_PAGE_SIZE):
+        yield from page['DBInstances']
+
+
+def iter_eks_clusters(eks):
+    """
+    Yield EKS cluster names.
+
+    :param eks: EKS client.
+    :return: Generator of cluster names.
+    """
+    for page in paginate(eks, 'list_clusters', EKS_PAGE_SIZE):
+        yield from page['clusters']
+
+
+def iter_nodegroups(eks, cluster):
+    """
+    Yield the node group names of an EKS cluster.
+
+    :param eks: EKS client.
+    :param cluster: Name of the EKS cluster.
+    :return: Generator of node group names.
+    """
+    for page in paginate(eks, 'list_nodegroups', EKS_PAGE_SIZE, clusterName=cluster):
+        yield from page['nodegroups']
+
+
+def iter_kinesis_streams(kinesis):
+    """
+    Yield Kinesis stream names.
+
+    :param kinesis: Kinesis client.
+    :return: Generator of stream names.
+    """
+    for page in paginate(kinesis, 'list_streams', KINESIS_PAGE_SIZE):
+        yield from page['StreamNames']
+
+
+def iter_msk_clusters(kafka):
+    """
+    Yield MSK clusters (provisioned and serverless).
+
+    :param kafka: Kafka (MSK) client.
+    :return: Generator of cluster descriptions.
+    """
+    for page in paginate(kafka, 'list_clusters_v2', MSK_PAGE_SIZE):
+        yield from page['ClusterInfoList']
+
+
+def iter_opensearch_domains(opensearch, engine_type='OpenSearch'):
+    """
+    Yield OpenSearch domain names.
+
+    ListDomainNames is not paginated, the whole region is returned in one call.
+
+    :param opensearch: OpenSearch client.
+    :param engine_type: Engine type to filter on.
+    :return: Generator of domain names.
+    """
+    pages = take_prefetched(opensearch, 'list_domain_names', {'EngineType': engine_type})
+    response = pages[0] if pages else opensearch.list_domain_names(EngineType=engine_type)
+    for domain in response['DomainNames']:
+        yield domain['DomainName']
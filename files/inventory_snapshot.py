@@ -0,0 +1,162 @@
+"""
+Inventory snapshot kept between runs, to only re-evaluate what changed.
+
+Only EC2 instances are kept so far (see ec2_snapshot.py): for every instance
+of a region, the snapshot keeps its state, a hash of its tags and the last
+action taken on it. A run compares what it scans against the previous night's
+snapshot, so that AWS Config isn't asked again about an unchanged instance it
+knew nothing of (see cleaners/ec2.py). Snapshots live in the store (see store.py).
+"""
+
+import hashlib
+import json
+import threading
+import time
+
+from accounts import current_account
+from store import get_store
+
+
+NEW = 'new'
+CHANGED = 'changed'
+UNCHANGED = 'unchanged'
+
+_lock = threading.Lock()
+_key_locks = {}
+_snapshots = {}
+
+
+def tags_hash(tags):
+    """
+    :param tags: Dict of tag key to value.
+    :return: Short hash of the tags, independent of their order.
+    """
+    return hashlib.sha1(json.dumps(tags, sort_keys=True).encode()).hexdigest()[:12]
+
+
+class InventorySnapshot:
+    """Previous and current inventory of one kind of resource in a region."""
+
+    def __init__(self, key, previous):
+        self.key = key
+        self.previous = previous
+        self.current = {}
+        self._lock = threading.Lock()
+
+    def observe(self, resource_id, state, tags):
+        """
+        Add a scanned resource to the current inventory.
+
+        :param resource_id: ID of the resource.
+        :param state: State of the resource.
+        :param tags: Dict of tag key to value.
+        :return: NEW, CHANGED or UNCHANGED compared to the previous snapshot.
+        """
+        previous = self.previous.get(resource_id)
+        # The last action is carried over until a new one is taken
+        entry = [state, tags_hash(tags)] + (previous[2:] if previous else [None, None])
+        with self._lock:
+            self.current[resource_id] = entry
+        return self.status(resource_id)
+
+    def status(self, resource_id):
+        """
+        :param resource_id: ID of a resource of the current inventory.
+        :return: NEW, CHANGED or UNCHANGED compared to the previous snapshot.
+        """
+        previous = self.previous.get(resource_id)
+        if previous is None:
+            return NEW
+        return UNCHANGED if previous[:2] == self.current[resource_id][:2] else CHANGED
+
+    def last_action(self, resource_id):
+        """
+        :param resource_id: ID of the resource.
+        :return: Tuple of (last action, epoch seconds when it was taken), (None, None) if none was recorded.
+        """
+        entry = self.current.get(resource_id) or self.previous.get(resource_id)
+        return tuple(entry[2:]) if entry else (None, None)
+
+    def set_action(self, resource_id, action):
+        """
+        Record the action taken on a resource.
+
+        :param resource_id: ID of the resource.
+        :param action: Action taken (e.g. 'tag', 'stop').
+        :return: None
+        """
+        with self._lock:
+            entry = self.current.get(resource_id)
+            if entry is not None:
+                entry[2:] = [action, int(time.time())]
+
+    def diff_counts(self):
+        """
+        :return: Dict of the number of new, changed, unchanged and removed resources.
+        """
+        counts = {NEW: 0, CHANGED: 0, UNCHANGED: 0}
+        for resource_id in list(self.current):
+            counts[self.status(resource_id)] += 1
+        counts['removed'] = len(self.previous.keys() - self.current.keys())
+        return counts
+
+    def save(self, store=None):
+        """
+        Replace the previous snapshot with the current inventory.
+
+        :param store: Store to write to, defaults to the configured store.
+        :return: None
+        """
+        with self._lock:
+            current = dict(self.current)
+        (store or get_store()).put_json(self.key, current)
+
+
+def get_inventory_snapshot(region, kind):
+    """
+    Get the inventory snapshot of a kind of resource in a region, loading the previous one on first use.
+
+    :param region: AWS region name.
+    :param kind: Kind of resource (e.g. 'ec2').
+    :return: InventorySnapshot.
+    """
+    key = f'inventory/{current_account() or "default"}/{region}/{kind}.json'
+    with _lock:
+        key_lock = _key_locks.setdefault(key, threading.Lock())
+    with key_lock:
+        snapshot = _snapshots.get(key)
+        if snapshot is None:
+            snapshot = InventorySnapshot(key, get_store().get_json(key, default={}))
+            with _lock:
+                _snapshots[key] = snapshot
+    return snapshot
+
+
+def save_inventory_snapshots():
+    """
+    Save the inventory scanned by this run and start over for the next one.
+
+    :return: None
+    """
+    with _lock:
+        snapshots = list(_snapshots.values())
+        _snapshots.clear()
+        _key_locks.clear()
+    for snapshot in snapshots:
+        counts = snapshot.diff_counts()
+        print(f'[INFO]: Inventory {snapshot.key}: {counts}')
+        try:
+            snapshot.save()
+        except Exception as e:
+            print(f'[ERROR]: Failed to save inventory {snapshot.key}. Error: {e}')
+
+
+def clear_inventory_snapshots():
+    """
+    Drop the snapshots loaded by a previous run without saving them.
+
+    :return: None
+    """
+    with _lock:
+        _snapshots.clear()
+        _key_locks.clear()
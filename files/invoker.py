@@ -0,0 +1,95 @@
+"""
+Pluggable invoker of the function itself, for the invocations a run starts on its own.
+
+On Lambda, invocations are asynchronous Lambda invocations of the same function.
+LocalInvoker is an in-process stand-in, queuing the payloads and running them
+through the handler one after the other, so that a run spanning several
+invocations (see fanout.py) can be exercised offline.
+"""
+
+import json
+import os
+from collections import deque
+
+from clients import get_client
+
+
+class Invoker:
+    """Base class of the invokers."""
+
+    def invoke(self, payload, context=None):
+        """
+        Start an invocation of the function, without waiting for it.
+
+        :param payload: JSON-serializable event of the invocation.
+        :param context: Lambda context of the current invocation, None outside of Lambda.
+        :return: None
+        """
+        raise NotImplementedError
+
+
+class LambdaInvoker(Invoker):
+    """Asynchronous ('Event') invocations of the Lambda function."""
+
+    def invoke(self, payload, context=None):
+        # The ARN of the context keeps the alias or version that was invoked
+        function = context.invoked_function_arn if context is not None else os.environ['AWS_LAMBDA_FUNCTION_NAME']
+        get_client('lambda', os.environ['AWS_REGION'], account=None).invoke(
+            FunctionName=function, InvocationType='Event', Payload=json.dumps(payload).encode())
+
+
+class LocalInvoker(Invoker):
+    """
+    In-process invocations, queued until drained.
+
+    :param handler: Handler run for each invocation.
+    :param new_context: Function returning the Lambda context of an invocation (e.g. to give it a deadline),
+                        None to run them without context.
+    """
+
+    def __init__(self, handler, new_context=None):
+        self.handler = handler
+        self.new_context = new_context
+        self.queue = deque()
+        self.invoked = 0
+
+    def invoke(self, payload, context=None):
+        # Serialized as Lambda would, so a payload that couldn't be sent fails here too
+        self.queue.append(json.loads(json.dumps(payload)))
+        self.invoked += 1
+
+    def drain(self):
+        """
+        Run the queued invocations, including the ones they queue, until none is left.
+
+        :return: Number of invocations run.
+        """
+        count = 0
+        while self.queue:
+            self.handler(self.queue.popleft(), self.new_context() if self.new_context else None)
+            count += 1
+        return count
+
+
+_invoker = None
+
+
+def get_invoker():
+    """
+    :return: The configured invoker, a LambdaInvoker unless replaced.
+    """
+    global _invoker
+    if _invoker is None:
+        _invoker = LambdaInvoker()
+    return _invoker
+
+
+def set_invoker(invoker):
+    """
+    Replace the configured invoker (e.g. with a LocalInvoker to run offline).
+
+    :param invoker: Invoker instance, None to go back to the LambdaInvoker.
+    :return: None
+    """
+    global _invoker
+    _invoker = invoker
@@ -0,0 +1,123 @@
+"""
+Per-run index of the resources protected by a keep tag.
+
+The tagged resources of a region are listed with a few Resource Groups Tagging
+API calls (one paginated get_resources per keep tag), after which every cleaner
+checks whether a resource is protected with a set lookup, instead of reading
+the tags of each resource.
+"""
+
+import json
+import os
+import threading
+
+from accounts import current_account
+from clients import get_client
+from inventory import paginate
+
+
+TAGGING_PAGE_SIZE = 100
+
+# Tag value matching any value of the tag key
+ANY_VALUE = '*'
+
+_lock = threading.Lock()
+_region_locks = {}
+_indexes = {}
+
+
+def get_keep_tags():
+    """
+    Read the keep tags from the KEEP_TAGS environment variable.
+
+    KEEP_TAGS is a JSON object of tag key to tag value, '*' matching any value,
+    e.g. {"auto-deletion": "skip-resource"}.
+
+    :return: Dict of tag key to tag value.
+    """
+    return json.loads(os.environ.get('KEEP_TAGS') or '{}')
+
+
+def index_keys(arn):
+    """
+    :param arn: ARN of a resource.
+    :return: Keys identifying the resource in the index: its ARN and (service, resource ID).
+    """
+    service = arn.split(':')[2]
+    resource = arn.split(':', 5)[5]
+    # The resource ID is the last part of the ARN: instance/i-0123, db:my-db, domain/my-domain, ...
+    resource_id = resource.replace(':', '/').rsplit('/', 1)[-1]
+    return arn, (service, resource_id)
+
+
+def tag_filter(key, value):
+    """
+    :param key: Keep tag key.
+    :param value: Keep tag value, ANY_VALUE for any value.
+    :return: Resource Groups Tagging API filter of the tag.
+    """
+    return {'Key': key} if value == ANY_VALUE else {'Key': key, 'Values': [value]}
+
+
+def build_keep_index(region, keep_tags):
+    """
+    List the resources of a region carrying a keep tag.
+
+    :param region: AWS region name.
+    :param keep_tags: Dict of tag key to tag value.
+    :return: frozenset of index keys.
+    """
+    tagging = get_client('resourcegroupstaggingapi', region)
+    index = set()
+    for key, value in keep_tags.items():
+        for page in paginate(tagging, 'get_resources', TAGGING_PAGE_SIZE, TagFilters=[tag_filter(key, value)]):
+            for resource in page['ResourceTagMappingList']:
+                index.update(index_keys(resource['ResourceARN']))
+    return frozenset(index)
+
+
+def get_keep_index(region):
+    """
+    Get the keep index of a region, listing the tagged resources on first use.
+
+    :param region: AWS region name.
+    :return: frozenset of index keys.
+    """
+    keep_tags = get_keep_tags()
+    if not keep_tags:
+        return frozenset()
+
+    key = (current_account(), region)
+    with _lock:
+        region_lock = _region_locks.setdefault(key, threading.Lock())
+    with region_lock:
+        index = _indexes.get(key)
+        if index is None:
+            index = build_keep_index(region, keep_tags)
+            _indexes[key] = index
+            print(f'[INFO]: Keep index of {region}: {len(index) // 2} protected resources')
+    return index
+
+
+def is_kept(region, service, resource_id):
+    """
+    Check whether a resource carries a keep tag.
+
+    :param region: AWS region name.
+    :param service: Service name used in the resource ARNs (e.g. 'ec2', 'elasticloadbalancing').
+    :param resource_id: ARN, ID or name of the resource.
+    :return: True if the resource must be kept.
+    """
+    index = get_keep_index(region)
+    return resource_id in index or (service, resource_id) in index
+
+
+def clear_keep_index():
+    """
+    Drop every cached index, so the next run lists the tagged resources again.
+
+    :return: None
+    """
+    with _lock:
+        _indexes.clear()
+        _region_locks.clear()
@@ -0,0 +1,190 @@
+"""
+API call and phase metrics, emitted as CloudWatch Embedded Metric Format (EMF).
+
+A client hook records, for every (service, region, operation), the number of
+calls, their latency (histogram and a sample of values), retries and error
+codes. Phases of the run (region discovery, each cleaner, the report) are
+timed as well. At the end of the run everything is printed as EMF JSON lines,
+which CloudWatch Logs turns into metrics without any PutMetricData call.
+"""
+
+import json
+import os
+import random
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+
+
+DEFAULT_NAMESPACE = 'AwsCleaner'
+
+# Upper bounds (ms) of the latency histogram buckets, the last one catching the rest
+LATENCY_BUCKETS = [10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, float('inf')]
+
+# EMF accepts at most 100 values per metric, latencies beyond that are sampled
+MAX_VALUES = 100
+
+
+class OperationStats:
+    """Counters of one (service, region, operation)."""
+
+    def __init__(self):
+        self.calls = 0
+        self.retries = 0
+        self.errors = Counter()
+        self.latency_sum = 0.0
+        self.latency_max = 0.0
+        self.histogram = [0] * len(LATENCY_BUCKETS)
+        self.samples = []
+
+    def add(self, latency_ms, retries, error_code):
+        self.calls += 1
+        self.retries += retries
+        if error_code:
+            self.errors[error_code] += 1
+        self.latency_sum += latency_ms
+        self.latency_max = max(self.latency_max, latency_ms)
+        self.histogram[next(i for i, bound in enumerate(LATENCY_BUCKETS) if latency_ms <= bound)] += 1
+        # Reservoir sampling keeps a uniform sample of the latencies
+        if len(self.samples) < MAX_VALUES:
+            self.samples.append(latency_ms)
+        else:
+            index = random.randrange(self.calls)
+            if index < MAX_VALUES:
+                self.samples[index] = latency_ms
+
+
+_lock = threading.Lock()
+_operations = {}
+_phases = {}
+
+
+def install(client, region, account=None):
+    """
+    Client hook recording the metrics of every call made by the client.
+
+    :param client: boto3 client.
+    :param region: AWS region name of the client.
+    :param account: Account of the client (unused, metrics are aggregated across accounts).
+    :return: None
+    """
+    service = client.meta.service_model.service_name
+
+    def before_call(context, **kwargs):
+        context['metrics_start'] = time.monotonic()
+
+    def after_call(http_response, parsed, model, context, **kwargs):
+        latency_ms = (time.monotonic() - context.get('metrics_start', time.monotonic())) * 1000
+        retries = parsed.get('ResponseMetadata', {}).get('RetryAttempts', 0)
+        error_code = parsed.get('Error', {}).get('Code') if http_response.status_code >= 300 else None
+        key = (service, region, model.name)
+        with _lock:
+            stats = _operations.get(key)
+            if stats is None:
+                stats = _operations[key] = OperationStats()
+            stats.add(latency_ms, retries, error_code)
+
+    client.meta.events.register('before-call', before_call)
+    client.meta.events.register('after-call', after_call)
+
+
+def record_phase(name, duration):
+    """
+    Add the duration of a phase of the run.
+
+    :param name: Name of the phase (e.g. 'cleaner:ec2-stop').
+    :param duration: Duration in seconds.
+    :return: None
+    """
+    with _lock:
+        count, total, longest = _phases.get(name, (0, 0.0, 0.0))
+        _phases[name] = (count + 1, total + duration, max(longest, duration))
+
+
+@contextmanager
+def phase(name):
+    """
+    Time the enclosed code as a phase of the run.
+
+    :param name: Name of the phase.
+    """
+    start = time.monotonic()
+    try:
+        yield
+    finally:
+        record_phase(name, time.monotonic() - start)
+
+
+def reset():
+    """
+    Drop the metrics of the previous invocation.
+
+    :return: None
+    """
+    with _lock:
+        _operations.clear()
+        _phases.clear()
+
+
+def emf_documents(namespace=None, timestamp=None):
+    """
+    Build the EMF documents of the run: one per (service, region, operation) and one per phase.
+
+    :param namespace: CloudWatch namespace, defaults to the METRICS_NAMESPACE environment variable.
+    :param timestamp: Epoch milliseconds of the metrics, defaults to now.
+    :return: List of EMF documents (dicts).
+    """
+    namespace = namespace or os.environ.get('METRICS_NAMESPACE') or DEFAULT_NAMESPACE
+    timestamp = timestamp or int(time.time() * 1000)
+    with _lock:
+        operations = dict(_operations)
+        phases = dict(_phases)
+
+    def document(dimension_sets, metrics, values):
+        return dict(values, _aws={
+            'Timestamp': timestamp,
+            'CloudWatchMetrics': [{
+                'Namespace': namespace,
+                'Dimensions': dimension_sets,
+                'Metrics': [{'Name': name, 'Unit': unit} for name, unit in metrics],
+            }],
+        })
+
+    documents = []
+    for (service, region, operation), stats in sorted(operations.items()):
+        documents.append(document(
+            # Per region, to graph and alarm on a region's calls and throttling, and across regions
+            [['Service', 'Region', 'Operation'], ['Service', 'Operation']],
+            [('Calls', 'Count'), ('Retries', 'Count'), ('Errors', 'Count'), ('Latency', 'Milliseconds')],
+            {
+                'Service': service,
+                'Operation': operation,
+                'Region': region,
+                'Calls': stats.calls,
+                'Retries': stats.retries,
+                'Errors': sum(stats.errors.values()),
+                'Latency': [round(value, 1) for value in stats.samples],
+                'LatencySum': round(stats.latency_sum, 1),
+                'LatencyMax': round(stats.latency_max, 1),
+                'LatencyHistogram': {f'<={bound:g}ms' if bound != float('inf') else 'more': count
+                                     for bound, count in zip(LATENCY_BUCKETS, stats.histogram) if count},
+                'ErrorCodes': dict(stats.errors),
+            }))
+    for name, (count, total, longest) in sorted(phases.items()):
+        documents.append(document(
+            [['Phase']],
+            [('Duration', 'Seconds'), ('Runs', 'Count')],
+            {'Phase': name, 'Duration': round(total, 3), 'Runs': count, 'LongestRun': round(longest, 3)}))
+    return documents
+
+
+def emit(namespace=None):
+    """
+    Print the metrics of the run as EMF log lines.
+
+    :param namespace: CloudWatch namespace, defaults to the METRICS_NAMESPACE environment variable.
+    :return: None
+    """
+    for document in emf_documents(namespace):
+        print(json.dumps(document, separators=(',', ':')))
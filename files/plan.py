@@ -0,0 +1,149 @@
+"""
+Cleanup plan: the actions a run intends to take, to review and apply later.
+
+In dry-run mode the cleaners scan as usual but, instead of mutating anything,
+add the actions they would take to the plan of the run. The plan is saved to
+the store as JSON Lines, one action per line, so it can be reviewed, diffed or
+filtered with standard tools. Each invocation of a run (resumed from a
+checkpoint, or a shard) writes its own part under the key of the plan, so no
+invocation rewrites or can overwrite the actions of another. An apply run reads a plan back and only makes
+the mutating calls (see the appliers of cleaners/__init__.py), without
+scanning again. The resources the scan only notifies about are kept in the
+plan too, with a 'notify' outcome, so that applying it reports them as well.
+"""
+
+import json
+import os
+import threading
+import time
+import uuid
+from collections import namedtuple
+
+from accounts import current_account
+from store import get_store
+
+
+# service is the cleanup service (e.g. 'ec2-stop') whose applier carries the action out,
+# name is what the report shows when it isn't the resource ID, args are extra call parameters.
+# outcome is results.NOTIFY for a resource that is only reported, under service, and never applied.
+Action = namedtuple('Action', ['account', 'service', 'region', 'action', 'resource_id', 'name', 'args', 'outcome'],
+                    defaults=[None, None, None])
+
+TRUE_VALUES = {'true', 'yes', 'on', '1'}
+FALSE_VALUES = {'false', 'no', 'off', '0'}
+
+_lock = threading.Lock()
+_actions = []
+_warned = set()
+
+
+def is_dry_run():
+    """
+    Read the DRY_RUN environment variable, the only switch between planning and mutating.
+
+    :return: False only when DRY_RUN is an explicit false value (false, no, off, 0), in any case.
+    """
+    value = os.environ.get('DRY_RUN', '').strip().lower()
+    if value in FALSE_VALUES:
+        return False
+    if value and value not in TRUE_VALUES and value not in _warned:
+        _warned.add(value)
+        print(f'[ERROR]: Invalid DRY_RUN value "{value}", doing a dry run')
+    return True
+
+
+def new_action(service, region, action, resource_id, name=None, args=None, outcome=None):
+    """
+    :param service: Cleanup service carrying the action out (e.g. 'ec2-stop').
+    :param region: AWS region name.
+    :param action: Action to take (e.g. 'stop').
+    :param resource_id: ID of the resource, as the API expects it.
+    :param name: Name to report, if not the resource ID.
+    :param args: Dict of extra parameters of the call.
+    :param outcome: results.NOTIFY for a resource only reported, None for an action to take.
+    :return: Action on a resource of the current account.
+    """
+    return Action(current_account(), service, region, action, resource_id, name, args, outcome)
+
+
+def add_actions(actions):
+    """
+    Add actions to the plan of the current invocation.
+
+    :param actions: List of Action.
+    :return: None
+    """
+    with _lock:
+        _actions.extend(actions)
+
+
+def clear_plan():
+    """
+    Drop the actions planned by a previous invocation.
+
+    :return: None
+    """
+    with _lock:
+        _actions.clear()
+
+
+def plan_key(started):
+    """
+    :param started: Start time of the run (epoch seconds).
+    :return: Store key of the plan of the run, the prefix of its parts.
+    """
+    return time.strftime('plans/%Y-%m-%dT%H-%M-%SZ', time.gmtime(started))
+
+
+def save_plan(key, store=None):
+    """
+    Write the actions planned by the current invocation as a new part of a plan.
+
+    :param key: Store key of the plan.
+    :param store: Store to write to, defaults to the configured store.
+    :return: Number of actions written by this invocation.
+    """
+    with _lock:
+        actions = list(_actions)
+    lines = [json.dumps({field: value for field, value in action._asdict().items() if value is not None},
+                        separators=(',', ':')) for action in actions]
+    # Parts sort in the order they were written, the random suffix keeps concurrent shards apart
+    part = f'{key}/{time.time_ns():020d}-{uuid.uuid4().hex[:8]}.jsonl'
+    (store or get_store()).put(part, ''.join(f'{line}\n' for line in lines).encode())
+    return len(actions)
+
+
+def load_plan(key, store=None):
+    """
+    Read a plan, one part at a time.
+
+    :param key: Store key of the plan: the prefix of its parts, or a single JSON Lines object (e.g. a plan
+                filtered by hand).
+    :param store: Store to read from, defaults to the configured store.
+    :return: Generator of Action.
+    """
+    store = store or get_store()
+    parts = store.list_keys(f"{key.rstrip('/')}/") or [key]
+    for part in parts:
+        data = store.get(part)
+        if data is None:
+            raise KeyError(f'No plan at {key}')
+        for line in data.splitlines():
+            if line.strip():
+                # Empty fields are left out of the lines
+                fields = dict.fromkeys(Action._fields)
+                fields.update(json.loads(line))
+                yield Action(**fields)
+
+
+def group_actions(actions):
+    """
+    Group the actions of a plan into units of work.
+
+    :param actions: Iterable of Action.
+    :return: Dict of (account, service, region) to list of Action, in plan order.
+    """
+    groups = {}
+    for action in actions:
+        groups.setdefault((action.account, action.service, action.region), []).append(action)
+    return groups
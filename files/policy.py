@@ -0,0 +1,225 @@
+"""
+Declarative cleanup policy: which resources the cleaners leave alone.
+
+The policy is a list of rules, each naming the cleanup services it applies to
+(see cleaners/__init__.py, '*' for all of them), predicates on the resources
+and an action:
+
+    {"name": "upsolver-streams", "services": ["kinesis"],
+     "match": {"name_prefix": "upsolver_"}, "action": "notify"}
+
+A resource matches a rule when it matches all of its predicates, and the first
+matching rule decides: 'skip' leaves the resource alone, 'notify' leaves it
+alone and reports it. Resources no rule matches are cleaned as usual.
+
+Predicates:
+- names / ids: exact names or IDs;
+- name_prefix: a prefix, or a list of prefixes;
+- name_regex: a regular expression, searched in the name;
+- tags: tag key to value, '*' matching any value of the key;
+- tag_key_prefix: a prefix of any of the tag keys;
+- attributes: attribute name to a value, or a list of values (e.g. {"lifecycle": "spot"});
+- older_than_days / newer_than_days: age, for resources with a creation time;
+- live_eks_cluster: true to match resources tagged kubernetes.io/cluster/<name> of a live EKS cluster.
+
+The policy is read from the CLEANUP_POLICY environment variable (JSON) if set,
+otherwise from policy.json next to this module, and compiled once per run into
+matchers: name and ID sets, prefix tuples, precompiled regexes, tag key
+lookups and time cut-offs. The resources of a cleaner are evaluated in bulk,
+each predicate filtering the whole list in one pass.
+"""
+
+import json
+import os
+import re
+import threading
+import time
+from collections import namedtuple
+
+from cleaners import CLEANUP_SERVICES
+from eks_clusters import is_eks_cluster_live
+
+
+# What the predicates see of a resource: created is in epoch seconds, None when unknown
+PolicyResource = namedtuple('PolicyResource', ['id', 'name', 'tags', 'attributes', 'created'],
+                            defaults=[None, {}, {}, None])
+Rule = namedtuple('Rule', ['name', 'action', 'matches'])
+
+SKIP = 'skip'
+NOTIFY = 'notify'
+ALL_SERVICES = '*'
+ANY_VALUE = '*'
+EKS_CLUSTER_TAG_PREFIX = 'kubernetes.io/cluster/'
+DEFAULT_POLICY_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'policy.json')
+
+_lock = threading.Lock()
+_policy = None
+
+
+def _compile_predicate(kind, value):
+    """
+    :param kind: Predicate name.
+    :param value: Predicate value from the policy.
+    :return: Function of (region, list of PolicyResource) to the list of the resources matching the predicate.
+    """
+    # Each predicate filters a whole list in one comprehension, much cheaper than a call per resource
+    if kind == 'names':
+        names = frozenset(value)
+        return lambda region, resources: [r for r in resources if r.name in names]
+    if kind == 'ids':
+        ids = frozenset(value)
+        return lambda region, resources: [r for r in resources if r.id in ids]
+    if kind == 'name_prefix':
+        prefixes = (value,) if isinstance(value, str) else tuple(value)
+        return lambda region, resources: [r for r in resources if r.name is not None and r.name.startswith(prefixes)]
+    if kind == 'name_regex':
+        search = re.compile(value).search
+        return lambda region, resources: [r for r in resources if r.name is not None and search(r.name) is not None]
+    if kind == 'tags':
+        any_value = [key for key, tag_value in value.items() if tag_value == ANY_VALUE]
+        exact = [(key, tag_value) for key, tag_value in value.items() if tag_value != ANY_VALUE]
+
+        def tags(region, resources):
+            for key in any_value:
+                resources = [r for r in resources if key in r.tags]
+            for key, tag_value in exact:
+                resources = [r for r in resources if r.tags.get(key) == tag_value]
+            return resources
+        return tags
+    if kind == 'tag_key_prefix':
+        prefixes = (value,) if isinstance(value, str) else tuple(value)
+
+        def tag_key_prefix(region, resources):
+            # Few distinct tag keys are shared by many resources: match the keys once, then look them up
+            keys = {key for key in set().union(*[r.tags for r in resources]) if key.startswith(prefixes)}
+            return [r for r in resources if not keys.isdisjoint(r.tags)] if keys else []
+        return tag_key_prefix
+    if kind == 'attributes':
+        allowed = [(name, frozenset([values] if isinstance(values, str) else values)) for name, values in value.items()]
+
+        def attributes(region, resources):
+            for name, values in allowed:
+                resources = [r for r in resources if r.attributes.get(name) in values]
+            return resources
+        return attributes
+    if kind in ('older_than_days', 'newer_than_days'):
+        # The cut-off is taken when the policy is compiled, once per run
+        cutoff = time.time() - float(value) * 24 * 3600
+        if kind == 'older_than_days':
+            return lambda region, resources: [r for r in resources if r.created is not None and r.created < cutoff]
+        return lambda region, resources: [r for r in resources if r.created is not None and r.created >= cutoff]
+    if kind == 'live_eks_cluster':
+        def live_eks_cluster(region, resources):
+            keys = {key for key in set().union(*[r.tags for r in resources])
+                    if key.startswith(EKS_CLUSTER_TAG_PREFIX)
+                    and is_eks_cluster_live(region, key[len(EKS_CLUSTER_TAG_PREFIX):].split('/')[0])}
+            if value:
+                return [r for r in resources if not keys.isdisjoint(r.tags)] if keys else []
+            return [r for r in resources if keys.isdisjoint(r.tags)]
+        return live_eks_cluster
+    raise ValueError(f'Unknown predicate: {kind}')
+
+
+# Predicates are applied cheapest first, so the costly ones (regex, EKS lookups) see fewer resources
+PREDICATE_ORDER = ['ids', 'names', 'attributes', 'name_prefix', 'tags', 'tag_key_prefix', 'older_than_days',
+                   'newer_than_days', 'name_regex', 'live_eks_cluster']
+
+
+def compile_rule(rule):
+    """
+    :param rule: Rule of the policy, as a dict.
+    :return: Rule, whose matches function takes the region and a list of PolicyResource and
+             returns the ones matching every predicate of the rule.
+    """
+    name = rule.get('name', '<unnamed>')
+    action = rule.get('action', SKIP)
+    if action not in (SKIP, NOTIFY):
+        raise ValueError(f'Invalid action of policy rule {name}: {action}')
+    match = rule.get('match', {})
+    unknown = set(match) - set(PREDICATE_ORDER)
+    if unknown:
+        raise ValueError(f'Unknown predicates in policy rule {name}: {sorted(unknown)}')
+    if not match:
+        raise ValueError(f'Policy rule {name} has no predicate, it would match every resource')
+    predicates = [_compile_predicate(kind, match[kind]) for kind in PREDICATE_ORDER if kind in match]
+
+    def matches(region, resources):
+        for predicate in predicates:
+            if not resources:
+                break
+            resources = predicate(region, resources)
+        return resources
+    return Rule(name, action, matches)
+
+
+class CompiledPolicy:
+    """Rules of the policy, grouped by cleanup service."""
+
+    def __init__(self, rules, services):
+        self.rules = {service: [] for service in services}
+        for rule in rules:
+            compiled = compile_rule(rule)
+            targets = rule.get('services', [ALL_SERVICES])
+            for service in targets:
+                if service != ALL_SERVICES and service not in self.rules:
+                    raise ValueError(f'Unknown service in policy rule {compiled.name}: {service}')
+            for service in self.rules:
+                if ALL_SERVICES in targets or service in targets:
+                    self.rules[service].append(compiled)
+
+    def evaluate(self, service, region, resources):
+        """
+        Decide what to do with resources, in bulk: each rule filters the whole list at once.
+
+        :param service: Cleanup service (e.g. 'ec2-stop').
+        :param region: AWS region name.
+        :param resources: Iterable of PolicyResource.
+        :return: List of (PolicyResource, first matching Rule or None), in the order of the resources.
+        """
+        resources = list(resources)
+        decisions = {}
+        # Last rule first, so that the first matching rule overwrites the others
+        for rule in reversed(self.rules.get(service, [])):
+            decisions.update(dict.fromkeys(map(id, rule.matches(region, resources)), rule))
+        return list(zip(resources, map(decisions.get, map(id, resources))))
+
+
+def load_policy_rules():
+    """
+    Read the policy from the CLEANUP_POLICY environment variable, or the bundled policy.json.
+
+    :return: List of rules, as dicts.
+    """
+    source = os.environ.get('CLEANUP_POLICY', '').strip()
+    if not source:
+        with open(os.environ.get('POLICY_FILE', DEFAULT_POLICY_FILE)) as f:
+            source = f.read()
+    policy = json.loads(source)
+    # A bare list of rules is accepted too
+    return policy['rules'] if isinstance(policy, dict) else policy
+
+
+def get_policy():
+    """
+    Get the cleanup policy, compiling it on first use.
+
+    :return: CompiledPolicy.
+    """
+    global _policy
+    with _lock:
+        if _policy is None:
+            _policy = CompiledPolicy(load_policy_rules(), CLEANUP_SERVICES)
+            print(f'[INFO]: Cleanup policy: {sum(len(rules) for rules in _policy.rules.values())} rules '
+                  f'over {len(_policy.rules)} services')
+        return _policy
+
+
+def clear_policy():
+    """
+    Drop the compiled policy, so the next run reads it again.
+
+    :return: None
+    """
+    global _policy
+    with _lock:
+        _policy = None
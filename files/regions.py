@@ -0,0 +1,129 @@
+"""
+Discovery of the regions to clean.
+
+The regions enabled for the account are listed with describe_regions and kept
+for `REGIONS_CACHE_TTL` seconds, so warm invocations don't list them again.
+Optionally, regions without any resource the cleaners act upon are pruned
+beforehand with a single Resource Groups Tagging API call per region.
+"""
+
+import contextvars
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from accounts import current_account
+from clients import get_client
+
+
+# Regions cleaned when check_all_regions is off
+USED_REGIONS = [
+    'us-east-1',
+    'us-east-2',
+    'us-west-1',
+    'us-west-2',
+    'eu-central-1',
+    'eu-west-1'
+]
+
+REGIONS_CACHE_TTL = 6 * 60 * 60
+
+ENABLED_OPT_IN_STATUSES = ('opt-in-not-required', 'opted-in')
+
+# Resource types handled by the cleaners, as named by the Resource Groups Tagging API
+CLEANABLE_RESOURCE_TYPES = [
+    'ec2:instance',
+    'ec2:volume',
+    'ec2:elastic-ip',
+    'elasticloadbalancing:loadbalancer',
+    'rds:db',
+    'rds:cluster',
+    'eks:cluster',
+    'kinesis:stream',
+    'kafka:cluster',
+    'es:domain',
+]
+
+PRUNE_WORKERS = 10
+
+_lock = threading.Lock()
+_regions = {}
+
+
+def get_aws_regions():
+    """
+    Get the regions enabled for the current account, from the cache or describe_regions.
+
+    Opt-in regions are only returned once the account has opted in.
+
+    :return: List of AWS region names.
+    """
+    account = current_account()
+    with _lock:
+        cached = _regions.get(account)
+        if cached is not None and time.time() - cached[0] < REGIONS_CACHE_TTL:
+            return cached[1]
+
+    ec2 = get_client('ec2', os.environ.get('AWS_REGION', 'us-east-1'))
+    regions = []
+    for region in ec2.describe_regions(AllRegions=True)['Regions']:
+        if region['OptInStatus'] in ENABLED_OPT_IN_STATUSES:
+            regions.append(region['RegionName'])
+        else:
+            print(f"[INFO]: Skipping region {region['RegionName']}: {region['OptInStatus']}")
+    regions.sort()
+
+    with _lock:
+        _regions[account] = (time.time(), regions)
+    return regions
+
+
+def clear_regions():
+    """
+    Drop the cached region lists, so the next call lists the regions again.
+
+    :return: None
+    """
+    with _lock:
+        _regions.clear()
+
+
+def has_cleanable_resources(region):
+    """
+    Check whether a region holds any tagged resource of a type the cleaners act upon.
+
+    Resources that were never tagged are invisible to the Resource Groups Tagging
+    API, so a region may be reported empty while it isn't: only use this check
+    when every resource is tagged (e.g. through default tags or a tag policy).
+    A region that can't be checked is considered non-empty.
+
+    :param region: AWS region name.
+    :return: True if the region may have something to clean.
+    """
+    tagging = get_client('resourcegroupstaggingapi', region)
+    try:
+        response = tagging.get_resources(ResourceTypeFilters=CLEANABLE_RESOURCE_TYPES, ResourcesPerPage=1)
+    except Exception as e:
+        print(f'[ERROR]: Failed to check for resources in {region}. Error: {e}')
+        return True
+    return bool(response['ResourceTagMappingList'] or response.get('PaginationToken'))
+
+
+def prune_empty_regions(regions):
+    """
+    Drop the regions with nothing to clean, checking them concurrently.
+
+    :param regions: List of AWS region names.
+    :return: List of the regions that may have something to clean, in the same order.
+    """
+    with ThreadPoolExecutor(max_workers=PRUNE_WORKERS) as executor:
+        # Each check runs in a copy of the caller's context, to work on the same account
+        futures = [executor.submit(contextvars.copy_context().run, has_cleanable_resources, region)
+                   for region in regions]
+        non_empty = [future.result() for future in futures]
+    kept = [region for region, keep in zip(regions, non_empty) if keep]
+    pruned = [region for region, keep in zip(regions, non_empty) if not keep]
+    if pruned:
+        print(f'[INFO]: Skipping {len(pruned)} regions without resources to clean: {pruned}')
+    return kept
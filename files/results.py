@@ -0,0 +1,189 @@
+"""
+Per-invocation collector of the cleanup results.
+
+Every action taken (or skipped) on a resource is stored as a compact Record.
+Appends go to a per-thread shard, so workers never contend on a shared list.
+The first `max_records` records are kept in memory, the others are spilled to
+a JSON Lines file in /tmp, so the records and the counters stay complete
+whatever the size of the run.
+"""
+
+import itertools
+import json
+import os
+import tempfile
+import threading
+from collections import Counter, namedtuple
+
+from accounts import current_account
+
+
+Record = namedtuple('Record', ['account', 'service', 'region', 'resource_id', 'action', 'outcome', 'latency'])
+
+# Outcomes of an action
+DONE = 'done'
+SKIPPED = 'skipped'
+NOTIFY = 'notify'
+FAILED = 'failed'
+# Accepted by AWS, but not confirmed complete before the end of the invocation (see completion.py)
+PENDING = 'pending'
+
+DEFAULT_MAX_RECORDS = 50000
+
+
+class ResultCollector:
+    """Thread-safe, append-only store of the records of one invocation."""
+
+    def __init__(self, max_records=DEFAULT_MAX_RECORDS):
+        self.max_records = max_records
+        self.extras = {}
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._shards = []
+        self._sequence = itertools.count()
+        self._spill_path = None
+        self._spill = None
+
+    def _shard(self):
+        shard = getattr(self._local, 'shard', None)
+        if shard is None:
+            shard = ([], Counter())
+            self._local.shard = shard
+            with self._lock:
+                self._shards.append(shard)
+        return shard
+
+    def _store(self, record):
+        records, counters = self._shard()
+        counters[(record.account, record.service, record.region, record.outcome)] += 1
+        if next(self._sequence) < self.max_records:
+            records.append(record)
+            return
+        with self._lock:
+            if self._spill is None:
+                fd, self._spill_path = tempfile.mkstemp(prefix='aws-cleaner-records-', suffix='.jsonl')
+                self._spill = os.fdopen(fd, 'w')
+            self._spill.write(json.dumps(record, separators=(',', ':')) + '\n')
+
+    def add(self, service, region, resource_id, action, outcome, latency=None):
+        """
+        Record the outcome of an action on a resource of the current account.
+
+        :param service: Name of the AWS service.
+        :param region: AWS region name.
+        :param resource_id: ID or name of the resource.
+        :param action: Action taken (e.g. 'delete', 'stop').
+        :param outcome: One of DONE, SKIPPED, NOTIFY, FAILED or PENDING.
+        :param latency: Duration of the API call in seconds, if measured.
+        :return: None
+        """
+        self._store(Record(current_account(), service, region, resource_id, action, outcome, latency))
+
+    def merge(self, records):
+        """
+        Add the records of another invocation of the run (e.g. a shard, see fanout.py).
+
+        :param records: Iterable of Record.
+        :return: None
+        """
+        for record in records:
+            self._store(record)
+
+    def records(self, outcome=None):
+        """
+        Iterate over the records, the ones kept in memory first, then the spilled ones.
+
+        :param outcome: Only yield records with this outcome.
+        :return: Generator of Record.
+        """
+        with self._lock:
+            shards = list(self._shards)
+            spill_path = self._spill_path
+            if self._spill is not None:
+                self._spill.flush()
+        for records, _ in shards:
+            for record in records:
+                if outcome is None or record.outcome == outcome:
+                    yield record
+        if spill_path is None:
+            return
+        with open(spill_path) as f:
+            for line in f:
+                record = Record(*json.loads(line))
+                if outcome is None or record.outcome == outcome:
+                    yield record
+
+    def counts(self):
+        """
+        Count the records of every (account, service, region, outcome).
+
+        :return: Counter of (account, service, region, outcome) to number of records.
+        """
+        with self._lock:
+            shards = list(self._shards)
+        total = Counter()
+        for _, counters in shards:
+            total.update(counters)
+        return total
+
+    def summary(self):
+        """
+        Count the records of every (service, outcome) pair.
+
+        :return: Counter of (service, outcome) to number of records.
+        """
+        total = Counter()
+        for (_, service, _, outcome), count in self.counts().items():
+            total[(service, outcome)] += count
+        return total
+
+    def spilled(self):
+        """
+        :return: Number of records spilled to /tmp rather than kept in memory.
+        """
+        return max(0, sum(self.counts().values()) - self.max_records)
+
+    def close(self):
+        """
+        Delete the spilled records.
+
+        :return: None
+        """
+        with self._lock:
+            if self._spill is not None:
+                self._spill.close()
+                os.remove(self._spill_path)
+                self._spill = self._spill_path = None
+
+
+_collector = ResultCollector()
+
+
+def new_collector(max_records=DEFAULT_MAX_RECORDS):
+    """
+    Start a new collector for the current invocation.
+
+    :param max_records: Maximum number of records kept in memory, the others being spilled to /tmp.
+    :return: ResultCollector.
+    """
+    global _collector
+    # The records of the previous invocation are no longer needed
+    _collector.close()
+    _collector = ResultCollector(max_records)
+    return _collector
+
+
+def get_collector():
+    """
+    :return: The collector of the current invocation.
+    """
+    return _collector
+
+
+def record(service, region, resource_id, action, outcome, latency=None):
+    """
+    Record the outcome of an action in the collector of the current invocation.
+
+    See ResultCollector.add for the parameters.
+    """
+    _collector.add(service, region, resource_id, action, outcome, latency)
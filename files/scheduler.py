@@ -0,0 +1,137 @@
+"""
+Runs the cleanup as a set of (account, service, region) tasks through a single bounded thread pool.
+
+A task only starts once the tasks it depends on (same account and region) have
+finished, and no more than `service_limit` tasks of the same service, nor
+`account_limit` tasks of the same account, run at the same time. Each task
+runs in the context of its account (see accounts.py).
+When given the remaining time of the invocation, the scheduler stops starting
+new tasks once it gets below the reserve, and hands the rest back to the caller.
+"""
+
+import time
+from collections import namedtuple
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from accounts import account_context
+
+
+Task = namedtuple('Task', ['service', 'region', 'func', 'depends_on', 'account'], defaults=[None])
+TaskResult = namedtuple('TaskResult', ['service', 'region', 'duration', 'error', 'account'], defaults=[None])
+
+
+def task_key(task):
+    return task.account, task.service, task.region
+
+
+def build_tasks(services, regions, accounts=(None,)):
+    """
+    Build one task per (account, service, region).
+
+    :param services: Ordered mapping of service name to (per-region function, list of services it depends on).
+    :param regions: List of AWS region names.
+    :param accounts: List of account identifiers, None for the Lambda's own account.
+    :return: List of tasks, the accounts interleaved so that none waits for all the others.
+    """
+    return [Task(service, region, func, tuple(depends_on), account)
+            for service, (func, depends_on) in services.items()
+            for region in regions
+            for account in accounts]
+
+
+def run_tasks(tasks, max_workers=10, service_limit=5, time_left=None, reserve=0, account_limit=None):
+    """
+    Run tasks concurrently, respecting dependencies and per-service concurrency.
+
+    A task whose dependency failed still runs; a dependency only orders execution.
+
+    :param tasks: List of tasks.
+    :param max_workers: Maximum number of tasks running at the same time.
+    :param service_limit: Maximum number of tasks of the same service running at the same time.
+    :param time_left: Function returning the remaining time of the invocation in seconds, None for no deadline.
+    :param reserve: Don't start new tasks when less than this many seconds are left.
+    :param account_limit: Maximum number of tasks of the same account running at the same time, None for no limit.
+    :return: Tuple of (list of task results in completion order, list of tasks that were not started).
+    """
+    pending = list(tasks)
+    known = {task_key(task) for task in tasks}
+    done = set()
+    running_per_service = {}
+    running_per_account = {}
+    running = {}
+    results = []
+
+    def is_ready(task):
+        if running_per_service.get(task.service, 0) >= service_limit:
+            return False
+        if account_limit is not None and running_per_account.get(task.account, 0) >= account_limit:
+            return False
+        return all((task.account, dependency, task.region) in done
+                   or (task.account, dependency, task.region) not in known
+                   for dependency in task.depends_on)
+
+    def timed(task):
+        start = time.monotonic()
+        error = None
+        try:
+            with account_context(task.account):
+                task.func(task.region)
+        except Exception as e:
+            error = e
+            print(f'[ERROR]: Task {describe(task)} failed. Error: {e}')
+        return TaskResult(task.service, task.region, time.monotonic() - start, error, task.account)
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        while pending or running:
+            if pending and time_left is not None and time_left() < reserve:
+                print(f'[INFO]: Deadline approaching, {len(pending)} tasks will not be started')
+                break
+
+            for task in list(pending):
+                if len(running) >= max_workers:
+                    break
+                if is_ready(task):
+                    pending.remove(task)
+                    running[executor.submit(timed, task)] = task
+                    running_per_service[task.service] = running_per_service.get(task.service, 0) + 1
+                    running_per_account[task.account] = running_per_account.get(task.account, 0) + 1
+
+            if not running:
+                # Remaining tasks wait on dependencies that can never finish (dependency cycle)
+                raise RuntimeError(f'Unable to schedule tasks: {[task_key(t) for t in pending]}')
+
+            finished, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in finished:
+                task = running.pop(future)
+                running_per_service[task.service] -= 1
+                running_per_account[task.account] -= 1
+                done.add(task_key(task))
+                results.append(future.result())
+
+        # Tasks already running when the deadline was reached are waited for
+        for future in running:
+            results.append(future.result())
+
+    return results, pending
+
+
+def describe(task):
+    """
+    :param task: Task or TaskResult.
+    :return: Human readable name of the task.
+    """
+    if task.account is None:
+        return f'{task.service} in {task.region}'
+    return f'{task.service} in {task.account}/{task.region}'
+
+
+def print_task_report(results):
+    """
+    Print the wall time of every task, slowest first.
+
+    :param results: List of task results.
+    :return: None
+    """
+    for result in sorted(results, key=lambda r: r.duration, reverse=True):
+        status = 'FAILED' if result.error else 'OK'
+        print(f'[INFO]: Task {describe(result)}: {result.duration:.2f}s ({status})')
@@ -1,10 +1,295 @@
-def send_email(from_address, to_address, deleted_resources, skip_delete_resources, notify_resources, check_resources):
-    subject = "AWS: Auto clean resource data"
-    verified = verify_email_identity(from_address)
-
-    if verified:
-        html_body = get_email_body(deleted_resources, skip_delete_resources, notify_resources, check_resources)
-        send_html_email(from_address, to_address, subject, html_body)
-        print("Email sent successfully")
-    else:
-        print("Warning: Email address is not verified yet, unable to send email notification.")
+"""
+Email report of the cleanup.
+
+The report is built in a single pass over the records of the run (see
+results.py), all of them, including the ones spilled to /tmp. The HTML body
+only holds a summary: counts by service, region and outcome, from the exact
+counters of the collector, and the first REPORT_TOP_ITEMS resources of each
+outcome. The full
+detail is streamed to a gzipped CSV (or JSON Lines, REPORT_FORMAT=jsonl) file
+in /tmp, attached to the email when it fits, otherwise uploaded to the state
+store (see store.py) and linked from the email. Neither memory nor log volume
+grow with the number of resources.
+"""
+
+import csv
+import gzip
+import html
+import json
+import os
+import tempfile
+import time
+from email.mime.application import MIMEApplication
+from email.mime.multipart import MIMEMultipart
+from email.mime.text import MIMEText
+
+from clients import get_client
+import results
+from scheduler import describe
+from store import get_store
+
+
+SUBJECT = 'AWS: Auto clean resource data'
+DEFAULT_TOP_ITEMS = 20
+# SES accepts messages up to 10MB, and the attachment grows by a third once base64 encoded
+MAX_ATTACHMENT_BYTES = 7 * 1024 * 1024
+DETAIL_FIELDS = ['account', 'service', 'region', 'resource_id', 'action', 'outcome', 'latency']
+
+# Counters of throttling.throttling_report shown in the email, with their column titles
+THROTTLING_COLUMNS = [
+    ('calls', 'Calls'),
+    ('throttles', 'Throttles'),
+    ('wait_time', 'Wait (s)'),
+    ('throttled_then_succeeded', 'Throttled, then succeeded'),
+    ('failed_throttled', 'Throttled, then failed'),
+]
+
+# Sections of the email, in order
+SECTIONS = [
+    (results.FAILED, 'Resources to check: the action failed'),
+    (results.PENDING, 'Resources to check: the action had not completed by the end of the run'),
+    (results.NOTIFY, 'Resources to notify about'),
+    (results.DONE, 'Deleted, stopped or scaled in resources'),
+    (results.SKIPPED, 'Skipped resources (dry run)'),
+]
+
+
+class ReportBuilder:
+    """First records of each outcome of a run, with the full detail streamed to a gzipped file."""
+
+    def __init__(self, path, report_format='csv', top_items=DEFAULT_TOP_ITEMS):
+        self.path = path
+        self.report_format = report_format
+        self.top_items = top_items
+        self.top = {}
+        self.total = 0
+        self._file = gzip.open(path, 'wt', newline='')
+        if report_format == 'csv':
+            self._writer = csv.writer(self._file)
+            self._writer.writerow(DETAIL_FIELDS)
+
+    def add(self, record):
+        """
+        Keep a record if among the first of its outcome, and write it to the detail.
+
+        :param record: results.Record.
+        :return: None
+        """
+        self.total += 1
+        top = self.top.setdefault(record.outcome, [])
+        if len(top) < self.top_items:
+            top.append(record)
+        if self.report_format == 'csv':
+            self._writer.writerow(['' if value is None else value for value in record])
+        else:
+            self._file.write(json.dumps({field: value for field, value in record._asdict().items() if value is not None},
+                                        separators=(',', ':')) + '\n')
+
+    def close(self):
+        """
+        Finish the detail file.
+
+        :return: Size of the detail file in bytes.
+        """
+        self._file.close()
+        return os.path.getsize(self.path)
+
+
+def service_label(account, service):
+    """
+    :return: Service name shown in the report, prefixed with the account for member accounts.
+    """
+    return service if account is None else f'{account}/{service}'
+
+
+def verify_email_identity(address):
+    """
+    Check that SES may send from an address, asking SES to send a verification email if it was never requested.
+
+    :param address: Sender email address.
+    :return: True if the address is verified.
+    """
+    ses = get_client('ses', os.environ.get('AWS_REGION'), account=None)
+    attributes = ses.get_identity_verification_attributes(Identities=[address])['VerificationAttributes']
+    status = attributes.get(address, {}).get('VerificationStatus')
+    if status == 'Success':
+        return True
+    if status != 'Pending':
+        ses.verify_email_identity(EmailAddress=address)
+    return False
+
+
+def get_task_section(tasks):
+    """
+    :param tasks: List of scheduler.TaskResult of the run.
+    :return: HTML of the number of tasks run, with the failed ones and their error.
+    """
+    failed = [task for task in tasks if task.error]
+    parts = [f'<h3>Tasks: {len(tasks)} run, {len(failed)} failed</h3>']
+    if failed:
+        parts.append('<ul>')
+        for task in failed:
+            parts.append(f'<li>{html.escape(describe(task))}: {html.escape(str(task.error))}</li>')
+        parts.append('</ul>')
+    return '\n'.join(parts)
+
+
+def get_throttling_section(throttling):
+    """
+    :param throttling: Dict of 'service/region/operation' to its counters, as returned by throttle.throttling_report.
+    :return: HTML table of the throttled operations.
+    """
+    parts = ['<h3>Throttled operations</h3>', '<table border="1" cellpadding="4" cellspacing="0"><tr><th>Operation</th>'
+             + ''.join(f'<th>{title}</th>' for _, title in THROTTLING_COLUMNS) + '</tr>']
+    for operation, counters in sorted(throttling.items()):
+        parts.append(f'<tr><td>{html.escape(operation)}</td>'
+                     + ''.join(f'<td>{counters.get(name, 0)}</td>' for name, _ in THROTTLING_COLUMNS) + '</tr>')
+    parts.append('</table>')
+    return '\n'.join(parts)
+
+
+def get_email_body(builder, counts, detail, notes=(), extras=None):
+    """
+    Render the summary of a run as HTML.
+
+    :param builder: ReportBuilder holding the first records of each outcome.
+    :param counts: Counter of (account, service, region, outcome) to number of records.
+    :param detail: Sentence telling where the full detail is.
+    :param notes: Extra sentences about the run.
+    :param extras: Extras of the collector of the run: 'tasks' (list of scheduler.TaskResult) and 'throttling'
+                   (as returned by throttle.throttling_report) are rendered when present.
+    :return: HTML body.
+    """
+    extras = extras or {}
+    parts = ['<html><body>', '<h2>AWS nightly clean</h2>']
+    for note in list(notes) + [detail]:
+        parts.append(f'<p>{note}</p>')
+
+    parts.append('<table border="1" cellpadding="4" cellspacing="0">'
+                 '<tr><th>Service</th><th>Region</th><th>Outcome</th><th>Resources</th></tr>')
+    for (account, service, region, outcome), count in sorted(counts.items(),
+                                                            key=lambda item: [value or '' for value in item[0]]):
+        parts.append(f'<tr><td>{html.escape(service_label(account, service))}</td><td>{html.escape(region)}</td>'
+                     f'<td>{outcome}</td><td>{count}</td></tr>')
+    parts.append('</table>')
+
+    for outcome, title in SECTIONS:
+        top = builder.top.get(outcome)
+        if not top:
+            continue
+        count = sum(number for (_, _, _, record_outcome), number in counts.items() if record_outcome == outcome)
+        parts.append(f'<h3>{title} ({count})</h3><ul>')
+        for record in top:
+            parts.append(f'<li>{html.escape(service_label(record.account, record.service))} '
+                         f'{html.escape(record.region)}: {html.escape(str(record.resource_id))}</li>')
+        if count > len(top):
+            parts.append(f'<li>and {count - len(top)} more, see the full detail</li>')
+        parts.append('</ul>')
+
+    if extras.get('tasks'):
+        parts.append(get_task_section(extras['tasks']))
+    if extras.get('throttling'):
+        parts.append(get_throttling_section(extras['throttling']))
+    parts.append('</body></html>')
+    return '\n'.join(parts)
+
+
+def send_html_email(from_address, to_address, subject, html_body, attachment=None):
+    """
+    Send an HTML email through SES.
+
+    :param from_address: Verified sender address.
+    :param to_address: Recipient address.
+    :param subject: Subject of the email.
+    :param html_body: HTML body.
+    :param attachment: Tuple of (file name, path) of a file to attach, None for no attachment.
+    :return: None
+    """
+    message = MIMEMultipart('mixed')
+    message['Subject'] = subject
+    message['From'] = from_address
+    message['To'] = to_address
+    message.attach(MIMEText(html_body, 'html', 'utf-8'))
+    if attachment is not None:
+        name, path = attachment
+        with open(path, 'rb') as f:
+            part = MIMEApplication(f.read(), 'gzip')
+        part.add_header('Content-Disposition', 'attachment', filename=name)
+        message.attach(part)
+    get_client('ses', os.environ.get('AWS_REGION'), account=None).send_raw_email(
+        Source=from_address, Destinations=[to_address], RawMessage={'Data': message.as_bytes()})
+
+
+def build_report(records, path, report_format='csv'):
+    """
+    Stream records into a ReportBuilder.
+
+    :param records: Iterable of results.Record.
+    :param path: Path of the detail file to write.
+    :param report_format: 'csv' or 'jsonl'.
+    :return: Tuple of (ReportBuilder, size of the detail file in bytes).
+    """
+    builder = ReportBuilder(path, report_format, int(os.environ.get('REPORT_TOP_ITEMS', DEFAULT_TOP_ITEMS)))
+    try:
+        for record in records:
+            builder.add(record)
+    finally:
+        size = builder.close()
+    return builder, size
+
+
+def send_email(from_address, to_address, collector):
+    """
+    Send the report of a run.
+
+    :param from_address: Verified sender address.
+    :param to_address: Recipient address.
+    :param collector: results.ResultCollector of the run.
+    :return: None
+    """
+    if not verify_email_identity(from_address):
+        print('[ERROR]: Email address is not verified yet, unable to send email notification')
+        return
+
+    report_format = 'jsonl' if os.environ.get('REPORT_FORMAT') == 'jsonl' else 'csv'
+    name = time.strftime(f'aws-cleaner-report-%Y-%m-%dT%H-%M-%SZ.{report_format}.gz', time.gmtime())
+    fd, path = tempfile.mkstemp(suffix=f'.{report_format}.gz')
+    os.close(fd)
+    try:
+        builder, size = build_report(collector.records(), path, report_format)
+        notes = []
+        if collector.extras.get('missing_shards'):
+            notes.append(f"{collector.extras['missing_shards']} shards of the run had not reported their results.")
+        if collector.extras.get('pending_tasks'):
+            notes.append(f"{collector.extras['pending_tasks']} tasks were not started before the deadline, "
+                         f"they are saved in the checkpoint for the next invocation.")
+        if collector.extras.get('not_run_tasks'):
+            notes.append(f"{collector.extras['not_run_tasks']} tasks were not run, the time ran out before they started.")
+        if collector.extras.get('plan'):
+            notes.append(f"Dry run: the planned actions were saved to {html.escape(collector.extras['plan'])}.")
+
+        attachment = None
+        if not builder.total:
+            detail = 'No resource was handled.'
+        elif size <= MAX_ATTACHMENT_BYTES:
+            attachment = (name, path)
+            detail = f'The full detail of the {builder.total} resources is attached ({name}).'
+        else:
+            key = f'reports/{name}'
+            store = get_store()
+            store.put_file(key, path)
+            link = store.get_link(key)
+            if link:
+                detail = (f'The full detail of the {builder.total} resources is too large to attach, '
+                          f'<a href="{html.escape(link)}">open it in the S3 console</a> '
+                          f'(needs read access to the state bucket).')
+            else:
+                detail = (f'The full detail of the {builder.total} resources is too large to attach, '
+                          f'it was saved to {key} in the state store.')
+            print(f'[INFO]: Report detail ({size} bytes) saved to {key}')
+
+        body = get_email_body(builder, collector.counts(), detail, notes, collector.extras)
+        send_html_email(from_address, to_address, SUBJECT, body, attachment)
+    finally:
+        os.remove(path)
+    print(f'[INFO]: Email sent with {builder.total} resources')
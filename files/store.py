@@ -0,0 +1,242 @@
+"""
+Pluggable key/value store for state that outlives a single invocation.
+
+S3 is used when STATE_BUCKET is set, otherwise a local directory (STATE_DIR,
+/tmp by default), which survives warm invocations and is what tests use.
+"""
+
+import json
+import os
+import shutil
+import threading
+from urllib.parse import quote, urlencode
+
+from clients import get_client
+
+
+class Store:
+    """Base class of the stores: subclasses implement get and put on raw bytes."""
+
+    def get(self, key):
+        """
+        Read an object.
+
+        :param key: Object key.
+        :return: Object content as bytes, None if it doesn't exist.
+        """
+        raise NotImplementedError
+
+    def put(self, key, data):
+        """
+        Write an object, replacing it if it exists.
+
+        :param key: Object key.
+        :param data: Object content as bytes.
+        :return: None
+        """
+        raise NotImplementedError
+
+    def delete(self, key):
+        """
+        Delete an object, if it exists.
+
+        :param key: Object key.
+        :return: None
+        """
+        raise NotImplementedError
+
+    def list_keys(self, prefix):
+        """
+        List the objects under a prefix.
+
+        :param prefix: Key prefix, ending with '/'.
+        :return: Sorted list of the keys under the prefix.
+        """
+        raise NotImplementedError
+
+    def put_if_absent(self, key, data):
+        """
+        Write an object only if it doesn't exist yet, atomically: of concurrent writers, only one succeeds.
+
+        :param key: Object key.
+        :param data: Object content as bytes.
+        :return: True if the object was written, False if it already existed.
+        """
+        raise NotImplementedError
+
+    def put_file(self, key, path):
+        """
+        Write an object from a local file, replacing it if it exists.
+
+        :param key: Object key.
+        :param path: Path of the file to upload.
+        :return: None
+        """
+        with open(path, 'rb') as f:
+            self.put(key, f.read())
+
+    def get_link(self, key):
+        """
+        :param key: Object key.
+        :return: URL of the object for the people with access to the store, None if the store has no shareable links.
+        """
+        return None
+
+    def get_json(self, key, default=None):
+        data = self.get(key)
+        return default if data is None else json.loads(data)
+
+    def put_json(self, key, value):
+        self.put(key, json.dumps(value, separators=(',', ':')).encode())
+
+
+class LocalFileStore(Store):
+    """Store backed by a local directory, one file per key."""
+
+    def __init__(self, directory):
+        self.directory = directory
+
+    def _path(self, key):
+        return os.path.join(self.directory, *key.split('/'))
+
+    def get(self, key):
+        try:
+            with open(self._path(key), 'rb') as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    def put(self, key, data):
+        # Write to a temporary file first so readers never see a partial object
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+    def delete(self, key):
+        try:
+            os.remove(self._path(key))
+        except FileNotFoundError:
+            pass
+
+    def list_keys(self, prefix):
+        directory = self._path(prefix.rstrip('/'))
+        keys = []
+        for path, _, names in os.walk(directory):
+            relative = os.path.relpath(path, directory)
+            for name in names:
+                # Skip the temporary files of writes in progress
+                if not name.endswith('.tmp'):
+                    keys.append(prefix + '/'.join(part for part in [relative, name] if part != '.'))
+        return sorted(keys)
+
+    def put_if_absent(self, key, data):
+        # Linking fails if the target exists, unlike a rename
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        try:
+            os.link(tmp_path, path)
+            return True
+        except FileExistsError:
+            return False
+        finally:
+            os.remove(tmp_path)
+
+    def put_file(self, key, path):
+        target = self._path(key)
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        tmp_path = f'{target}.{os.getpid()}.{threading.get_ident()}.tmp'
+        shutil.copyfile(path, tmp_path)
+        os.replace(tmp_path, target)
+
+
+class S3Store(Store):
+    """Store backed by an S3 bucket, one object per key."""
+
+    def __init__(self, bucket, prefix='aws-cleaner'):
+        self.bucket = bucket
+        self.prefix = prefix
+
+    def _key(self, key):
+        return f'{self.prefix}/{key}' if self.prefix else key
+
+    def _client(self):
+        # The bucket belongs to the Lambda's own account, whichever account the current task works on
+        return get_client('s3', os.environ.get('AWS_REGION'), account=None)
+
+    def get(self, key):
+        s3 = self._client()
+        try:
+            return s3.get_object(Bucket=self.bucket, Key=self._key(key))['Body'].read()
+        except s3.exceptions.NoSuchKey:
+            return None
+
+    def put(self, key, data):
+        self._client().put_object(Bucket=self.bucket, Key=self._key(key), Body=data)
+
+    def delete(self, key):
+        self._client().delete_object(Bucket=self.bucket, Key=self._key(key))
+
+    def list_keys(self, prefix):
+        keys = []
+        start = len(self._key(''))
+        for page in self._client().get_paginator('list_objects_v2').paginate(Bucket=self.bucket,
+                                                                              Prefix=self._key(prefix)):
+            keys += [item['Key'][start:] for item in page.get('Contents', [])]
+        return sorted(keys)
+
+    def put_if_absent(self, key, data):
+        s3 = self._client()
+        try:
+            s3.put_object(Bucket=self.bucket, Key=self._key(key), Body=data, IfNoneMatch='*')
+            return True
+        except s3.exceptions.ClientError as e:
+            # 409 ConditionalRequestConflict when a concurrent conditional write is in progress
+            if e.response['Error']['Code'] in ('PreconditionFailed', 'ConditionalRequestConflict'):
+                return False
+            raise
+
+    def put_file(self, key, path):
+        # Multipart upload, the file is never read in memory as a whole
+        self._client().upload_file(path, self.bucket, self._key(key))
+
+    def get_link(self, key):
+        # A presigned URL would be signed with the Lambda's session credentials and expire with them,
+        # within hours: the console URL of the object works as long as the reader has access to the bucket
+        query = urlencode({'region': os.environ.get('AWS_REGION'), 'prefix': self._key(key)})
+        return f'https://s3.console.aws.amazon.com/s3/object/{quote(self.bucket)}?{query}'
+
+
+_store = None
+
+
+def get_store():
+    """
+    Get the store configured by the environment.
+
+    :return: S3Store if STATE_BUCKET is set, LocalFileStore otherwise.
+    """
+    global _store
+    if _store is None:
+        bucket = os.environ.get('STATE_BUCKET')
+        if bucket:
+            _store = S3Store(bucket)
+        else:
+            _store = LocalFileStore(os.environ.get('STATE_DIR', '/tmp/aws-cleaner'))
+    return _store
+
+
+def set_store(store):
+    """
+    Replace the configured store (e.g. with a LocalFileStore in tests).
+
+    :param store: Store instance, None to go back to the environment configuration.
+    :return: None
+    """
+    global _store
+    _store = store
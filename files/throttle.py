@@ -0,0 +1,243 @@
+"""
+Adaptive client-side throttling.
+
+Every (service, region, operation) of an account gets a token bucket. Its rate is halved when
+AWS answers with a throttling error and grows back by a fixed step on every
+success (AIMD). Throttled calls are retried with full-jitter exponential
+backoff, and each call is counted as clean, "throttled and then succeeded" or
+"failed", so throttling shows up in the run report instead of as failures.
+
+The controller hooks into botocore's event system, so it covers every call
+made by a client, including the ones made by paginators.
+"""
+
+import random
+import threading
+import time
+from collections import Counter
+
+from clients import is_async_client
+
+
+THROTTLE_ERROR_CODES = {
+    'Throttling',
+    'ThrottlingException',
+    'ThrottledException',
+    'RequestThrottled',
+    'RequestThrottledException',
+    'RequestLimitExceeded',
+    'TooManyRequestsException',
+    'ProvisionedThroughputExceededException',
+    'SlowDown',
+}
+
+INITIAL_RATE = 20.0
+MIN_RATE = 0.5
+MAX_RATE = 100.0
+RATE_INCREASE = 1.0
+RATE_DECREASE_FACTOR = 0.5
+
+MAX_THROTTLE_ATTEMPTS = 8
+BACKOFF_BASE = 0.2
+BACKOFF_MAX = 20.0
+
+
+class TokenBucket:
+    """Token bucket whose refill rate follows AIMD."""
+
+    def __init__(self, rate=INITIAL_RATE):
+        self.rate = rate
+        self.tokens = 1.0
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, now):
+        # Allow bursts of up to one second worth of calls
+        self.tokens = min(max(self.rate, 1.0), self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def _take(self):
+        """
+        Take a token if one is available.
+
+        :return: None if a token was taken, otherwise the time until the next one in seconds.
+        """
+        with self._lock:
+            self._refill(time.monotonic())
+            if self.tokens >= 1.0:
+                self.tokens -= 1.0
+                return None
+            return (1.0 - self.tokens) / self.rate
+
+    def acquire(self):
+        """
+        Take a token, sleeping until one is available.
+
+        :return: Time waited in seconds.
+        """
+        waited = 0.0
+        while True:
+            delay = self._take()
+            if delay is None:
+                return waited
+            time.sleep(delay)
+            waited += delay
+
+    async def acquire_async(self):
+        """
+        Take a token, waiting without blocking the event loop until one is available.
+
+        :return: Time waited in seconds.
+        """
+        # Only async clients get here, asyncio is already loaded by then and stays out of the cold start
+        import asyncio
+
+        waited = 0.0
+        while True:
+            delay = self._take()
+            if delay is None:
+                return waited
+            await asyncio.sleep(delay)
+            waited += delay
+
+    def on_success(self):
+        with self._lock:
+            self.rate = min(MAX_RATE, self.rate + RATE_INCREASE)
+
+    def on_throttle(self):
+        with self._lock:
+            self.rate = max(MIN_RATE, self.rate * RATE_DECREASE_FACTOR)
+
+
+_lock = threading.Lock()
+_stats_lock = threading.Lock()
+_buckets = {}
+_stats = {}
+
+
+def get_bucket(key):
+    bucket = _buckets.get(key)
+    if bucket is None:
+        with _lock:
+            bucket = _buckets.setdefault(key, TokenBucket())
+    return bucket
+
+
+def count(key, name, value=1):
+    with _stats_lock:
+        _stats.setdefault(key, Counter())[name] += value
+
+
+def backoff_delay(attempts):
+    """
+    Full-jitter exponential backoff.
+
+    :param attempts: Number of attempts made so far (1 after the first call).
+    :return: Delay in seconds.
+    """
+    return random.uniform(0, min(BACKOFF_MAX, BACKOFF_BASE * 2 ** attempts))
+
+
+def is_throttle_response(response):
+    """
+    :param response: (http response, parsed response) tuple, None when the call raised an exception.
+    :return: True if AWS answered with a throttling error.
+    """
+    return response is not None and response[1].get('Error', {}).get('Code') in THROTTLE_ERROR_CODES
+
+
+def install(client, region, account=None):
+    """
+    Attach the throttling controller to a client.
+
+    :param client: boto3 or aiobotocore client.
+    :param region: AWS region name of the client.
+    :param account: Account of the client, None for the Lambda's own account.
+    :return: None
+    """
+    service = client.meta.service_model.service_name
+    service_id = client.meta.service_model.service_id.hyphenize()
+    events = client.meta.events
+
+    def key_of(operation_name):
+        # API rate limits apply per account
+        if account is None:
+            return (service, region, operation_name)
+        return (account, service, region, operation_name)
+
+    def before_call(model, context, **kwargs):
+        key = key_of(model.name)
+        context['throttle_attempts'] = 0
+        waited = get_bucket(key).acquire()
+        count(key, 'calls')
+        count(key, 'wait_time', waited)
+
+    async def before_async_call(model, context, **kwargs):
+        key = key_of(model.name)
+        context['throttle_attempts'] = 0
+        waited = await get_bucket(key).acquire_async()
+        count(key, 'calls')
+        count(key, 'wait_time', waited)
+
+    def needs_retry(response, operation, attempts, request_dict, **kwargs):
+        if not is_throttle_response(response):
+            return None
+        key = key_of(operation.name)
+        get_bucket(key).on_throttle()
+        count(key, 'throttles')
+        request_dict['context']['throttle_attempts'] = attempts
+        if attempts >= MAX_THROTTLE_ATTEMPTS:
+            return None
+        delay = backoff_delay(attempts)
+        count(key, 'wait_time', delay)
+        return delay
+
+    def after_call(http_response, model, context, **kwargs):
+        key = key_of(model.name)
+        throttled = context.get('throttle_attempts', 0) > 0
+        if http_response.status_code < 300:
+            get_bucket(key).on_success()
+            if throttled:
+                count(key, 'throttled_then_succeeded')
+        elif throttled:
+            count(key, 'failed_throttled')
+
+    events.register('before-call', before_async_call if is_async_client(client) else before_call)
+    # Registered first on the same event as botocore's retry handler, so throttles are retried here
+    events.register_first(f'needs-retry.{service_id}', needs_retry)
+    events.register('after-call', after_call)
+
+
+def reset_stats():
+    """
+    Reset the counters at the start of an invocation. Bucket rates are kept,
+    a warm container keeps what it learned about each API's limits.
+
+    :return: None
+    """
+    with _stats_lock:
+        _stats.clear()
+
+
+def clear_buckets():
+    """
+    Forget the learned rate of every operation.
+
+    :return: None
+    """
+    with _lock:
+        _buckets.clear()
+
+
+def throttling_report():
+    """
+    Summarize the throttled operations.
+
+    :return: Dict of 'service/region/operation' to its counters (throttles, wait time, outcomes).
+    """
+    with _stats_lock:
+        stats = {key: Counter(counters) for key, counters in _stats.items()}
+    return {'/'.join(key): {name: round(value, 3) if isinstance(value, float) else value
+                            for name, value in counters.items()}
+            for key, counters in sorted(stats.items())
+            if counters['throttles']}
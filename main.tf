@@ -14,16 +14,31 @@ module "lambda_function" {
   timeout       = var.function_timeout
 
   source_path = "files"
+  layers      = var.layers
 
   attach_policy = true
   policy        = "arn:aws:iam::aws:policy/AdministratorAccess"
 
   environment_variables = {
     CHECK_ALL_REGIONS = var.check_all_regions
-    KEEP_TAG_KEY      = var.keep_tag_key["auto-deletion"]
+    KEEP_TAGS         = jsonencode(var.keep_tag_key)
     DRY_RUN           = var.dry_run
     EMAIL_IDENTITY    = var.email_identity
     TO_ADDRESS        = var.to_address
+
+    MAX_WORKERS             = var.max_workers
+    MAX_WORKERS_PER_SERVICE = var.max_workers_per_service
+    STATE_BUCKET            = var.state_bucket
+    SELF_REINVOKE           = var.self_reinvoke
+    ACCOUNT_ROLE_ARNS       = join(",", var.account_role_arns)
+    MAX_WORKERS_PER_ACCOUNT = var.max_workers_per_account
+    PRUNE_EMPTY_REGIONS     = var.prune_empty_regions
+    ENABLED_SERVICES        = join(",", var.enabled_services)
+    SCAN_BACKEND            = var.scan_backend
+    COMPLETION_WAIT_SECONDS = var.completion_wait_seconds
+    REPORT_FORMAT           = var.report_format
+    CLEANUP_POLICY          = var.cleanup_policy == null ? "" : jsonencode(var.cleanup_policy)
+    SHARD_BY                = var.shard_by
   }
 
   allowed_triggers = {
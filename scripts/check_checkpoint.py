@@ -0,0 +1,149 @@
+"""
+Check the checkpoint and self-reinvoke path of a run (see files/checkpoint.py) offline.
+
+Runs lambda_handler once without deadline, then again, against the same
+synthetic accounts (see benchmarks/offline.py), with a deadline that comes
+before the run is done and SELF_REINVOKE=true: each invocation saves a
+checkpoint of the tasks it didn't start and invokes the function again, the
+invocations being run in-process by a LocalInvoker on a local store, each
+without the clients and accounts of the previous one, as in a new container. Checks
+that the run took several invocations, that each resumed invocation ran only
+tasks pending in the checkpoint, none twice, that together they report the
+same records and tasks as the single invocation, and that the checkpoint is
+deleted at the end. Then checks that an explicit 'apply' event applies its plan
+rather than the run of a checkpoint, dropping the checkpoint, and that a
+'resume' event without checkpoint does nothing. Exits with status 1 otherwise.
+
+Usage: python scripts/check_checkpoint.py [--deadline-ms 50]
+"""
+
+import argparse
+import io
+import os
+import sys
+import time
+from contextlib import redirect_stdout
+
+ROOT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, os.path.join(ROOT_DIR, 'files'))
+sys.path.insert(0, os.path.join(ROOT_DIR, 'benchmarks'))
+
+# First, for the environment of the offline run
+import offline  # noqa: E402
+import checkpoint  # noqa: E402
+import clients  # noqa: E402
+import index  # noqa: E402
+import invoker  # noqa: E402
+import plan  # noqa: E402
+import store  # noqa: E402
+from offline import ACCOUNTS, EVENT, REGIONS  # noqa: E402
+
+
+def run(deadline_ms=None):
+    """
+    Run the handler against fresh synthetic accounts, then the invocations it starts.
+
+    :param deadline_ms: Time of each invocation before its deadline reserve, None for no deadline.
+    :return: List of (tasks pending in the checkpoint before the invocation, None for the first one,
+             collector it reported) of each invocation.
+    """
+    offline.reset('check-checkpoint')
+    new_context = (lambda: offline.DeadlineContext(deadline_ms)) if deadline_ms is not None else None
+
+    invocations = []
+    reports = offline.capture_reports()
+
+    def handler(event, context):
+        if invocations:
+            # Each invocation starts in a new container, with only its event to know the member accounts
+            clients.clear_clients()
+        saved = checkpoint.load_checkpoint()
+        pending = None if saved is None else {tuple(task) for task in saved['pending']}
+        index.lambda_handler(event, context)
+        invocations.append((pending, reports[-1]))
+
+    local = invoker.LocalInvoker(handler, new_context)
+    invoker.set_invoker(local)
+    with redirect_stdout(io.StringIO()):
+        handler(EVENT, new_context() if new_context else None)
+        local.drain()
+    return invocations
+
+
+def task_keys(collector):
+    """
+    :return: List of (account, service, region) of the tasks a collector reports.
+    """
+    return [(task.account, task.service, task.region) for task in collector.extras['tasks']]
+
+
+def check_explicit_events():
+    """
+    Send an 'apply' event while a checkpoint is saved, then a 'resume' event without checkpoint.
+
+    :return: List of the problems found.
+    """
+    backend, _ = offline.reset('check-checkpoint')
+    account, region = ACCOUNTS[0], REGIONS[0]
+    volume_id = next(iter(backend.data[(account, region)].volumes))
+    key = 'plans/check-checkpoint'
+    plan.clear_plan()
+    plan.add_actions([plan.Action(account, 'ebs', region, 'delete', volume_id)])
+    plan.save_plan(key)
+    plan.clear_plan()
+    checkpoint.save_checkpoint(time.time(), [], [(account, 'ec2-stop', region)])
+
+    reports = offline.capture_reports()
+    with redirect_stdout(io.StringIO()):
+        index.lambda_handler(dict(EVENT, apply=key), None)
+    problems = []
+    applied = [(record.service, record.resource_id, record.outcome) for record in reports[0].records()]
+    if applied != [('ebs', volume_id, 'done')]:
+        problems.append(f'the apply event with a checkpoint saved reported {len(applied)} records, not its plan')
+    if checkpoint.load_checkpoint() is not None:
+        problems.append('the apply event kept the checkpoint of the unfinished run')
+
+    with redirect_stdout(io.StringIO()):
+        index.lambda_handler(dict(EVENT, resume=True), None)
+    if len(reports) > 1:
+        problems.append(f'the resume event without checkpoint ran {len(list(reports[1].records()))} records')
+    return problems
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--deadline-ms', type=float, default=50, help='Time of each invocation before its deadline reserve')
+    args = parser.parse_args()
+    os.environ['SELF_REINVOKE'] = 'true'
+
+    (_, single), = run()
+    expected = offline.outcomes([single])
+    expected_tasks = sorted(task_keys(single))
+    print(f'single invocation: {len(expected)} records, {len(expected_tasks)} tasks')
+
+    invocations = run(args.deadline_ms)
+    problems = []
+    if len(invocations) < 2:
+        problems.append(f'the run took {len(invocations)} invocation, the deadline never came')
+    ran = []
+    for number, (pending, report) in enumerate(invocations):
+        tasks = task_keys(report)
+        if number and (pending is None or not set(tasks) <= pending):
+            problems.append(f'invocation {number + 1} ran tasks that were not pending in the checkpoint')
+        ran += tasks
+    if sorted(ran) != expected_tasks:
+        problems.append(f'{len(ran)} tasks run, {len(set(ran))} distinct, instead of {len(expected_tasks)}')
+    if offline.outcomes(report for _, report in invocations) != expected:
+        problems.append(f'{len(set(offline.outcomes(report for _, report in invocations)) ^ set(expected))} records differ')
+    if store.get_store().get(checkpoint.CHECKPOINT_KEY) is not None:
+        problems.append(f'{checkpoint.CHECKPOINT_KEY} was not deleted at the end of the run')
+    records = len(offline.outcomes(report for _, report in invocations))
+    problems += check_explicit_events()
+    for problem in problems:
+        print(f'[ERROR]: {problem}')
+    print(f'with a deadline: {len(invocations)} invocations, {records} records, {len(ran)} tasks')
+    return 1 if problems else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,127 @@
+"""
+Check the CloudWatch Embedded Metric Format documents printed by the handler.
+
+Runs lambda_handler against a small synthetic account (see benchmarks/offline.py),
+collects the EMF lines it prints and validates them against the EMF
+specification, then checks that every API operation, in every region, and
+cleaner phase shows up. Exits with status 1 on the first invalid document or missing metric.
+
+Usage: python scripts/check_emf.py
+"""
+
+import io
+import json
+import numbers
+import os
+import sys
+from contextlib import redirect_stdout
+
+ROOT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, os.path.join(ROOT_DIR, 'files'))
+sys.path.insert(0, os.path.join(ROOT_DIR, 'benchmarks'))
+
+# First, for the environment of the offline run
+import offline  # noqa: E402
+import index  # noqa: E402
+from fake_aws import FAKE_ACCOUNT  # noqa: E402
+
+
+REGIONS = ['us-east-1', 'eu-west-1']
+# Limits of the EMF specification
+MAX_METRICS = 100
+MAX_DIMENSIONS = 30
+MAX_VALUES = 100
+UNITS = {'Seconds', 'Microseconds', 'Milliseconds', 'Bytes', 'Kilobytes', 'Megabytes', 'Gigabytes', 'Terabytes',
+         'Bits', 'Kilobits', 'Megabits', 'Gigabits', 'Terabits', 'Percent', 'Count', 'Bytes/Second',
+         'Kilobytes/Second', 'Megabytes/Second', 'Gigabytes/Second', 'Terabytes/Second', 'Bits/Second',
+         'Kilobits/Second', 'Megabits/Second', 'Gigabits/Second', 'Terabits/Second', 'Count/Second', 'None'}
+
+
+def validate(document):
+    """
+    :param document: Parsed EMF document.
+    :return: List of problems, empty when the document is valid.
+    """
+    problems = []
+    metadata = document.get('_aws')
+    if not isinstance(metadata, dict):
+        return ['missing _aws metadata']
+    if not isinstance(metadata.get('Timestamp'), int):
+        problems.append('Timestamp is not an integer')
+    directives = metadata.get('CloudWatchMetrics')
+    if not isinstance(directives, list) or not directives:
+        return problems + ['missing CloudWatchMetrics']
+
+    for directive in directives:
+        if not directive.get('Namespace'):
+            problems.append('missing Namespace')
+        for dimension_set in directive.get('Dimensions', []):
+            if len(dimension_set) > MAX_DIMENSIONS:
+                problems.append(f'more than {MAX_DIMENSIONS} dimensions')
+            for dimension in dimension_set:
+                if not isinstance(document.get(dimension), str):
+                    problems.append(f'dimension {dimension} is not a string member')
+        metrics = directive.get('Metrics', [])
+        if not metrics or len(metrics) > MAX_METRICS:
+            problems.append(f'{len(metrics)} metrics')
+        for metric in metrics:
+            name = metric.get('Name')
+            value = document.get(name)
+            values = value if isinstance(value, list) else [value]
+            if not all(isinstance(v, numbers.Number) for v in values):
+                problems.append(f'metric {name} is not numeric')
+            if len(values) > MAX_VALUES:
+                problems.append(f'metric {name} has more than {MAX_VALUES} values')
+            if metric.get('Unit', 'None') not in UNITS:
+                problems.append(f'metric {name} has an invalid unit')
+    return problems
+
+
+def main():
+    backend, _ = offline.reset('check-emf', REGIONS, [FAKE_ACCOUNT], dict(
+        instances=50, volumes=50, addresses=10, load_balancers=5, db_instances=5, db_clusters=2,
+        eks_clusters=2, streams=5, msk_clusters=2, domains=2, v2_load_balancers=5))
+    offline.capture_reports()
+
+    output = io.StringIO()
+    with redirect_stdout(output):
+        index.lambda_handler({}, None)
+
+    documents = []
+    for line in output.getvalue().splitlines():
+        if line.startswith('{') and '"_aws"' in line:
+            documents.append(json.loads(line))
+
+    failed = False
+    for document in documents:
+        for problem in validate(document):
+            print(f'[ERROR]: {problem}: {json.dumps(document)[:200]}')
+            failed = True
+
+    operations = {(d['Service'], d['Operation']) for d in documents if 'Operation' in d}
+    for service, operation in backend.calls:
+        if (service, operation) not in operations:
+            print(f'[ERROR]: No metrics for {service}.{operation}')
+            failed = True
+    # Every region of the run can be graphed on its own
+    by_region = {(d['Service'], d['Region'], d['Operation']) for d in documents if 'Operation' in d
+                 and ['Service', 'Region', 'Operation'] in d['_aws']['CloudWatchMetrics'][0]['Dimensions']}
+    if len(by_region) != sum(1 for d in documents if 'Operation' in d):
+        print('[ERROR]: Operation metrics without the Service, Region, Operation dimensions')
+        failed = True
+    for region in REGIONS:
+        if ('ec2', region, 'DescribeInstances') not in by_region:
+            print(f'[ERROR]: No metrics for ec2.DescribeInstances in {region}')
+            failed = True
+    phases = {d['Phase'] for d in documents if 'Phase' in d}
+    for expected in ['regions', 'cleanup', 'report', 'cleaner:ec2-stop']:
+        if expected not in phases:
+            print(f'[ERROR]: No metrics for phase {expected}')
+            failed = True
+
+    print(f'{len(documents)} EMF documents, {len(operations)} operations, {len(phases)} phases')
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
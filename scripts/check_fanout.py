@@ -0,0 +1,92 @@
+"""
+Check the sharded fan-out of a run (see files/fanout.py) offline.
+
+Runs lambda_handler once in a single invocation, then as a dispatcher for each
+way of sharding, against the same synthetic accounts (see benchmarks/offline.py),
+the worker invocations being run in-process by a LocalInvoker and sharing a
+LocalFileStore. With --deadline-ms, every worker gets that much time before its
+reserve, so shards are continued over several invocations. Checks that every
+sharded run sends exactly one report, with the same records and tasks as the
+single invocation, and that they leave nothing under fanout/ in the store,
+and exits with status 1 otherwise.
+
+Usage: python scripts/check_fanout.py [--deadline-ms 50]
+"""
+
+import argparse
+import io
+import os
+import sys
+from contextlib import redirect_stdout
+
+ROOT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, os.path.join(ROOT_DIR, 'files'))
+sys.path.insert(0, os.path.join(ROOT_DIR, 'benchmarks'))
+
+# First, for the environment of the offline run
+import offline  # noqa: E402
+import fanout  # noqa: E402
+import index  # noqa: E402
+import invoker  # noqa: E402
+
+
+def run(shard_by=None, deadline_ms=None):
+    """
+    Run the handler against fresh synthetic accounts.
+
+    :param shard_by: One of fanout.SHARD_KINDS, None to run in a single invocation.
+    :param deadline_ms: Time of each worker before its deadline reserve, None for no deadline.
+    :return: Tuple of (list of the collectors reported, number of invocations, list of the files left under fanout/).
+    """
+    _, directory = offline.reset('check-fanout')
+    new_context = (lambda: offline.DeadlineContext(deadline_ms)) if deadline_ms is not None else None
+    local = invoker.LocalInvoker(index.lambda_handler, new_context)
+    invoker.set_invoker(local)
+    os.environ['SHARD_BY'] = shard_by or ''
+
+    reports = offline.capture_reports()
+    with redirect_stdout(io.StringIO()):
+        index.lambda_handler(offline.EVENT, None)
+        invocations = 1 + local.drain()
+    left = [os.path.join(path, name) for path, _, names in os.walk(os.path.join(directory, fanout.FANOUT_PREFIX))
+            for name in names]
+    return reports, invocations, left
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--deadline-ms', type=float, help='Time of each worker before its deadline reserve')
+    args = parser.parse_args()
+
+    reports, _, _ = run()
+    expected = offline.outcomes(reports)
+    expected_tasks = len(reports[0].extras['tasks'])
+    print(f'single invocation: {len(expected)} records')
+
+    failed = False
+    for shard_by in fanout.SHARD_KINDS:
+        reports, invocations, left = run(shard_by, args.deadline_ms)
+        if len(reports) != 1:
+            print(f'[ERROR]: Sharded by {shard_by}: {len(reports)} reports sent')
+            failed = True
+            continue
+        report = reports[0]
+        problems = []
+        if offline.outcomes([report]) != expected:
+            problems.append(f'{len(set(offline.outcomes([report])) ^ set(expected))} records differ')
+        if len(report.extras['tasks']) != expected_tasks:
+            problems.append(f"{len(report.extras['tasks'])} tasks reported instead of {expected_tasks}")
+        if report.extras.get('missing_shards') or report.extras.get('not_run_tasks'):
+            problems.append(f"{report.extras['missing_shards']} incomplete shards, "
+                            f"{report.extras['not_run_tasks']} tasks not run")
+        if left:
+            problems.append(f'{len(left)} files left under {fanout.FANOUT_PREFIX}/')
+        for problem in problems:
+            print(f'[ERROR]: Sharded by {shard_by}: {problem}')
+        failed = failed or bool(problems)
+        print(f'sharded by {shard_by}: {invocations} invocations, {len(offline.outcomes([report]))} records')
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
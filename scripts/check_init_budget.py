@@ -0,0 +1,71 @@
+"""
+Report the import time of the Lambda handler and check it against a budget.
+
+Imports files/index.py in a fresh interpreter with `python -X importtime`,
+prints the slowest modules, and exits with status 1 when:
+- importing the handler takes longer than the budget, or
+- a cleaner module is imported at init (they must be loaded lazily).
+
+Usage: python scripts/check_init_budget.py [--budget-ms 600] [--top 15]
+"""
+
+import argparse
+import os
+import subprocess
+import sys
+
+
+FILES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'files')
+
+# Environment the handler expects at runtime, none of it is read at import
+HANDLER_ENV = {
+    'AWS_DEFAULT_REGION': 'us-east-1',
+    'DRY_RUN': 'true',
+}
+
+
+def measure_imports():
+    """
+    Import the handler in a fresh interpreter.
+
+    :return: List of (module, self time in us, cumulative time in us), in import order.
+    """
+    env = dict(os.environ, **HANDLER_ENV)
+    completed = subprocess.run([sys.executable, '-X', 'importtime', '-c', 'import index'],
+                               cwd=FILES_DIR, env=env, capture_output=True, text=True, check=True)
+    imports = []
+    for line in completed.stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, cumulative_us, module = line[len('import time:'):].split('|')
+        imports.append((module.strip(), int(self_us), int(cumulative_us)))
+    return imports
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--budget-ms', type=float, default=600, help='Maximum import time of the handler')
+    parser.add_argument('--top', type=int, default=15, help='Number of slowest modules to report')
+    args = parser.parse_args()
+
+    imports = measure_imports()
+    total_ms = next(cumulative for module, _, cumulative in imports if module == 'index') / 1000
+
+    print(f'{"module":<50} {"self (ms)":>10} {"cumulative (ms)":>16}')
+    for module, self_us, cumulative_us in sorted(imports, key=lambda i: i[2], reverse=True)[:args.top]:
+        print(f'{module:<50} {self_us / 1000:>10.1f} {cumulative_us / 1000:>16.1f}')
+    print(f'\nHandler import: {total_ms:.1f}ms (budget: {args.budget_ms:.0f}ms)')
+
+    failed = False
+    if total_ms > args.budget_ms:
+        print('[ERROR]: Handler import is over budget')
+        failed = True
+    eager_cleaners = [module for module, _, _ in imports if module.startswith('cleaners.')]
+    if eager_cleaners:
+        print(f'[ERROR]: Cleaners imported at init: {eager_cleaners}')
+        failed = True
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
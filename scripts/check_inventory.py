@@ -0,0 +1,105 @@
+"""
+Check that the inventory snapshot (see files/inventory_snapshot.py) skips unchanged instances, offline.
+
+Runs lambda_handler twice in dry run against the same synthetic accounts (see
+benchmarks/offline.py), a third of their instances being unknown to AWS Config,
+and changes the tags of one of those between the runs. Checks that the second
+run reports that instance as the only changed and nothing as new, and that it
+asks AWS Config about that instance only: the other unknown instances are
+skipped as unchanged, and the creation times of the known ones are cached.
+Exits with status 1 otherwise.
+
+Usage: python scripts/check_inventory.py
+"""
+
+import ast
+import io
+import os
+import sys
+from contextlib import redirect_stdout
+
+ROOT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, os.path.join(ROOT_DIR, 'files'))
+sys.path.insert(0, os.path.join(ROOT_DIR, 'benchmarks'))
+
+# First, for the environment of the offline run
+import offline  # noqa: E402
+import index  # noqa: E402
+import inventory_snapshot  # noqa: E402
+
+
+def run(requested):
+    """
+    Run the handler in dry run.
+
+    :param requested: List the IDs AWS Config is asked about are appended to.
+    :return: Tuple of (dict of inventory key to its diff counts, number of instances skipped as unchanged).
+    """
+    del requested[:]
+    output = io.StringIO()
+    with redirect_stdout(output):
+        index.lambda_handler(offline.EVENT, None)
+
+    counts = {}
+    skipped = 0
+    for line in output.getvalue().splitlines():
+        if line.startswith('[INFO]: Inventory '):
+            key, _, diff = line[len('[INFO]: Inventory '):].partition(': ')
+            counts[key] = ast.literal_eval(diff)
+        elif line.startswith('[INFO]: Skipping ') and 'unknown to AWS Config' in line:
+            skipped += int(line.split()[2])
+    return counts, skipped
+
+
+def main():
+    os.environ['DRY_RUN'] = 'true'
+    backend, _ = offline.reset('check-inventory')
+    offline.capture_reports()
+    for data in backend.data.values():
+        data.config_unknown.update(list(data.instances)[::3])
+
+    requested = []
+    answer = backend.config_batchgetresourceconfig
+
+    def config_batchgetresourceconfig(data, params):
+        requested.extend(key['resourceId'] for key in params['resourceKeys'])
+        return answer(data, params)
+
+    backend.config_batchgetresourceconfig = config_batchgetresourceconfig
+
+    problems = []
+    counts, _ = run(requested)
+    unknown = [instance_id for data in backend.data.values() for instance_id in requested
+               if instance_id in data.config_unknown]
+    instances = sum(len(data.instances) for data in backend.data.values())
+    new = sum(diff[inventory_snapshot.NEW] for diff in counts.values())
+    if new != instances:
+        problems.append(f'the first run reports {new} new instances instead of {instances}')
+    if not unknown:
+        problems.append('the first run asked AWS Config about no unknown instance')
+        unknown = [None]
+    print(f'first run: {len(set(requested))} instances asked to AWS Config, {len(unknown)} unknown to it')
+
+    changed = unknown[0]
+    for data in backend.data.values():
+        if changed in data.instances:
+            data.instances[changed]['Tags'] = data.instances[changed]['Tags'] + [{'Key': 'Owner', 'Value': 'check'}]
+
+    counts, skipped = run(requested)
+    total = {status: sum(diff[status] for diff in counts.values())
+             for status in [inventory_snapshot.NEW, inventory_snapshot.CHANGED, 'removed']}
+    if total[inventory_snapshot.CHANGED] != 1 or total[inventory_snapshot.NEW] or total['removed']:
+        problems.append(f'the second run reports {total}, instead of the one changed instance')
+    if sorted(set(requested)) != [changed]:
+        problems.append(f'the second run asked AWS Config about {len(set(requested))} instances, '
+                        f'instead of the changed one only')
+    if skipped != len(unknown) - 1:
+        problems.append(f'the second run skipped {skipped} unknown instances instead of {len(unknown) - 1}')
+    for problem in problems:
+        print(f'[ERROR]: {problem}')
+    print(f'second run: {len(set(requested))} instances asked to AWS Config, {skipped} skipped as unchanged')
+    return 1 if problems else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,82 @@
+"""
+Check that applying a dry-run plan (see files/plan.py) reports the same as a direct run, offline.
+
+Runs lambda_handler once without dry run, then in dry run followed by an
+'apply' invocation of the plan it saved, each against the same synthetic
+accounts (see benchmarks/offline.py) on a local store. The dry run is done in
+a single invocation, then sharded by region, its workers run in-process by a
+LocalInvoker each writing a part of the plan. Checks that the dry run reports
+every resource it plans as skipped, and that the apply run reports the same
+records as the direct run, notified resources included, and exits with status 1
+otherwise.
+
+Usage: python scripts/check_plan_apply.py
+"""
+
+import io
+import os
+import sys
+from contextlib import redirect_stdout
+
+ROOT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, os.path.join(ROOT_DIR, 'files'))
+sys.path.insert(0, os.path.join(ROOT_DIR, 'benchmarks'))
+
+# First, for the environment of the offline run
+import offline  # noqa: E402
+import index  # noqa: E402
+import invoker  # noqa: E402
+import plan  # noqa: E402
+import results  # noqa: E402
+import store  # noqa: E402
+
+
+def run(event, dry_run, shard_by=None):
+    """
+    Run the handler, then the invocations it starts.
+
+    :param event: Event of the invocation.
+    :param dry_run: Value of DRY_RUN.
+    :param shard_by: Value of SHARD_BY, None to run in a single invocation.
+    :return: ResultCollector reported by the run.
+    """
+    os.environ['DRY_RUN'] = 'true' if dry_run else 'false'
+    os.environ['SHARD_BY'] = shard_by or ''
+    local = invoker.LocalInvoker(index.lambda_handler)
+    invoker.set_invoker(local)
+    reports = offline.capture_reports()
+    with redirect_stdout(io.StringIO()):
+        index.lambda_handler(event, None)
+        local.drain()
+    return reports[0]
+
+
+def main():
+    offline.reset('check-plan-apply')
+    expected = offline.outcomes([run(offline.EVENT, dry_run=False)])
+    print(f'direct run: {len(expected)} records')
+
+    problems = []
+    for shard_by in [None, 'region']:
+        name = f'sharded by {shard_by}' if shard_by else 'single invocation'
+        offline.reset('check-plan-apply')
+        dry = run(offline.EVENT, dry_run=True, shard_by=shard_by)
+        key = dry.extras['plan']
+        actions = list(plan.load_plan(key))
+        planned = [action for action in actions if action.outcome is None]
+        applied = offline.outcomes([run(dict(offline.EVENT, apply=key), dry_run=True)])
+        print(f'dry run {name}: {len(store.get_store().list_keys(key + "/"))} plan parts, {len(actions)} lines, '
+              f'{len(actions) - len(planned)} notified; apply run: {len(applied)} records')
+
+        skipped = sum(1 for _ in dry.records(results.SKIPPED))
+        if skipped != len(planned):
+            problems.append(f'{name}: the dry run reports {skipped} skipped resources for {len(planned)} planned actions')
+        if applied != expected:
+            problems.append(f'{name}: {len(set(applied) ^ set(expected))} records differ between the apply and direct runs')
+    for problem in problems:
+        print(f'[ERROR]: {problem}')
+    return 1 if problems else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
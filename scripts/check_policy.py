@@ -0,0 +1,222 @@
+"""
+Check that the cleanup policy (see files/policy.py) and the keep tags skip what the cleaners used to, offline.
+
+Runs lambda_handler with the bundled policy against synthetic accounts (see
+benchmarks/offline.py) holding spot instances, instances named IGNORE, and
+instances and volumes carrying a spotinst tag or the keep tag, and checks that
+the instances stopped, the instances tagged with CreatedOn and the volumes
+deleted are exactly the ones the skip rules of the cleaners left to clean
+before they moved to the policy:
+- ec2-stop: running instances, except spot instances, instances named IGNORE and kept ones;
+- ec2-tag: instances without CreatedOn, except spot instances;
+- ebs: available volumes, except kept ones;
+spotinst tags skipping every service, as the ignore variable they replace.
+
+Then checks that keep_index.index_keys maps the ARN of each kind of resource
+to the ID the cleaners look it up with, and that batching.run_batched bisects
+a chunk failing on one of its IDs down to that ID, without splitting a chunk
+failing as a whole. Exits with status 1 otherwise.
+
+Usage: python scripts/check_policy.py
+"""
+
+import io
+import json
+import math
+import os
+import sys
+import threading
+from contextlib import redirect_stdout
+
+ROOT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, os.path.join(ROOT_DIR, 'files'))
+sys.path.insert(0, os.path.join(ROOT_DIR, 'benchmarks'))
+
+# First, for the environment of the offline run
+import offline  # noqa: E402
+from botocore.exceptions import ClientError  # noqa: E402
+
+import batching  # noqa: E402
+import index  # noqa: E402
+import keep_index  # noqa: E402
+
+
+KEEP_TAG = {'auto-deletion': 'skip-resource'}
+DONE = {'stop': 'stopped', 'tag': 'tagged', 'delete': 'deleted'}
+ARN_PREFIX = 'arn:aws:{service}:us-east-1:100000000000:'
+
+
+def mark(data):
+    """
+    Make one running instance of each kind the skip rules are about, and one volume of each kept kind.
+
+    :param data: FakeRegion.
+    :return: Dict of rule name to the ID of the resource made for it.
+    """
+    running = [instance for instance in data.instances.values()
+               if instance['State']['Name'] == 'running' and 'InstanceLifecycle' not in instance
+               and data.arn('ec2', f"instance/{instance['InstanceId']}") not in data.tags]
+    available = [volume for volume in data.volumes.values()
+                 if volume['State'] == 'available' and data.arn('ec2', f"volume/{volume['VolumeId']}") not in data.tags]
+    marked = {}
+    spot, ignored, spotinst, kept = running[:4]
+    spot['InstanceLifecycle'] = 'spot'
+    ignored['Tags'] = [{'Key': 'Name', 'Value': 'IGNORE'}]
+    for name, instance, tags in [('spotinst instance', spotinst, {'spotinst': 'elastigroup'}),
+                                 ('kept instance', kept, KEEP_TAG)]:
+        instance['Tags'] = instance['Tags'] + [{'Key': key, 'Value': value} for key, value in tags.items()]
+        data.tags[data.arn('ec2', f"instance/{instance['InstanceId']}")] = tags
+        marked[name] = instance['InstanceId']
+    for name, volume, tags in [('spotinst volume', available[0], {'spotinst': 'elastigroup'}),
+                               ('kept volume', available[1], KEEP_TAG)]:
+        volume['Tags'] = [{'Key': key, 'Value': value} for key, value in tags.items()]
+        data.tags[data.arn('ec2', f"volume/{volume['VolumeId']}")] = tags
+        marked[name] = volume['VolumeId']
+    marked.update({'spot instance': spot['InstanceId'], 'IGNORE instance': ignored['InstanceId']})
+    return marked
+
+
+def expected_cleanup(data):
+    """
+    Select the resources of a region the way the cleaners did before the policy.
+
+    :param data: FakeRegion, before the run.
+    :return: Dict of 'stop', 'tag' and 'delete' to the set of the IDs to stop, tag and delete.
+    """
+    def tags(resource):
+        return {tag['Key']: tag['Value'] for tag in resource['Tags']}
+
+    def kept(arn):
+        return all(data.tags.get(arn, {}).get(key) == value for key, value in KEEP_TAG.items())
+
+    instances = [instance for instance in data.instances.values() if 'spotinst' not in tags(instance)
+                 and instance.get('InstanceLifecycle') != 'spot']
+    return {
+        'stop': {instance['InstanceId'] for instance in instances if instance['State']['Name'] == 'running'
+                 and 'IGNORE' not in (tags(instance).get('Name'), instance['InstanceId'])
+                 and not kept(data.arn('ec2', f"instance/{instance['InstanceId']}"))},
+        'tag': {instance['InstanceId'] for instance in instances if 'CreatedOn' not in tags(instance)},
+        'delete': {volume['VolumeId'] for volume in data.volumes.values() if volume['State'] == 'available'
+                   and 'spotinst' not in tags(volume) and not kept(data.arn('ec2', f"volume/{volume['VolumeId']}"))},
+    }
+
+
+def check_policy():
+    """
+    Run the EC2 and EBS cleaners against synthetic accounts with resources of each skip rule.
+
+    :return: List of the problems found.
+    """
+    os.environ.update({'ENABLED_SERVICES': 'ec2-stop,ec2-tag,ebs', 'KEEP_TAGS': json.dumps(KEEP_TAG)})
+    backend, _ = offline.reset('check-policy')
+    offline.capture_reports()
+    marked = {}
+    expected = {}
+    running = {}
+    volumes = {}
+    for key, data in backend.data.items():
+        # The first region holds the most resources
+        marked[key] = mark(data) if key[1] == offline.REGIONS[0] else {}
+        expected[key] = expected_cleanup(data)
+        running[key] = {instance_id for instance_id, instance in data.instances.items()
+                        if instance['State']['Name'] == 'running'}
+        volumes[key] = set(data.volumes)
+
+    with redirect_stdout(io.StringIO()):
+        index.lambda_handler(offline.EVENT, None)
+
+    problems = []
+    for key, data in backend.data.items():
+        def tags(instance):
+            return {tag['Key'] for tag in instance['Tags']}
+
+        actual = {
+            'stop': {instance_id for instance_id in running[key]
+                     if data.instances[instance_id]['State']['Name'] != 'running'},
+            'tag': {instance_id for instance_id, instance in data.instances.items() if 'CreatedOn' in tags(instance)},
+            'delete': volumes[key] - set(data.volumes),
+        }
+        for action in ['stop', 'tag', 'delete']:
+            for resource_id in sorted(actual[action] ^ expected[key][action]):
+                rule = next((name for name, marked_id in marked[key].items() if marked_id == resource_id), 'no rule')
+                problems.append(f"{'/'.join(key)}: {resource_id} ({rule}) "
+                                f"{'was' if resource_id in actual[action] else 'was not'} {DONE[action]}")
+    print(f'policy: {sum(len(ids) for ids in marked.values())} marked resources, '
+          f'{sum(len(expected[key]["stop"]) for key in expected)} instances to stop')
+    return problems
+
+
+# Service and resource of the ARN of each kind of resource, and the ID the cleaners look it up with
+# (see cleaners/*.py), None when they use the ARN
+KEEP_INDEX_CASES = [
+    ('ec2', 'instance/i-0123', 'i-0123'),
+    ('ec2', 'volume/vol-0123', 'vol-0123'),
+    ('ec2', 'elastic-ip/eipalloc-0123', 'eipalloc-0123'),
+    ('elasticloadbalancing', 'loadbalancer/my-lb', 'my-lb'),
+    ('elasticloadbalancing', 'loadbalancer/app/my-alb/50dc6c495c0c9188', None),
+    ('rds', 'db:my-db', None),
+    ('rds', 'cluster:my-cluster', None),
+    ('eks', 'cluster/my-cluster', 'my-cluster'),
+    ('eks', 'nodegroup/my-cluster/my-nodegroup/0ac2e5f8', None),
+    ('kinesis', 'stream/my-stream', 'my-stream'),
+    ('es', 'domain/my-domain', 'my-domain'),
+    ('kafka', 'cluster/my-msk/8a1c1c6f-0d5b-4c6f-9c1b-1f0c2a3b4c5d-2', None),
+]
+
+
+def check_keep_index():
+    """
+    :return: List of the problems found in the keys of the keep index.
+    """
+    problems = []
+    for service, resource, resource_id in KEEP_INDEX_CASES:
+        arn = ARN_PREFIX.format(service=service) + resource
+        keys = set(keep_index.index_keys(arn))
+        if arn not in keys:
+            problems.append(f'keep index: {arn} is not found by its ARN')
+        if resource_id is not None and (service, resource_id) not in keys:
+            problems.append(f'keep index: {arn} is not found by {service} ID {resource_id}')
+    # A classic load balancer named like an application load balancer isn't kept by the latter's tag
+    alb = ARN_PREFIX.format(service='elasticloadbalancing') + 'loadbalancer/app/my-alb/50dc6c495c0c9188'
+    if ('elasticloadbalancing', 'my-alb') in keep_index.index_keys(alb):
+        problems.append('keep index: an application load balancer is found by the name of a classic one')
+    return problems
+
+
+def check_bisection():
+    """
+    :return: List of the problems found in the bisection of failing chunks.
+    """
+    problems = []
+    ids = [f'i-{n:017x}' for n in range(100)]
+    bad = ids[37]
+    for code, expected_calls, failed in [('InvalidInstanceID.NotFound', 1 + 2 * math.ceil(math.log2(len(ids))), [bad]),
+                                         ('AccessDenied', 1, ids)]:
+        calls = []
+        lock = threading.Lock()
+
+        def call(chunk):
+            with lock:
+                calls.append(len(chunk))
+            if bad in chunk:
+                raise ClientError({'Error': {'Code': code, 'Message': 'check'}}, 'StopInstances')
+
+        results = batching.run_batched(call, ids, batching.STOP_INSTANCES_CHUNK_SIZE)
+        errors = sorted(resource_id for resource_id, error in results.items() if error is not None)
+        if errors != failed or len(results) != len(ids):
+            problems.append(f'bisection on {code}: {len(errors)} IDs failed instead of {len(failed)}')
+        if len(calls) > expected_calls:
+            problems.append(f'bisection on {code}: {len(calls)} calls instead of at most {expected_calls}')
+        print(f'bisection on {code}: {len(calls)} calls, {len(errors)} IDs failed')
+    return problems
+
+
+def main():
+    problems = check_policy() + check_keep_index() + check_bisection()
+    for problem in problems:
+        print(f'[ERROR]: {problem}')
+    return 1 if problems else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
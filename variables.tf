@@ -38,9 +38,33 @@ variable "function_timeout" {
   default     = 60
 }
 
+variable "max_workers" {
+  type        = number
+  description = "Maximum number of (service, region) cleanup tasks running at the same time"
+  default     = 10
+}
+
+variable "max_workers_per_service" {
+  type        = number
+  description = "Maximum number of cleanup tasks of the same service running at the same time"
+  default     = 5
+}
+
+variable "account_role_arns" {
+  type        = list(string)
+  description = "ARNs of the IAM Roles to assume to clean member accounts. When empty, only the Lambda's own account is cleaned"
+  default     = []
+}
+
+variable "max_workers_per_account" {
+  type        = number
+  description = "Maximum number of cleanup tasks of the same account running at the same time"
+  default     = 10
+}
+
 variable "dry_run" {
   type        = bool
-  description = "Whether to run the Lambda in dry-run mode"
+  description = "Whether to run the Lambda in dry-run mode: resources are scanned and the actions saved as a plan, nothing is changed"
   default     = true
 }
 
@@ -50,20 +74,87 @@ variable "check_all_regions" {
   default     = false
 }
 
+variable "prune_empty_regions" {
+  type        = bool
+  description = "Whether to skip the regions without tagged resources to clean, found with the Resource Groups Tagging API. Only enable it when every resource is tagged, untagged resources are invisible to that API"
+  default     = false
+}
+
+variable "enabled_services" {
+  type        = list(string)
+  description = "Cleanup services to run (ec2-tag, ec2-unmonitor, ec2-stop, eip, ebs, elb, elbv2, rds, eks, kinesis, msk, opensearch). When empty, all of them run"
+  default     = []
+}
+
+variable "scan_backend" {
+  type        = string
+  description = "Backend fetching the inventory: threads, or async to prefetch every listing on one event loop (needs aiobotocore, e.g. from a layer)"
+  default     = "threads"
+
+  validation {
+    condition     = contains(["threads", "async"], var.scan_backend)
+    error_message = "scan_backend must be threads or async."
+  }
+}
+
+variable "completion_wait_seconds" {
+  type        = number
+  description = "Maximum time to wait for long-running changes (deletions, stops, scale-ins) to complete before reporting them as pending, within the function timeout"
+  default     = 300
+}
+
+variable "report_format" {
+  type        = string
+  description = "Format of the full detail of the email report, gzipped: csv or jsonl"
+  default     = "csv"
+
+  validation {
+    condition     = contains(["csv", "jsonl"], var.report_format)
+    error_message = "report_format must be csv or jsonl."
+  }
+}
+
+variable "shard_by" {
+  type        = string
+  description = "Split each run over one asynchronous invocation per region, service or account, reporting once all are done. Needs state_bucket. Empty to run in one invocation"
+  default     = ""
+
+  validation {
+    condition     = contains(["", "region", "service", "account"], var.shard_by)
+    error_message = "shard_by must be empty, region, service or account."
+  }
+}
+
+variable "layers" {
+  type        = list(string)
+  description = "ARNs of Lambda layers to attach to the function, e.g. one providing aiobotocore for the async scan backend"
+  default     = []
+}
+
 variable "keep_tag_key" {
   type        = map(string)
-  description = "Key of the tag to configure as resoruces to keep"
+  description = "Tags (key = value) marking resources to keep, \"*\" matching any value of the key"
   default = {
       "auto-deletion" = "skip-resource"
   }
 }
 
-variable "ignore" {
-  type        = map(string)
-  description = "Key of the tag to configure as resoruces to skip"
-  default = {
-    spotinst = "*",
-  }
+variable "cleanup_policy" {
+  type        = any
+  description = "Cleanup policy rules (see files/policy.py) replacing the bundled files/policy.json. When null, the bundled policy is used"
+  default     = null
+}
+
+variable "self_reinvoke" {
+  type        = bool
+  description = "Whether the Lambda invokes itself to resume a cleanup that didn't finish before the timeout"
+  default     = false
+}
+
+variable "state_bucket" {
+  type        = string
+  description = "S3 bucket where state kept between runs (caches, checkpoints) is stored. When empty, the Lambda's /tmp is used"
+  default     = ""
 }
 
 variable "event_cron" {